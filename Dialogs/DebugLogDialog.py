@@ -1,31 +1,103 @@
-from PySide6.QtCore import QThread, QMetaObject, Q_ARG, Qt
-from PySide6.QtGui import QIcon
+import threading
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt, QTimer, Signal
+from PySide6.QtGui import QIcon, QKeySequence, QShortcut
 from PySide6.QtWidgets import (QVBoxLayout, QHBoxLayout,
-                               QPushButton, QDialog,
-                               QTextEdit, QFileDialog, QMessageBox, QApplication)
+                               QPushButton, QDialog, QListView, QAbstractItemView,
+                               QFileDialog, QMessageBox, QApplication)
+
+from LogBuffer import LogBuffer
+
+FLUSH_INTERVAL = 100  # 毫秒
+
+
+class LogModel(QAbstractListModel):
+    """日志列表模型: 按批次从LogBuffer取出新记录, 最多保留capacity行"""
+
+    def __init__(self, buffer: LogBuffer, parent=None):
+        super().__init__(parent)
+        self.buffer = buffer
+        self.capacity = buffer.capacity
+        self._rows = []
+        self.start_seq = buffer.oldest()  # 上次清空时的序号, 之前的记录不再显示也不保存
+        self._next_seq = self.start_seq
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._rows[index.row()].message
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self._rows[index.row()].format()
+        return None
+
+    def record(self, row: int):
+        return self._rows[row]
+
+    def fetch_new(self) -> int:
+        """取出上次之后的新记录, 一批只插入一次, 返回新增行数"""
+        records = self.buffer.read(self._next_seq)
+        if not records:
+            return 0
+        self._next_seq = records[-1].seq + 1
+        records = records[-self.capacity:]
+
+        # 超出容量1/4后成批删除最早的行, 摊销后每行的代价不变
+        overflow = len(self._rows) + len(records) - self.capacity
+        if overflow > self.capacity // 4:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            del self._rows[:overflow]
+            self.endRemoveRows()
+
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(records) - 1)
+        self._rows.extend(records)
+        self.endInsertRows()
+        return len(records)
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self.start_seq = self._next_seq = self.buffer.head
+        self.endResetModel()
 
 
 class DebugLogDialog(QDialog):
-    """Debug日志对话框"""
+    """Debug日志对话框: 只渲染可见行, 日志量再大界面开销也不变"""
+
+    save_finished = Signal(str)  # 错误信息, 成功时为空
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, buffer: LogBuffer = None):
         super().__init__(parent)
         self.setWindowTitle("调试日志")
         self.setWindowIcon(QIcon(":/icons/debug.png"))
         self.setGeometry(400, 400, 800, 600)
+        self.buffer = buffer if buffer is not None else LogBuffer()
 
         layout = QVBoxLayout()
 
-        self.log_output = QTextEdit()
-        self.log_output.setReadOnly(True)
+        self.model = LogModel(self.buffer, self)
+        self.log_output = QListView()
+        self.log_output.setModel(self.model)
+        self.log_output.setUniformItemSizes(True)
+        self.log_output.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         self.log_output.setStyleSheet("""
-            font-family: monospace; 
-            font-size: 10pt; 
-            background-color: #2c2c2c; 
+            font-family: monospace;
+            font-size: 10pt;
+            background-color: #2c2c2c;
             color: #e0e0e0;
             border-radius: 5px;
             padding: 5px;
         """)
+        QShortcut(QKeySequence.StandardKey.Copy, self.log_output, self.copy_selection)
+
+        # 对话框可见时定时批量刷新
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(FLUSH_INTERVAL)
+        self.flush_timer.timeout.connect(self.flush)
 
         # 添加按钮
         btn_layout = QHBoxLayout()
@@ -37,8 +109,8 @@ class DebugLogDialog(QDialog):
         self.save_btn.clicked.connect(self.save_log)
         self.close_btn = QPushButton("关闭")
         self.close_btn.setStyleSheet("""
-            background-color: #f44336; 
-            color: white; 
+            background-color: #f44336;
+            color: white;
             padding: 6px;
             border-radius: 5px;
         """)
@@ -53,29 +125,59 @@ class DebugLogDialog(QDialog):
         layout.addLayout(btn_layout)
 
         self.setLayout(layout)
+        self.save_finished.connect(self._on_save_finished)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.flush()
+        self.flush_timer.start()
+
+    def hideEvent(self, event):
+        self.flush_timer.stop()
+        super().hideEvent(event)
 
     def append_log(self, message):
-        """安全添加日志 - 修复版本"""
-        # 确保在主线程执行
-        if not QThread.currentThread() is QApplication.instance().thread():
-            QMetaObject.invokeMethod(self, b"append_log", Qt.ConnectionType.QueuedConnection,
-                                     Q_ARG("QString", message))
-            return
+        """添加日志, 可在任意线程调用"""
+        self.buffer.append(message)
+
+    def flush(self):
+        """把缓冲中的新日志追加到列表, 原本停在底部时保持滚动到底部"""
+        scrollbar = self.log_output.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 2
+        if self.model.fetch_new() and at_bottom:
+            self.log_output.scrollToBottom()
 
-        # 使用文本追加而不是操作光标
-        self.log_output.append(message)
+    def copy_selection(self):
+        rows = sorted(index.row() for index in self.log_output.selectionModel().selectedRows())
+        QApplication.clipboard().setText("\n".join(self.model.record(row).message for row in rows))
 
     def clear_log(self):
         """清空日志"""
-        self.log_output.clear()
+        self.model.clear()
 
     def save_log(self):
-        """保存日志到文件"""
+        """保存日志到文件, 在后台线程写入"""
         file_path, _ = QFileDialog.getSaveFileName(self, "保存日志", "", "文本文件 (*.txt);;所有文件 (*)")
-        if file_path:
+        if not file_path:
+            return
+        # 从上次清空的位置开始保存, 包括已显示和尚未刷新到列表的记录
+        records = self.buffer.read(self.model.start_seq)
+        self.save_btn.setEnabled(False)
+
+        def write():
             try:
                 with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(self.log_output.toPlainText())
-                QMessageBox.information(self, "成功", "日志已保存成功!")
+                    for record in records:
+                        f.write(record.format() + "\n")
+                self.save_finished.emit("")
             except Exception as e:
-                QMessageBox.critical(self, "错误", f"保存日志失败: {str(e)}")
\ No newline at end of file
+                self.save_finished.emit(str(e))
+
+        threading.Thread(target=write, daemon=True).start()
+
+    def _on_save_finished(self, error):
+        self.save_btn.setEnabled(True)
+        if error:
+            QMessageBox.critical(self, "错误", f"保存日志失败: {error}")
+        else:
+            QMessageBox.information(self, "成功", "日志已保存成功!")
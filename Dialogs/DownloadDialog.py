@@ -3,14 +3,14 @@ import platform
 import tarfile
 import zipfile
 
-from PySide6.QtCore import QTimer
+from PySide6.QtCore import QTimer, QSettings
 from PySide6.QtGui import QIcon
 from PySide6.QtWidgets import (QVBoxLayout, QHBoxLayout,
                                QLabel, QPushButton, QProgressBar,
                                QDialog,
                                QTextEdit)
 
-from FileDownloader import ToolDownloader
+from FileDownloader import ToolDownloader, MirrorSelector
 from Tool import Tool
 
 
@@ -19,7 +19,9 @@ class DownloadDialog(QDialog):
 
     def __init__(self, tools: list[Tool], parent=None):
         super().__init__(parent)
-        self._downloader = None
+        self._downloaders = {}  # tool.name -> ToolDownloader
+        self._retired_downloaders = []  # 结束的下载器在其信号回调中不能立即销毁
+        self._mirror_selector = MirrorSelector()
         self.setWindowTitle("依赖未安装")
         self.setWindowIcon(QIcon(":/icons/download.png"))
         self.setGeometry(300, 300, 500, 300)
@@ -27,7 +29,12 @@ class DownloadDialog(QDialog):
         self.downloading = False
         self.download_success = False
         self.tool_paths = {}
-        self.__downloading_tool = -1
+        self.results = {}  # tool.name -> 是否成功
+        self.__pending_tools = []
+        self.__running_tools = set()  # 已开始且尚未结束(包括切换镜像中)的工具
+        self.__max_concurrent = 1
+        self.__finished = False
+        self.__tool_progress = {}
         self.__downloaded_success = 0
 
         layout = QVBoxLayout()
@@ -102,13 +109,24 @@ class DownloadDialog(QDialog):
         self.download_tools()
 
     def download_tools(self):
-        """下载工具"""
+        """同时下载所有缺失的工具, 同时进行的数量不超过download_concurrency"""
         self.log("开始下载缺失的工具...")
+        self.results = {}
+        self._retired_downloaders = []
+        self.__pending_tools = list(self.tools)
+        self.__running_tools = set()
+        self.__finished = False
+        self.__tool_progress = {tool.name: 0 for tool in self.tools}
+        self.__downloaded_success = 0
+        self.progress_bar.setValue(0)
 
+        self.__max_concurrent = max(1, int(QSettings("PythonFlashTools", "FlashTool").value("download_concurrency", 3)))
         self.__download_next()
 
     def __download_complete(self):
         """工具全部下载完成(无论成功与否)"""
+        for tool in self.tools:
+            self.log(f"{tool.name}: {'下载成功' if self.results.get(tool.name) else '下载失败'}")
         if self.__downloaded_success == len(self.tools):
             self.log("所有工具下载完成!")
             self.download_success = True
@@ -121,19 +139,45 @@ class DownloadDialog(QDialog):
 
 
     def __download_next(self):
-        """下载下一个工具"""
-        self.__downloading_tool += 1
-        if self.__downloading_tool >= len(self.tools):
-            self.log("所有工具下载完成!")
+        """补足同时进行的下载, 队列为空且没有进行中的下载时结束
+
+        下载在事件循环中开始: download_tool同步失败时会再次调用这里, 不能在本次调用中直接开始
+        """
+        while self.__pending_tools and len(self.__running_tools) < self.__max_concurrent:
+            tool = self.__pending_tools.pop(0)
+            self.__running_tools.add(tool.name)
+            QTimer.singleShot(0, lambda tool=tool: self.download_tool(tool))
+        if not self.__pending_tools and not self.__running_tools and not self.__finished:
+            self.__finished = True
             self.__download_complete()
+
+    def __tool_finished(self, tool: Tool, success: bool):
+        """单个工具结束(所有镜像都已尝试或下载成功)"""
+        if tool.name not in self.__running_tools:
             return
-        self.download_tool(self.tools[self.__downloading_tool])
+        self.__running_tools.discard(tool.name)
+        self.results[tool.name] = success
+        self.__retire_downloader(tool.name)
+        self.__update_progress(tool.name, 100)
+        if success:
+            self.__downloaded_success += 1
+        self.__download_next()
+
+    def __retire_downloader(self, name: str):
+        downloader = self._downloaders.pop(name, None)
+        if downloader is not None:
+            self._retired_downloaders.append(downloader)
+
+    def __update_progress(self, name: str, percent: int):
+        """汇总所有工具的下载进度"""
+        self.__tool_progress[name] = percent
+        self.progress_bar.setValue(int(sum(self.__tool_progress.values()) / max(len(self.__tool_progress), 1)))
 
 
     def download_tool(self, tool: Tool, mirror: int = 0):
         """用指定镜像下载工具"""
         self.log(f"下载{tool.name}工具...")
-        self.progress_bar.setValue(0)
+        self.__update_progress(tool.name, 0)
 
         try:
             # 创建工具目录
@@ -142,15 +186,22 @@ class DownloadDialog(QDialog):
             self.log(f"尝试从 {tool.get_mirrors()[mirror]} 下载...")
 
             # 创建downloader
-            self._downloader = ToolDownloader(tool, mirror)
+            settings = QSettings("PythonFlashTools", "FlashTool")
+            downloader = ToolDownloader(tool, mirror,
+                                        int(settings.value("download_connections", 4)),
+                                        self._mirror_selector,
+                                        int(settings.value("download_min_speed_kb", 32)) * 1024)
+            self.__retire_downloader(tool.name)
+            self._downloaders[tool.name] = downloader
 
             # 绑定触发器
-            self._downloader.progress.connect(self.progress_bar.setValue)
-            self._downloader.finished.connect(self.__download_succeed)
-            self._downloader.error.connect(self.__download_failed)
-            self._downloader.start()
+            downloader.progress.connect(lambda percent, name=tool.name: self.__update_progress(name, percent))
+            downloader.message.connect(lambda message, name=tool.name: self.log(f"[{name}] {message}"))
+            downloader.finished.connect(self.__download_succeed)
+            downloader.error.connect(self.__download_failed)
+            downloader.start()
         except Exception as e:
-            self.log(f"下载{tool.name}失败: {str(e)}")
+            self.__download_failed(f"下载{tool.name}失败: {str(e)}", tool, mirror)
 
 
     def __download_succeed(self, tool: Tool, mirror: int):
@@ -158,13 +209,13 @@ class DownloadDialog(QDialog):
         self.log(f"{tool.name} 下载完成")
 
         # 解压失败,当作下载失败处理
-        if not self.__unzip_tool(tool):
+        downloader = self._downloaders.get(tool.name)
+        if not self.__unzip_tool(tool, extracted=downloader is not None and downloader.extracted):
             self.__download_failed("", tool, mirror)
             return
 
-        # 下载成功,下载下一个工具
-        self.__downloaded_success += 1
-        self.__download_next()
+        # 下载成功,开始队列中的下一个工具
+        self.__tool_finished(tool, True)
 
 
     def __download_failed(self, msg: str, tool: Tool, mirror: int):
@@ -174,16 +225,16 @@ class DownloadDialog(QDialog):
         # 使用下一个镜像下载
         mirror += 1
         if mirror >= len(tool.get_mirrors()):
-            # 所有镜像尝试完毕,工具下载失败,下载下一个工具
+            # 所有镜像尝试完毕,工具下载失败,开始队列中的下一个工具
             self.log(f"{tool.name} 所有镜像下载失败")
-            self.__download_next()
+            self.__tool_finished(tool, False)
             return
 
         # 尝试下一个镜像
         self.download_tool(tool, mirror)
 
 
-    def __unzip_tool(self, tool: Tool):
+    def __unzip_tool(self, tool: Tool, extracted: bool = False):
         zip_path = os.path.join(tool.get_path(), f"{tool.name}.PFTDownloading")
 
         # 解压文件
@@ -191,23 +242,11 @@ class DownloadDialog(QDialog):
             self.log(f"{tool.name} 下载完成但未找到压缩包，可能下载失败")
             return False
 
-        self.log("解压文件...")
-
-        try:
-            if zipfile.is_zipfile(zip_path):
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall(tool.get_path())
-            elif tarfile.is_tarfile(zip_path):
-                with tarfile.open(zip_path, 'r:*') as tar_ref:
-                    tar_ref.extractall(tool.get_path())
-            else:
-                self.log(f"{tool.name} 下载完成但压缩包格式不支持")
-                return False
-        except (zipfile.BadZipFile, tarfile.ReadError) as e:
-            self.log(f"{tool.name} 解压失败：{str(e)}")
+        if extracted:
+            self.log(f"{tool.name} 已在下载过程中解压")
+        elif not self.__extract_archive(tool, zip_path):
             return False
 
-
         # 删除ZIP文件
         os.remove(zip_path)
 
@@ -225,6 +264,26 @@ class DownloadDialog(QDialog):
 
 
 
+    def __extract_archive(self, tool: Tool, zip_path: str):
+        """下载完成后整体解压(未能边下载边解压时)"""
+        self.log(f"解压{tool.name}文件...")
+
+        try:
+            if zipfile.is_zipfile(zip_path):
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    zip_ref.extractall(tool.get_path())
+            elif tarfile.is_tarfile(zip_path):
+                with tarfile.open(zip_path, 'r:*') as tar_ref:
+                    tar_ref.extractall(tool.get_path())
+            else:
+                self.log(f"{tool.name} 下载完成但压缩包格式不支持")
+                return False
+        except (zipfile.BadZipFile, tarfile.ReadError) as e:
+            self.log(f"{tool.name} 解压失败：{str(e)}")
+            return False
+        return True
+
+
     def log(self, message):
         """记录日志"""
         QTimer.singleShot(0, lambda: self.log_output.append(message))
\ No newline at end of file
@@ -1,70 +1,510 @@
+import json
 import os
+import time
 
 from PySide6.QtCore import QFile, QIODevice
-from PySide6.QtCore import QUrl, QObject, Signal
-from PySide6.QtNetwork import QNetworkAccessManager, QNetworkRequest
+from PySide6.QtCore import QUrl, QObject, Signal, QSettings, QTimer
+from PySide6.QtNetwork import QNetworkAccessManager, QNetworkRequest, QNetworkReply
 
+from StreamingExtractor import (ZIP_EOCD_SEARCH, TarStreamExtractor, ZipStreamExtractor, detect_archive,
+                                locate_central_directory, parse_central_directory)
 from Tool import Tool
 
 
-class FileDownloader(QObject):
+class MirrorSelector:
+    """镜像选择: 结合本次探测速度与QSettings中记录的历史吞吐量, 按预计速度给镜像排序"""
+
+    HISTORY_ALPHA = 0.3  # 新样本在历史吞吐量中的权重
+
+    def __init__(self, settings: QSettings = None):
+        self.settings = settings or QSettings("PythonFlashTools", "FlashTool")
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return f"mirror_history/{QUrl(url).host() or url}"
+
+    def history(self, url: str) -> float | None:
+        """镜像的历史吞吐量(B/s)"""
+        value = self.settings.value(self._key(url))
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    def record(self, url: str, throughput: float):
+        """记录一次下载的吞吐量, 与历史值做指数平滑"""
+        previous = self.history(url)
+        if previous is not None:
+            throughput = previous * (1 - self.HISTORY_ALPHA) + throughput * self.HISTORY_ALPHA
+        self.settings.setValue(self._key(url), throughput)
+
+    def estimate(self, url: str, probe_speed: float = None) -> float:
+        """预计吞吐量: 有历史记录时以历史为主, 本次探测用于修正"""
+        history = self.history(url)
+        if history is None:
+            return probe_speed or 0.0
+        if probe_speed is None:
+            return history
+        return history * (1 - self.HISTORY_ALPHA) + probe_speed * self.HISTORY_ALPHA
+
+    def rank(self, urls: list[str], probe_speeds: dict = None) -> list[str]:
+        """按预计速度从快到慢排序, 速度相同时保持原顺序"""
+        probe_speeds = probe_speeds or {}
+        return sorted(urls, key=lambda url: -self.estimate(url, probe_speeds.get(url)))
+
+
+class SegmentedDownloader(QObject):
+    """多连接分段下载: 用HTTP Range把文件切成多段并发下载(可分布到多个镜像), 进度写入旁路日志, 中断后从日志续传"""
     progress = Signal(int)
     finished = Signal(str)
     error = Signal(str)
+    message = Signal(str)
+
+    JOURNAL_SUFFIX = ".journal"
+    MIN_SEGMENT_SIZE = 1024 * 1024
+    JOURNAL_INTERVAL = 0.5  # 日志最短写入间隔(秒)
+    PROBE_SIZE = 64 * 1024  # 探测时顺便下载的字节数, 用于估算吞吐量
+    PROBE_TIMEOUT = 10000
+    TRANSFER_TIMEOUT = 30000  # 连接无数据超时(毫秒)
+    STALL_GRACE = 5.0  # 连接建立后多久开始检查速度(秒)
+    STALL_CHECKS = 3  # 连续几次低于下限才切换镜像
 
-    def __init__(self, url: str, save_path: str):
+    def __init__(self, urls: list[str], save_path: str, connections: int = 4,
+                 selector: MirrorSelector = None, min_speed: int = 32 * 1024, extract_dir: str = None):
         super().__init__()
-        self.url = url
+        self.urls = list(urls)
+        self.extract_dir = extract_dir  # 压缩包边下载边解压到此目录
+        self.extractor = None
+        self.extracted = False
         self.save_path = save_path
+        self.journal_path = save_path + self.JOURNAL_SUFFIX
+        self.connections = max(1, connections)
+        self.selector = selector or MirrorSelector()
+        self.min_speed = min_speed  # 吞吐量下限(B/s), 持续低于下限时切换镜像
         self.manager = QNetworkAccessManager()
-        self.reply = None
         self.file = None
+        self.size = None
+        self.ranged = False
+        self.sources = []  # 支持Range且文件大小一致的镜像
+        self.segments = []  # [{"start", "end", "done", "attempts"}], end不含
+        self._probes = {}  # reply -> (url, 开始时间)
+        self._probe_results = {}  # url -> (size, 是否支持Range)
+        self._probe_speeds = {}  # url -> B/s
+        self._probe_heads = {}  # url -> 文件开头的数据, 用于识别压缩包类型
+        self._speeds = {}  # url -> 预计吞吐量
+        self._replies = {}  # reply -> segment
+        self._stats = {}  # reply -> {"start", "bytes", "last", "slow", "recorded"}
+        self._last_journal = 0.0
+        self._stopped = False
+        self._monitor = QTimer(self)
+        self._monitor.setInterval(1000)
+        self._monitor.timeout.connect(self._check_stalls)
+
+    # ---- 探测 ----
 
     def start(self):
-        request = QNetworkRequest(QUrl(self.url))
-        self.reply = self.manager.get(request)
-        self.reply.downloadProgress.connect(self.on_progress)
-        self.reply.finished.connect(self.on_finished)
-        self.reply.errorOccurred.connect(self.on_error)
+        """并发探测所有镜像的文件大小和Range支持"""
+        for url in self.urls:
+            request = QNetworkRequest(QUrl(url))
+            request.setRawHeader(b"Range", f"bytes=0-{self.PROBE_SIZE - 1}".encode())
+            request.setTransferTimeout(self.PROBE_TIMEOUT)
+            reply = self.manager.get(request)
+            self._probes[reply] = (url, time.perf_counter())
+            reply.metaDataChanged.connect(lambda reply=reply: self._on_probe_headers(reply))
+            reply.finished.connect(lambda reply=reply: self._on_probe_finished(reply))
+
+    def _on_probe_headers(self, reply):
+        if reply not in self._probes:
+            return
+        url = self._probes[reply][0]
+        if url in self._probe_results:
+            return
+        status = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        if status == 206:
+            content_range = str(reply.rawHeader("Content-Range"), "latin-1")
+            total = content_range.rpartition("/")[2]
+            self._probe_results[url] = (int(total), True) if total.isdigit() else (None, False)
+        elif status == 200:
+            # 服务器忽略Range, 只记录大小, 不下载整个文件
+            length = reply.header(QNetworkRequest.KnownHeaders.ContentLengthHeader)
+            self._probe_results[url] = (int(length) if length is not None else None, False)
+            reply.abort()
+
+    def _on_probe_finished(self, reply):
+        self._on_probe_headers(reply)
+        if reply in self._probes:
+            url, started = self._probes.pop(reply)
+            if url in self._probe_results:
+                head = reply.readAll().data() if reply.isOpen() else b""
+                self._probe_heads[url] = head
+                self._probe_speeds[url] = len(head) / max(time.perf_counter() - started, 1e-3)
+        reply.deleteLater()
+        if self._probes or self._stopped:
+            return
+
+        # 以第一个可用镜像的大小为准, 其余镜像大小一致时才参与分段下载
+        available = [url for url in self.urls if url in self._probe_results]
+        if not available:
+            self._fail("所有镜像均无法连接")
+            return
+        self.size = next((self._probe_results[url][0] for url in available if self._probe_results[url][1]), None)
+        self.sources = [url for url in available if self._probe_results[url] == (self.size, True)]
+        self.ranged = self.size is not None and bool(self.sources)
+        if not self.ranged:
+            self.sources = available
+            self.size = self._probe_results[available[0]][0]
+
+        # 最快的镜像排在前面
+        self.sources = self.selector.rank(self.sources, self._probe_speeds)
+        self._speeds = {url: self.selector.estimate(url, self._probe_speeds.get(url)) for url in self.sources}
+        self.message.emit("镜像速度排序: " + " > ".join(
+            f"{QUrl(url).host()}({self._speeds[url] / 1024:.0f}KB/s)" for url in self.sources))
+        self._prepare_extractor()
+
+    # ---- 边下载边解压 ----
+
+    def _prepare_extractor(self):
+        """识别压缩包类型; zip先用Range取回中央目录再开始下载"""
+        head = next((self._probe_heads[url] for url in self.sources if self._probe_heads.get(url)), b"")
+        kind = detect_archive(head) if self.extract_dir else None
+        if kind == "zip" and self.ranged:
+            tail_start = max(0, self.size - ZIP_EOCD_SEARCH)
+            self._request_range(tail_start, self.size, lambda data: self._on_zip_tail(tail_start, data))
+            return
+        if kind in ("gz", "bz2", "xz", "tar"):
+            self.extractor = TarStreamExtractor(self.extract_dir, self.save_path, kind)
+        self._begin()
+
+    def _request_range(self, start: int, end: int, callback):
+        request = QNetworkRequest(QUrl(self.sources[0]))
+        request.setRawHeader(b"Range", f"bytes={start}-{end - 1}".encode())
+        request.setTransferTimeout(self.PROBE_TIMEOUT)
+        reply = self.manager.get(request)
+        self._probes[reply] = (self.sources[0], time.perf_counter())
+
+        def on_finished():
+            self._probes.pop(reply, None)
+            reply.deleteLater()
+            if self._stopped:
+                return
+            ok = reply.error() == QNetworkReply.NetworkError.NoError and \
+                reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute) == 206
+            callback(reply.readAll().data() if ok else None)
+
+        reply.finished.connect(on_finished)
+
+    def _on_zip_tail(self, tail_start: int, data: bytes | None):
+        try:
+            if data is None:
+                raise ValueError("中央目录下载失败")
+            cd_offset, cd_size = locate_central_directory(data, tail_start)
+            if cd_offset >= tail_start:
+                self._on_zip_central_directory(cd_offset, data[cd_offset - tail_start:cd_offset - tail_start + cd_size])
+            else:
+                self._request_range(cd_offset, cd_offset + cd_size,
+                                    lambda cd: self._on_zip_central_directory(cd_offset, cd))
+        except ValueError as e:
+            self.message.emit(f"无法边下载边解压, 下载完成后再解压: {e}")
+            self._begin()
+
+    def _on_zip_central_directory(self, cd_offset: int, data: bytes | None):
+        if data is None:
+            self.message.emit("中央目录下载失败, 下载完成后再解压")
+        else:
+            entries = parse_central_directory(data)
+            self.extractor = ZipStreamExtractor(self.extract_dir, self.save_path, entries, cd_offset)
+        self._begin()
+
+    # ---- 分段 ----
+
+    def _begin(self):
+        resumed = self.ranged and self._load_journal()
+        if not resumed:
+            if os.path.exists(self.save_path):
+                os.remove(self.save_path)
+            self._plan_segments()
 
         self.file = QFile(self.save_path)
-        self.file.open(QIODevice.OpenModeFlag.WriteOnly)
-        self.reply.readyRead.connect(self.on_ready_read)
+        if not self.file.open(QIODevice.OpenModeFlag.ReadWrite):
+            self._fail(f"无法写入文件：{self.save_path}")
+            return
+        if self.ranged and not resumed:
+            self.file.resize(self.size)
+            self._write_journal(force=True)
 
-    def on_progress(self, received, total):
-        if total > 0:
-            percent = int(received * 100 / total)
-            self.progress.emit(percent)
+        if self.extractor is not None:
+            self.extractor.start()
+            # 续传时之前下载的部分已落盘, 由解压线程读取
+            for segment in self.segments:
+                if segment["done"]:
+                    self.extractor.feed_file(segment["start"], segment["done"])
+
+        for segment in self.segments:
+            if not self._segment_complete(segment):
+                self._request_segment(segment)
+        self._monitor.start()
+        self._emit_progress()
+        self._check_complete()
+
+    def _plan_segments(self):
+        if not self.ranged:
+            # 不支持Range时单连接下载, 失败后只能从头开始
+            self.segments = [{"start": 0, "end": self.size, "done": 0, "attempts": 0}]
+            return
+        count = max(1, min(self.connections, self.size // self.MIN_SEGMENT_SIZE))
+        step = -(-self.size // count)
+        self.segments = [{"start": start, "end": min(start + step, self.size), "done": 0, "attempts": 0}
+                         for start in range(0, self.size, step)]
+
+    def _segment_complete(self, segment) -> bool:
+        return segment["end"] is not None and segment["start"] + segment["done"] >= segment["end"]
+
+    def _pick_source(self, exclude: str = None) -> str:
+        """按预计速度分配连接: 速度越快的镜像承担越多连接"""
+        candidates = [url for url in self.sources if url != exclude] or self.sources
+        active = {}
+        for segment in self._replies.values():
+            active[segment["url"]] = active.get(segment["url"], 0) + 1
+        return max(candidates, key=lambda url: (self._speeds.get(url, 0.0) + 1) / (active.get(url, 0) + 1))
+
+    def _request_segment(self, segment, exclude: str = None):
+        url = self._pick_source(exclude)
+        request = QNetworkRequest(QUrl(url))
+        request.setTransferTimeout(self.TRANSFER_TIMEOUT)
+        if self.ranged:
+            start = segment["start"] + segment["done"]
+            request.setRawHeader(b"Range", f"bytes={start}-{segment['end'] - 1}".encode())
         else:
-            self.progress.emit(100)
+            if segment["done"] and self.extractor is not None:
+                # 从头重新下载会重复投递数据
+                self.extractor.abort("下载已重新开始")
+            segment["done"] = 0
+        segment["url"] = url
+        reply = self.manager.get(request)
+        self._replies[reply] = segment
+        self._stats[reply] = {"start": time.perf_counter(), "bytes": 0, "last": 0, "slow": 0, "recorded": False}
+        reply.readyRead.connect(lambda reply=reply: self._on_segment_data(reply))
+        reply.finished.connect(lambda reply=reply: self._on_segment_finished(reply))
+
+    def _on_segment_data(self, reply):
+        segment = self._replies.get(reply)
+        if segment is None:
+            return
+        if self.ranged and reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute) != 206:
+            # 服务器忽略了Range, 数据位置不对, 换镜像重试
+            reply.abort()
+            return
+
+        data = reply.readAll().data()
+        position = segment["start"] + segment["done"]
+        if segment["end"] is not None:
+            data = data[:segment["end"] - position]
+        self.file.seek(position)
+        self.file.write(data)
+        if position == 0 and self.extractor is None and not self.ranged and self.extract_dir:
+            # 不支持Range时探测请求被中止, 从第一块数据识别流式压缩格式
+            kind = detect_archive(data)
+            if kind in ("gz", "bz2", "xz", "tar"):
+                self.extractor = TarStreamExtractor(self.extract_dir, self.save_path, kind)
+                self.extractor.start()
+        if self.extractor is not None:
+            self.extractor.feed(position, data)
+        segment["done"] += len(data)
+        self._stats[reply]["bytes"] += len(data)
+        self._emit_progress()
+        self._write_journal()
+
+        if self.ranged and self._segment_complete(segment):
+            # 分段可能被拆分缩短, 到达终点后不再接收后续数据
+            self._finish_segment(reply, segment)
+
+    def _on_segment_finished(self, reply):
+        segment = self._replies.get(reply)
+        if segment is None:
+            return
+        if reply.error() == QNetworkReply.NetworkError.NoError:
+            if segment["end"] is None:
+                segment["end"] = segment["done"]
+            if self._segment_complete(segment):
+                self._finish_segment(reply, segment)
+                return
+
+        # 失败后从已下载位置换下一个镜像继续
+        self._replies.pop(reply, None)
+        self._record_speed(reply, segment["url"])
+        reply.deleteLater()
+        if self._stopped:
+            return
+        # 主动切换镜像不计入失败次数
+        if not segment.pop("stalled", False):
+            segment["attempts"] += 1
+        if segment["attempts"] > 2 * len(self.sources):
+            self._fail(f"下载失败：{reply.errorString()}")
+            return
+        self._write_journal(force=True)
+        self._request_segment(segment, exclude=segment["url"])
+
+    def _record_speed(self, reply, url: str):
+        stats = self._stats.pop(reply, None)
+        if stats is None or stats["recorded"]:
+            return
+        elapsed = time.perf_counter() - stats["start"]
+        if stats["bytes"] >= self.PROBE_SIZE and elapsed > 0:
+            self.selector.record(url, stats["bytes"] / elapsed)
+
+    def _check_stalls(self):
+        """连接持续低于吞吐量下限时, 把该分段的剩余部分切换到其他镜像"""
+        now = time.perf_counter()
+        for reply, stats in list(self._stats.items()):
+            segment = self._replies.get(reply)
+            if segment is None:
+                continue
+            speed = stats["bytes"] - stats["last"]
+            stats["last"] = stats["bytes"]
+            if now - stats["start"] < self.STALL_GRACE:
+                continue
+            stats["slow"] = stats["slow"] + 1 if speed < self.min_speed else 0
+            if stats["slow"] < self.STALL_CHECKS:
+                continue
+            url = segment["url"]
+            # 降低该镜像的预计速度, 避免再分配到它
+            self.selector.record(url, speed)
+            self._speeds[url] = speed
+            stats["slow"] = 0
+            # 只有预计更快的镜像才值得切换, 所有镜像都慢时继续当前连接
+            if not any(self._speeds.get(other, 0.0) > max(speed, self.min_speed)
+                       for other in self.sources if other != url):
+                continue
+            self.message.emit(f"{QUrl(url).host()} 速度过慢({speed / 1024:.0f}KB/s), 切换镜像")
+            segment["stalled"] = True
+            # 上面已记录该连接的速度, 中止后不再按平均速度重复记录
+            stats["recorded"] = True
+            reply.abort()
+
+    def _finish_segment(self, reply, segment):
+        self._replies.pop(reply, None)
+        self._record_speed(reply, segment["url"])
+        reply.abort()
+        reply.deleteLater()
+        self._write_journal(force=True)
+        self._split_largest()
+        self._check_complete()
 
-    def on_ready_read(self):
-        self.file.write(self.reply.readAll())
+    def _split_largest(self):
+        """空闲连接接管剩余最多的分段的后半部分, 避免慢镜像拖慢整体"""
+        if not self.ranged or self._stopped or len(self._replies) >= self.connections:
+            return
+        active = [segment for segment in self._replies.values()]
+        if not active:
+            return
+        segment = max(active, key=lambda s: s["end"] - s["start"] - s["done"])
+        remaining = segment["end"] - segment["start"] - segment["done"]
+        if remaining < 2 * self.MIN_SEGMENT_SIZE:
+            return
+        middle = segment["end"] - remaining // 2
+        tail = {"start": middle, "end": segment["end"], "done": 0, "attempts": 0}
+        segment["end"] = middle
+        self.segments.append(tail)
+        self._request_segment(tail)
 
-    def on_finished(self):
+    def _check_complete(self):
+        if self._stopped or self._replies or not all(self._segment_complete(s) for s in self.segments):
+            return
+        self._monitor.stop()
         self.file.close()
-        self.reply.deleteLater()
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        if self.extractor is not None:
+            self.extracted = self.extractor.finish()
+            if not self.extracted:
+                self.message.emit(f"边下载边解压失败, 下载完成后再解压: {self.extractor.error}")
+        self.progress.emit(100)
+        self._complete()
+
+    def _emit_progress(self):
+        if self.size:
+            self.progress.emit(int(sum(s["done"] for s in self.segments) * 100 / self.size))
+
+    # ---- 续传日志 ----
+
+    def _load_journal(self) -> bool:
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+            if journal["size"] != self.size or os.path.getsize(self.save_path) != self.size:
+                return False
+            self.segments = [{"start": start, "end": end, "done": done, "attempts": 0}
+                             for start, end, done in journal["segments"]]
+            return True
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+
+    def _write_journal(self, force: bool = False):
+        if not self.ranged or self.file is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_journal < self.JOURNAL_INTERVAL:
+            return
+        self._last_journal = now
+        # 先落盘数据再记录进度, 保证日志记录的部分一定已写入
+        self.file.flush()
+        journal = {
+            "size": self.size,
+            "sources": self.sources,
+            "segments": [[s["start"], s["end"], s["done"]] for s in self.segments],
+        }
+        try:
+            with open(self.journal_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(journal, f)
+            os.replace(self.journal_path + ".tmp", self.journal_path)
+        except OSError:
+            pass
+
+    # ---- 结束 ----
+
+    def abort(self):
+        """中止下载, 保留日志以便下次续传"""
+        if self._stopped:
+            return
+        self._write_journal(force=True)
+        self._stopped = True
+        self._monitor.stop()
+        for reply in list(self._probes) + list(self._replies):
+            reply.abort()
+        self._probes.clear()
+        self._replies.clear()
+        self._stats.clear()
+        if self.extractor is not None:
+            self.extractor.abort("下载已中止")
+            self.extractor.finish()
+        if self.file is not None:
+            self.file.close()
+
+    def _complete(self):
         self.finished.emit(self.save_path)
 
-    def on_error(self, code):
-        self.file.close()
-        self.reply.abort()
-        self.error.emit(f"下载失败：{code}")
+    def _fail(self, message: str):
+        self.abort()
+        self.error.emit(message)
+
 
-class ToolDownloader(FileDownloader):
+class ToolDownloader(SegmentedDownloader):
     finished = Signal(object, int)  # Tool, mirror
     error = Signal(str, object, int)  # msg, tool, mirror
-    def __init__(self, tool: Tool, mirror: int):
-        super().__init__(tool.get_mirrors()[mirror], os.path.join(tool.get_path(), f"{tool.name}.PFTDownloading"))
+
+    def __init__(self, tool: Tool, mirror: int, connections: int = 4,
+                 selector: MirrorSelector = None, min_speed: int = 32 * 1024):
+        # 指定的镜像优先, 其余镜像用于分段并发下载; 探测后按速度重新排序; 下载的同时解压到工具目录
+        mirrors = tool.get_mirrors()
+        super().__init__(mirrors[mirror:] + mirrors[:mirror],
+                         os.path.join(tool.get_path(), f"{tool.name}.PFTDownloading"), connections,
+                         selector, min_speed, tool.get_path())
         self.tool = tool
         self.mirror = mirror
 
-    def on_finished(self):
-        self.file.close()
-        self.reply.deleteLater()
+    def _complete(self):
         self.finished.emit(self.tool, self.mirror)
 
-    def on_error(self, code):
-        self.file.close()
-        self.reply.abort()
-        self.error.emit(f"下载失败：{code}", self.tool, self.mirror)
\ No newline at end of file
+    def _fail(self, message: str):
+        self.abort()
+        self.error.emit(message, self.tool, self.mirror)
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+SAMPLE_SIZE = 64 * 1024  # 快速哈希读取文件头尾各64KB
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+class FirmwareCache:
+    """固件缓存: 以压缩包大小/修改时间/快速哈希为键, 保存成员清单(偏移/大小/sha256)与已解压镜像, 超出磁盘预算时按LRU淘汰"""
+
+    def __init__(self, cache_dir: str = None, budget: int = 4 * 1024 * 1024 * 1024, keep_images: bool = True):
+        self.cache_dir = cache_dir or os.path.join("cache", "firmware")
+        self.budget = budget
+        self.keep_images = keep_images
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def package_key(path: str) -> str:
+        """压缩包的缓存键: 大小 + 修改时间 + 头尾内容哈希, 无需读取整个文件"""
+        stat = os.stat(path)
+        digest = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read(SAMPLE_SIZE))
+            if stat.st_size > SAMPLE_SIZE:
+                f.seek(max(SAMPLE_SIZE, stat.st_size - SAMPLE_SIZE))
+                digest.update(f.read(SAMPLE_SIZE))
+        return digest.hexdigest()[:32]
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    # ---- 清单 ----
+
+    def load(self, key: str) -> dict | None:
+        """读取清单, 同时刷新LRU时间; 未缓存或已损坏时返回None"""
+        path = os.path.join(self._entry_dir(key), MANIFEST_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get("version") != MANIFEST_VERSION:
+                return None
+            os.utime(path)
+            return manifest
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.last_error = str(e)
+            return None
+
+    def save(self, key: str, package) -> bool:
+        """写入清单(成员名/大小/偏移/sha256)"""
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "path": package.path,
+            "kind": package.kind,
+            "created": time.time(),
+            "members": [{
+                "name": member.name,
+                "size": member.size,
+                "compressed": member.compressed,
+                "offset": member.offset,
+                "header_offset": member.header_offset,
+                "sha256": member.sha256,
+            } for member in package.members()],
+        }
+        entry_dir = self._entry_dir(key)
+        path = os.path.join(entry_dir, MANIFEST_NAME)
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+            return True
+        except OSError as e:
+            self.last_error = str(e)
+            return False
+
+    # ---- 已解压镜像 ----
+
+    def image_path(self, key: str, name: str) -> str:
+        """成员对应的已解压镜像路径, 保留目录信息避免同名镜像冲突"""
+        safe_name = name.replace("\\", "/").strip("/").replace("/", "__")
+        return os.path.join(self._entry_dir(key), "images", safe_name)
+
+    def cached_image(self, key: str, name: str, size: int) -> str | None:
+        """已解压且大小一致的镜像路径"""
+        path = self.image_path(key, name)
+        try:
+            if os.path.getsize(path) == size:
+                return path
+        except OSError:
+            pass
+        return None
+
+    def can_store(self, size: int) -> bool:
+        return self.keep_images and size <= self.budget
+
+    # ---- 淘汰 ----
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        total = 0
+        for root, dirs, files in os.walk(path):
+            for file in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, file))
+                except OSError:
+                    pass
+        return total
+
+    def evict(self, keep: str = None):
+        """按最近使用时间淘汰, 直到总大小不超过预算; 先淘汰已解压镜像, 清单很小最后才淘汰; keep为正在使用的缓存键"""
+        with self._lock:
+            try:
+                keys = os.listdir(self.cache_dir)
+            except OSError:
+                return
+
+            entries = []
+            for key in keys:
+                entry_dir = self._entry_dir(key)
+                if not os.path.isdir(entry_dir):
+                    continue
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry_dir, MANIFEST_NAME))
+                except OSError:
+                    last_used = 0
+                images_size = self._dir_size(os.path.join(entry_dir, "images"))
+                entries.append((last_used, key, images_size, self._dir_size(entry_dir) - images_size))
+
+            total = sum(images_size + other for _, _, images_size, other in entries)
+            entries.sort()
+            for last_used, key, images_size, other in entries:
+                if total <= self.budget:
+                    return
+                if key != keep and images_size:
+                    shutil.rmtree(os.path.join(self._entry_dir(key), "images"), ignore_errors=True)
+                    total -= images_size
+
+            for last_used, key, images_size, other in entries:
+                if total <= self.budget:
+                    return
+                if key != keep:
+                    shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                    total -= other
+
+            if keep is not None:
+                # 当前固件包本身超出预算时只保留清单
+                shutil.rmtree(os.path.join(self._entry_dir(keep), "images"), ignore_errors=True)
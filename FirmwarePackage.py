@@ -0,0 +1,308 @@
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import zipfile
+from contextlib import contextmanager
+
+IMAGE_SUFFIXES = ('.img', '.bin')
+READ_SIZE = 1024 * 1024
+
+
+class PackageMember:
+    """固件包中的一个文件"""
+
+    def __init__(self, package: "FirmwarePackage", name: str, size: int, compressed: bool, info=None):
+        self.package = package
+        self.name = name
+        self.size = size
+        self.compressed = compressed
+        self.info = info  # ZipInfo / TarInfo / 文件路径
+        self.offset = None  # 数据在包内的偏移(未压缩成员)
+        self.header_offset = getattr(info, "header_offset", getattr(info, "offset", None))
+        self.sha256 = None
+
+    @property
+    def basename(self) -> str:
+        return os.path.basename(self.name)
+
+    @property
+    def partition(self) -> str:
+        """分区名（不带扩展名）"""
+        return os.path.splitext(self.basename)[0]
+
+    def open(self):
+        """打开成员的只读流"""
+        return self.package.open_member(self)
+
+    @property
+    def shareable(self) -> bool:
+        """能否被多个线程同时读取(tar成员共用一个解压流, 不能并发读取)"""
+        return self.package.kind in ("zip", "dir")
+
+    def map(self):
+        """未压缩成员返回其在包中的memoryview(零拷贝), 否则返回None"""
+        return self.package.map_member(self)
+
+    def set_checksum(self, sha256: str):
+        """记录校验值, 关闭固件包时写入缓存清单"""
+        if self.sha256 != sha256:
+            self.sha256 = sha256
+            self.package.dirty = True
+
+    @contextmanager
+    def extract(self):
+        """需要随机访问时解压到临时文件, 退出时删除"""
+        if self.package.kind == "dir":
+            yield self.info
+            return
+        cached = self.package.cached_image(self)
+        if cached:
+            yield cached
+            return
+        temp_dir = tempfile.mkdtemp(prefix="firmware_")
+        try:
+            path = os.path.join(temp_dir, self.basename)
+            with self.open() as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            yield path
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def __repr__(self):
+        return f"PackageMember({self.name!r}, {self.size})"
+
+
+class FirmwarePackage:
+    """固件包: 原地索引zip/tar成员, 存储成员mmap读取, 压缩成员流式读取, 只在需要随机访问时解压"""
+
+    def __init__(self, path: str, cache=None):
+        self.path = path
+        self.kind = self._detect_kind(path)
+        self.cache = cache if self.kind != "dir" else None  # FirmwareCache
+        self.dirty = False
+        self._cache_key = None
+        self._members = None
+        self._archive = None
+        self._mapped = None
+        self._view = None
+        self._lock = threading.Lock()  # 流水线线程与刷写线程可能同时映射成员
+        self._verified = set()  # 本次已校验或刚写入缓存的成员, 不再重复计算sha256
+
+        if self.kind == "zip":
+            self._archive = zipfile.ZipFile(path, 'r')
+        elif self.kind in ("tar", "tgz"):
+            self._archive = tarfile.open(path, 'r:*')
+
+    @staticmethod
+    def _detect_kind(path: str) -> str:
+        lower = path.lower()
+        if lower.endswith('.zip'):
+            return "zip"
+        if lower.endswith('.tar.gz') or lower.endswith('.tgz'):
+            return "tgz"
+        if lower.endswith('.tar'):
+            return "tar"
+        # 非压缩包时使用固件所在目录
+        return "dir"
+
+    def close(self):
+        if self.cache is not None and self._members is not None:
+            if self.dirty:
+                self.cache.save(self.cache_key, self)
+                self.dirty = False
+            self.cache.evict(keep=self.cache_key)
+        try:
+            if self._view is not None:
+                self._view.release()
+            if self._mapped is not None:
+                self._mapped.close()
+        except BufferError:
+            # 仍有成员视图未释放, 交给垃圾回收
+            pass
+        self._view = None
+        self._mapped = None
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ---- 索引 ----
+
+    @property
+    def cache_key(self) -> str | None:
+        if self._cache_key is None and self.cache is not None:
+            self._cache_key = self.cache.package_key(self.path)
+        return self._cache_key
+
+    def members(self) -> list[PackageMember]:
+        """按包内顺序列出所有文件, 有缓存清单时不再扫描压缩包"""
+        if self._members is None:
+            manifest = self.cache.load(self.cache_key) if self.cache is not None else None
+            if manifest is not None:
+                self._members = self._from_manifest(manifest)
+            if self._members is None:
+                self._members = list(self._scan())
+                if self.cache is not None:
+                    self.cache.save(self.cache_key, self)
+        return self._members
+
+    def _from_manifest(self, manifest: dict) -> list[PackageMember] | None:
+        members = []
+        try:
+            for entry in manifest["members"]:
+                if self.kind == "zip":
+                    info = self._archive.getinfo(entry["name"])
+                else:
+                    # tar成员直接按清单中的偏移读取, 不再从头解压扫描
+                    info = tarfile.TarInfo(entry["name"])
+                    info.size = entry["size"]
+                    info.offset = entry["header_offset"]
+                    info.offset_data = entry["offset"]
+                member = PackageMember(self, entry["name"], entry["size"], entry["compressed"], info)
+                member.offset = entry["offset"]
+                member.sha256 = entry["sha256"]
+                members.append(member)
+        except (KeyError, TypeError) as e:
+            self.cache.last_error = str(e)
+            return None
+        return members
+
+    def _scan(self):
+        if self.kind == "zip":
+            for info in self._archive.infolist():
+                if not info.is_dir():
+                    yield PackageMember(self, info.filename, info.file_size,
+                                        info.compress_type != zipfile.ZIP_STORED or bool(info.flag_bits & 0x1), info)
+        elif self.kind == "tgz":
+            # 压缩的tar只能顺序读取: 用流模式一次读完建立索引, 不在包对象中保留所有TarInfo
+            with tarfile.open(self.path, 'r|*') as stream:
+                for info in stream:
+                    if info.isfile():
+                        member = PackageMember(self, info.name, info.size, True, info)
+                        member.offset = info.offset_data
+                        yield member
+        elif self.kind == "tar":
+            for info in self._archive:
+                if info.isfile():
+                    member = PackageMember(self, info.name, info.size, False, info)
+                    member.offset = info.offset_data
+                    yield member
+        else:
+            root_dir = os.path.dirname(self.path)
+            for root, dirs, files in os.walk(root_dir):
+                for file in files:
+                    full_path = os.path.join(root, file)
+                    yield PackageMember(self, os.path.relpath(full_path, root_dir),
+                                        os.path.getsize(full_path), False, full_path)
+
+    def images(self) -> list[PackageMember]:
+        """所有镜像文件"""
+        return [member for member in self.members() if member.name.lower().endswith(IMAGE_SUFFIXES)]
+
+    def find_image(self, partition: str) -> PackageMember | None:
+        """查找特定分区镜像"""
+        for member in self.members():
+            if member.name.lower().endswith(f"{partition}.img") or member.name.lower().endswith(f"{partition}.bin"):
+                return member
+        return None
+
+    def find(self, predicate) -> PackageMember | None:
+        """按文件名查找第一个匹配的成员"""
+        for member in self.members():
+            if predicate(member.basename):
+                return member
+        return None
+
+    # ---- 读取 ----
+
+    @staticmethod
+    def archive_order(members: list[PackageMember]) -> list[PackageMember]:
+        """按成员在包内的位置排序; tar成员按此顺序读取时压缩流只会向前seek"""
+        return sorted(members, key=lambda member: member.header_offset or 0)
+
+    def open_member(self, member: PackageMember):
+        if self.kind == "zip":
+            return self._archive.open(member.info, 'r')
+        if self.kind in ("tar", "tgz"):
+            # tar成员共用一个解压流, 需要串行读取; 按包内顺序读取时只会向前seek
+            return self._archive.extractfile(member.info)
+        return open(member.info, 'rb')
+
+    def _archive_view(self) -> memoryview:
+        with self._lock:
+            if self._view is None:
+                with open(self.path, 'rb') as f:
+                    self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mapped)
+            return self._view
+
+    def map_member(self, member: PackageMember):
+        if member.compressed or member.size == 0 or self.kind not in ("zip", "tar"):
+            return None
+        view = self._archive_view()
+        if member.offset is None:
+            # 根据zip本地文件头计算数据偏移
+            offset = member.info.header_offset
+            if bytes(view[offset:offset + 4]) != b"PK\x03\x04":
+                return None
+            name_len, extra_len = struct.unpack_from("<HH", view, offset + 26)
+            member.offset = offset + 30 + name_len + extra_len
+            self.dirty = self.cache is not None
+        return view[member.offset:member.offset + member.size]
+
+    def cached_image(self, member: PackageMember) -> str | None:
+        """缓存中已解压且与清单中sha256一致的成员镜像; 没有校验值或不一致时删除该镜像并返回None, 由调用方重新解压"""
+        if self.cache is None:
+            return None
+        path = self.cache.cached_image(self.cache_key, member.name, member.size)
+        if path is None or member.name in self._verified:
+            return path
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_SIZE), b''):
+                digest.update(chunk)
+        if member.sha256 is None or digest.hexdigest() != member.sha256:
+            self.cache.last_error = f"缓存的镜像校验失败: {member.name}"
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        self._verified.add(member.name)
+        return path
+
+    @contextmanager
+    def store_image(self, member: PackageMember):
+        """把成员解压到缓存目录, 返回写入路径; 缓存不可用时返回None"""
+        if self.cache is None or not self.cache.can_store(member.size):
+            yield None
+            return
+        path = self.cache.image_path(self.cache_key, member.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            yield path + ".part"
+            os.replace(path + ".part", path)
+            self._verified.add(member.name)
+        except BaseException:
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+            raise
+
+    def extract_all(self, dest: str):
+        """整体解压, 仅用于需要完整目录结构的场景(如刷机脚本)"""
+        if self.kind == "tgz":
+            # 按包内顺序一次解压完成, 不在压缩流中来回seek
+            with tarfile.open(self.path, 'r|*') as stream:
+                stream.extractall(dest)
+            return
+        self._archive.extractall(dest)
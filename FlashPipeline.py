@@ -0,0 +1,241 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+READ_SIZE = 1024 * 1024
+STALL_TIMEOUT = 30 * 60  # 秒, 流水线在这段时间内没有任何进展时get()不再等待
+
+
+class StageTimeline:
+    """记录各阶段(解压/刷写/等待)的时间区间, 用于统计流水线的重叠程度"""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self._intervals = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, start: float, end: float):
+        with self._lock:
+            self._intervals.setdefault(stage, []).append((start, end))
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    @staticmethod
+    def _merge(intervals: list[tuple[float, float]]) -> list[tuple[float, float]]:
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def _length(intervals: list[tuple[float, float]]) -> float:
+        return sum(end - start for start, end in intervals)
+
+    def busy(self, stage: str) -> float:
+        """阶段实际占用的时间(多线程重叠部分只算一次)"""
+        with self._lock:
+            return self._length(self._merge(self._intervals.get(stage, [])))
+
+    def total(self, stage: str) -> float:
+        """阶段所有区间的累计时间"""
+        with self._lock:
+            return sum(end - start for start, end in self._intervals.get(stage, []))
+
+    def overlap(self, first: str, second: str) -> float:
+        """两个阶段同时进行的时间"""
+        with self._lock:
+            a = self._merge(self._intervals.get(first, []))
+            b = self._merge(self._intervals.get(second, []))
+        overlap = 0.0
+        i = j = 0
+        while i < len(a) and j < len(b):
+            overlap += max(0.0, min(a[i][1], b[j][1]) - max(a[i][0], b[j][0]))
+            if a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
+        return overlap
+
+    def report(self) -> dict:
+        """返回 {wall, prepare, flash, overlap, wait, overlap_ratio}, 单位为秒"""
+        wall = (self.end_time or time.perf_counter()) - self.start_time
+        prepare = self.busy("prepare")
+        flash = self.busy("flash")
+        overlap = self.overlap("prepare", "flash")
+        shorter = min(prepare, flash)
+        return {
+            "wall": wall,
+            "prepare": prepare,
+            "flash": flash,
+            "overlap": overlap,
+            "wait": self.total("wait"),
+            "overlap_ratio": overlap / shorter if shorter > 0 else 0.0,
+        }
+
+    def format_report(self) -> str:
+        report = self.report()
+        return (f"流水线统计: 总耗时 {report['wall']:.1f}s, 解压 {report['prepare']:.1f}s, "
+                f"刷写 {report['flash']:.1f}s, 重叠 {report['overlap']:.1f}s ({report['overlap_ratio']:.0%}), "
+                f"等待解压 {report['wait']:.1f}s")
+
+
+class PrefetchPipeline:
+    """解压与刷写流水线: 工作线程按顺序准备后续镜像, 最多领先depth个, 所有设备用完后立即清理临时文件
+
+    只有压缩成员需要准备; 不超过stream_size(设备的max-download-size)且可并发读取的压缩成员刷写时边解压边发送,
+    也不需要准备
+    """
+
+    def __init__(self, images: list, consumers: int = 1, depth: int = 2, timeline: StageTimeline = None,
+                 stream_size: int = None, timeout: float = STALL_TIMEOUT):
+        self.images = images  # [(分区, 文件路径或固件包成员)]
+        self.consumers = max(1, consumers)
+        self.depth = max(1, depth)
+        self.timeline = timeline or StageTimeline()
+        self.stream_size = stream_size
+        self.timeout = timeout
+        self._prepared = {}  # {index: (分区, 可刷写的源, 临时目录)}
+        self._errors = {}
+        self._remaining = [self.consumers] * len(images)
+        self._released = 0  # 已被所有设备用完的前缀长度
+        self._progress = 0  # 每准备好或释放一个镜像加一, 用于判断流水线是否停滞
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """停止准备并删除尚未清理的临时文件"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._condition:
+            for index in list(self._prepared):
+                self._discard(index)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ---- 消费端 ----
+
+    def get(self, index: int) -> tuple:
+        """等待第index个镜像准备完成, 返回 (分区, 文件路径或固件包成员)
+
+        有设备没有release()时流水线无法继续, timeout秒内没有任何进展时抛出TimeoutError
+        """
+        start = time.perf_counter()
+        with self._condition:
+            progress = self._progress
+            deadline = time.monotonic() + self.timeout
+            while index not in self._prepared and index not in self._errors and not self._stopped:
+                if self._progress != progress:
+                    progress = self._progress
+                    deadline = time.monotonic() + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeline.add("wait", start, time.perf_counter())
+                    raise TimeoutError(f"等待镜像准备超时 ({self.timeout}秒)")
+                self._condition.wait(remaining)
+        self.timeline.add("wait", start, time.perf_counter())
+        if index in self._errors:
+            raise self._errors[index]
+        if index not in self._prepared:
+            raise RuntimeError("流水线已停止")
+        partition, source, temp_dir = self._prepared[index]
+        return partition, source
+
+    def release(self, index: int):
+        """当前设备已用完第index个镜像"""
+        with self._condition:
+            self._remaining[index] -= 1
+            self._progress += 1
+            if self._remaining[index] <= 0:
+                self._discard(index)
+                while self._released < len(self._remaining) and self._remaining[self._released] <= 0:
+                    self._released += 1
+            self._condition.notify_all()
+
+    def _discard(self, index: int):
+        prepared = self._prepared.pop(index, None)
+        if prepared is not None and prepared[2] is not None:
+            shutil.rmtree(prepared[2], ignore_errors=True)
+
+    # ---- 生产端 ----
+
+    def _produce(self):
+        for index, (partition, source) in enumerate(self.images):
+            with self._condition:
+                # 有界预取: 最多领先已释放的镜像depth个
+                while not self._stopped and index - self._released >= self.depth:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+
+            start = time.perf_counter()
+            try:
+                prepared = self._prepare(partition, source)
+            except Exception as e:
+                with self._condition:
+                    self._errors[index] = e
+                    self._progress += 1
+                    self._condition.notify_all()
+                continue
+            finally:
+                self.timeline.add("prepare", start, time.perf_counter())
+
+            with self._condition:
+                self._prepared[index] = prepared
+                self._progress += 1
+                self._condition.notify_all()
+
+    def _prepare(self, partition: str, source) -> tuple:
+        # 文件路径与未压缩成员刷写时直接mmap, 不需要准备
+        if isinstance(source, str) or not source.compressed:
+            return partition, source, None
+
+        cached = source.package.cached_image(source)
+        if cached:
+            # 缓存中已有解压好的镜像, 无需再解压; cached_image在预取阶段按清单中的sha256校验, 不一致时重新解压
+            return partition, cached, None
+
+        if self.stream_size is not None and source.size <= self.stream_size and source.shareable:
+            # 一次download即可发送, 刷写时边解压边发送; tar成员共用解压流, 不能与这里的解压同时读取
+            return partition, source, None
+
+        # 压缩成员在刷写前一个分区时解压, 优先写入固件缓存; 写入缓存时同时计算校验值记入缓存清单
+        with source.package.store_image(source) as cache_path:
+            temp_dir = None if cache_path else tempfile.mkdtemp(prefix="firmware_")
+            path = cache_path or os.path.join(temp_dir, source.basename)
+            digest = hashlib.sha256() if cache_path else None
+            try:
+                with source.open() as src, open(path, 'wb') as dst:
+                    for chunk in iter(lambda: src.read(READ_SIZE), b''):
+                        if digest is not None:
+                            digest.update(chunk)
+                        dst.write(chunk)
+            except Exception:
+                if temp_dir is not None:
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+                raise
+        if cache_path:
+            source.set_checksum(digest.hexdigest())
+            return partition, source.package.cached_image(source), None
+        return partition, path, temp_dir
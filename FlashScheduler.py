@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from FirmwarePackage import FirmwarePackage
+from FlashPipeline import PrefetchPipeline, StageTimeline
+from Tool import PlatformTools
+
+
+class FlashScheduler:
+    """多设备并行刷机调度器, 每台设备占用线程池中的一个工作线程"""
+
+    def __init__(self, platform_tools: PlatformTools, max_workers: int = 8,
+                 progress_callback=None, log_callback=None):
+        self.platform_tools = platform_tools
+        self.max_workers = max(1, max_workers)
+        self.progress_callback = progress_callback  # (serial, percent)
+        self.log_callback = log_callback  # (serial, message)
+        self.results = {}
+        self.errors = {}
+        self.timeline = StageTimeline()
+        self.pipeline = None
+        self.token = None
+        self._progress = {}
+        self._lock = threading.Lock()
+
+    def get_serials(self) -> list[str]:
+        """获取所有已连接的Fastboot设备序列号"""
+        return [serial for serial, state in self.platform_tools.get_fastboot_devices()]
+
+    def flash_all(self, images: list, serials: list[str] = None, prefetch: int = 0, token=None) -> dict[str, bool]:
+        """把镜像列表[(分区, 文件路径或固件包成员)]刷入所有设备, 返回 {serial: 是否全部成功}
+
+        prefetch > 0 时启用解压/刷写流水线, 最多预先准备prefetch个镜像;
+        token(CancelToken)被取消后各设备写完当前分区即停止, 不会中断正在写入的分区
+        """
+        if serials is None:
+            serials = self.get_serials()
+        if not serials or not images:
+            return {}
+
+        self.results = {}
+        self.errors = {}
+        self._progress = {serial: 0 for serial in serials}
+        self.timeline = StageTimeline()
+        self.pipeline = None
+        self.token = token
+
+        workers = min(len(serials), self.max_workers)
+        with ExitStack() as stack:
+            if prefetch > 0:
+                self.pipeline = stack.enter_context(
+                    PrefetchPipeline(images, consumers=len(serials), depth=prefetch, timeline=self.timeline,
+                                     stream_size=self._stream_size(serials)))
+            elif len(serials) > 1:
+                # 多台设备不能共用tar解压流, 先按包内顺序解压一次供所有设备读取(向回seek需要从头重新解压)
+                members = [source for partition, source in images
+                           if not isinstance(source, str) and not source.shareable]
+                extracted = {id(member): stack.enter_context(member.extract())
+                             for member in FirmwarePackage.archive_order(members)}
+                images = [(partition, extracted.get(id(source), source)) for partition, source in images]
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="flash") as executor:
+                futures = {serial: executor.submit(self._flash_device, serial, images) for serial in serials}
+                for serial, future in futures.items():
+                    try:
+                        self.results[serial] = future.result()
+                    except Exception as e:
+                        self.errors.setdefault(serial, []).append(str(e))
+                        self.results[serial] = False
+        self.timeline.finish()
+        return self.results
+
+    def _stream_size(self, serials: list[str]) -> int | None:
+        """所有设备中最小的max-download-size, 不超过它的压缩成员可以边解压边刷写; 有设备无法查询时返回None"""
+        sizes = [self.platform_tools.max_download_size(serial) for serial in serials]
+        if not sizes or None in sizes:
+            return None
+        return min(sizes)
+
+    def total_progress(self) -> int:
+        """所有设备的平均进度"""
+        with self._lock:
+            if not self._progress:
+                return 0
+            return int(sum(self._progress.values()) / len(self._progress))
+
+    def _flash_device(self, serial: str, images: list) -> bool:
+        # 每个工作线程使用独立的PlatformTools, 避免last_error在线程间互相覆盖
+        tools = PlatformTools(self.platform_tools.get_path())
+        success = True
+        total = len(images)
+        released = 0  # 本设备已释放的流水线镜像数
+        try:
+            for i, (partition, source) in enumerate(images):
+                if self.token is not None and self.token.cancelled:
+                    self.errors.setdefault(serial, []).append("已取消")
+                    self._log(serial, f"已取消, 剩余 {total - i} 个分区未刷写")
+                    return False
+                if self.pipeline is not None:
+                    try:
+                        partition, source = self.pipeline.get(i)
+                    except Exception as e:
+                        success = False
+                        released += 1
+                        self.pipeline.release(i)
+                        self.errors.setdefault(serial, []).append(f"{partition}: {e}")
+                        self._log(serial, f"{partition} 准备镜像失败: {e}")
+                        continue
+                self._log(serial, f"正在刷写分区: {partition}")
+
+                def on_chunk(sent, size, speed, i=i):
+                    self._set_progress(serial, int((i + sent / max(size, 1)) / total * 100))
+
+                start = time.perf_counter()
+                try:
+                    if isinstance(source, str):
+                        flashed = tools.flash_partition(partition, source, serial=serial, progress_callback=on_chunk)
+                    else:
+                        flashed = tools.flash_partition_member(partition, source, serial=serial,
+                                                               progress_callback=on_chunk)
+                finally:
+                    self.timeline.add("flash", start, time.perf_counter())
+                    if self.pipeline is not None:
+                        released += 1
+                        self.pipeline.release(i)
+                if flashed:
+                    self._log(serial, f"{partition} 刷写成功")
+                else:
+                    success = False
+                    self.errors.setdefault(serial, []).append(f"{partition}: {tools.last_error}")
+                    self._log(serial, f"{partition} 刷写失败: {tools.last_error}")
+                self._set_progress(serial, int((i + 1) / total * 100))
+        finally:
+            # 异常退出时释放剩余镜像, 其他设备不会一直等待这台设备
+            if self.pipeline is not None:
+                for i in range(released, total):
+                    self.pipeline.release(i)
+        return success
+
+    def _set_progress(self, serial: str, percent: int):
+        with self._lock:
+            self._progress[serial] = percent
+        if self.progress_callback:
+            self.progress_callback(serial, percent)
+
+    def _log(self, serial: str, message: str):
+        if self.log_callback:
+            self.log_callback(serial, message)
@@ -1,16 +1,15 @@
 import os
 import platform
 import shutil
-import subprocess
 import sys
-import tarfile
 import tempfile
 import threading
 import time
-import zipfile
+from collections import deque
+from contextlib import ExitStack, nullcontext
 
-from PySide6.QtCore import Qt, Signal, QSettings, QTimer, QThread
-from PySide6.QtGui import QIcon, QTextCursor, QFont, QColor, QPalette
+from PySide6.QtCore import Qt, Signal, QSettings, QTimer
+from PySide6.QtGui import QIcon, QFont, QColor, QPalette
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                                QLabel, QPushButton, QComboBox, QProgressBar,
                                QFileDialog, QMessageBox, QGroupBox, QDialog,
@@ -20,8 +19,21 @@ from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
 
 from Dialogs import DebugLogDialog, DownloadDialog
 from Dialogs import SettingsDialog
+from FirmwareCache import FirmwareCache
+from FirmwarePackage import FirmwarePackage
+from FlashScheduler import FlashScheduler
 from FlashingToolbox import FlashingToolbox
-from Tool import PlatformTools, MTKClientTool
+from JobExecutor import GLOBAL_DEVICE, JobExecutor
+from LogBuffer import LogBuffer
+from OutputSink import OutputSink
+from SessionLogger import SessionLogger, level_of
+from StartupProfiler import StartupProfiler
+from Tool import (PlatformTools, MTKClientTool, DeviceWatcher, ToolRegistry, ChunkStore, ProcessRunner, pack_images,
+                  delta_supported)
+
+
+MTK_DEVICE = "mtk"  # MTK相关任务共用一个设备键, 同一时间只运行一个mtk.py
+DETAILS_DEVICE = "details"  # 读取设备详细信息的任务, 不占用设备本身的任务键
 
 
 class FlashTool(QMainWindow):
@@ -29,13 +41,16 @@ class FlashTool(QMainWindow):
     progress_signal = Signal(int)
     status_signal = Signal(str, str)
     mode_signal = Signal(str, str)
+    devices_signal = Signal(object, object)  # 监视线程中的设备快照 (adb设备, fastboot设备)
     mtk_device_signal = Signal(str)
     mtk_command_output = Signal(str)  # 使用str而不是QTextCursor
     splash_message = Signal(str)
+    tools_ready = Signal(object)  # 后台工具检测完成, 参数为FlashingToolbox
 
-    def __init__(self, splash=None):
+    def __init__(self, splash=None, profiler: StartupProfiler = None):
         super().__init__()
         self.splash = splash
+        self.profiler = profiler or StartupProfiler()
 
         self.setWindowTitle("Python Flash Tools V1.9")  # 更新版本号到1.9
         self.setGeometry(100, 100, 900, 600)
@@ -43,43 +58,74 @@ class FlashTool(QMainWindow):
         # 初始化变量
         self.current_mode = None
         self.device_id = None
-        self.flashing_toolbox = FlashingToolbox(PlatformTools(), MTKClientTool())
+        self.tool_registry = ToolRegistry()
+        self.flashing_toolbox = FlashingToolbox(None, None, resolve=False)  # 后台检测完成前视为不可用
+        self._tools_checked = False
         self.debug_log_dialog = None
         self.firmware_path = ""
         self.backup_path = ""
-        self.operation_in_progress = False
+        self.jobs = JobExecutor(parent=self)  # 所有设备操作都在这里运行, 每台设备同时只有一个任务
+        self.jobs.job_finished.connect(self._on_job_finished)
         self.settings_dialog = None
         self.settings = QSettings("PythonFlashTools", "FlashTool")
+        # 日志环形缓冲, 状态栏每100ms显示一次最新日志
+        self.log_buffer = LogBuffer(int(self.settings.value("log_capacity", 100000)))
+        self._status_log_seq = None
+        self._log_status_timer = QTimer(self)
+        self._log_status_timer.setInterval(100)
+        self._log_status_timer.timeout.connect(self._flush_log_status)
+        self._log_status_timer.start()
+        # 所有日志同时写入会话日志文件(后台线程写入, 按大小轮转压缩)
+        self.session_logger = SessionLogger(
+            self.settings.value("session_log_dir", None),
+            max_bytes=int(self.settings.value("session_log_max_mb", 16)) * 1024 * 1024,
+            keep=int(self.settings.value("session_log_keep", 50)))
+        self.session_logger.start()
+        self.firmware_cache = FirmwareCache(
+            budget=int(self.settings.value("firmware_cache_budget_mb", 4096)) * 1024 * 1024,
+            keep_images=self.settings.value("firmware_cache_images", True, type=bool))
+        self.backup_store = ChunkStore(self.settings.value("backup_store_path", None))
         self.running = True  # 设备检测线程运行标志
+        self._details_target = None  # (设备ID, 模式), 设备详细信息应显示的设备
         self.mtk_detecting = False  # MTK设备检测标志
 
         # 添加缺失的属性
         self.xiaomi_flash_path = ""
         self.bootrom_flash_path = ""
         self.partition_img_path = ""
-        self.mtk_process = None  # 存储当前运行的MTKClient进程
-        self._last_update_time = time.time()
+        self._command_lines = deque()  # ADB/Fastboot命令输出, 读取线程写入, 定时器在界面线程中取出
+        self._command_output_timer = QTimer(self)
+        self._command_output_timer.setInterval(100)
+        self._command_output_timer.timeout.connect(self._flush_command_output)
+        self._streaming_commands = 0
+        self.mtk_sink = OutputSink(max_lines=int(self.settings.value("mtk_output_lines", 20000)), parent=self)
 
         # 连接信号
-        self.log_signal.connect(self._log_message)
+        # 日志只写入环形缓冲, 直接在发出信号的线程中完成, 不为每行日志排队事件
+        self.log_signal.connect(self._log_message, Qt.ConnectionType.DirectConnection)
         self.progress_signal.connect(self._update_progress)
         self.status_signal.connect(self._update_status)
         self.mode_signal.connect(self._handle_mode_change)
+        self.devices_signal.connect(self._on_devices_changed)
         self.mtk_device_signal.connect(self._handle_mtk_device)
-        self.mtk_command_output.connect(self._update_mtk_log)
+        # MTK输出在发出信号的线程中入队, 由输出缓冲定时批量显示
+        self.mtk_command_output.connect(self.mtk_sink.write, Qt.ConnectionType.DirectConnection)
+        self.mtk_command_output.connect(self._record_mtk_output, Qt.ConnectionType.DirectConnection)
         self.splash_message.connect(self._update_splash_message)
+        self.tools_ready.connect(self._on_tools_ready)
+        self.profiler.listener = lambda name, ms: self.splash_message.emit(f"{name} ({ms:.0f}ms)")
+        self.profiler.mark("初始化变量")
 
         # 初始化UI
         self._init_ui()
+        self.profiler.mark("构建界面")
 
-        # 启动设备检测线程
-        self._start_device_check()
+        # 在后台查找工具, 与主题设置和窗口显示同时进行
+        self._discover_tools()
 
         # 应用主题
         self._apply_theme()
-
-        # 检查工具依赖
-        self._check_tools()
+        self.profiler.mark("应用主题")
 
     def _update_splash_message(self, message):
         """更新启动画面消息"""
@@ -87,6 +133,40 @@ class FlashTool(QMainWindow):
             self.splash.showMessage(message, Qt.AlignmentFlag.AlignBottom | Qt.AlignmentFlag.AlignCenter, Qt.GlobalColor.white)
             QApplication.processEvents()
 
+    def _discover_tools(self):
+        """在后台线程中查找工具, 完成后通过tools_ready回到界面线程"""
+        def discover():
+            with self.profiler.phase("工具检测"):
+                mtk_client = MTKClientTool(persistent=self.settings.value("mtk_persistent_worker", True, type=bool))
+                toolbox = FlashingToolbox(PlatformTools(), mtk_client, self.tool_registry)
+            self.tools_ready.emit(toolbox)
+
+        threading.Thread(target=discover, daemon=True).start()
+
+    def _on_tools_ready(self, toolbox):
+        """工具检测完成"""
+        if self.flashing_toolbox.mtk_client:
+            self.flashing_toolbox.mtk_client.close()
+        self.flashing_toolbox = toolbox
+        self._update_status("adb", "可用" if toolbox.platform_tools else "不可用")
+        self._update_status("fastboot", "可用" if toolbox.platform_tools else "不可用")
+        self.mtk_status.setText(f"MTKClient: {'可用' if toolbox.mtk_client else '不可用'}")
+
+        # 启动设备检测线程
+        self._start_device_check()
+
+        if not self._tools_checked:
+            self._tools_checked = True
+            self.profiler.listener = None
+            # 工具检测可能先于profiler.finish完成, 排在其后输出时才有可交互时间
+            QTimer.singleShot(0, self._log_startup_report)
+            # 检查工具依赖
+            self._check_tools()
+
+    def _log_startup_report(self):
+        self.profiler.save()
+        self.log_signal.emit(self.profiler.format_report())
+
     def _check_tools(self):
         """检查工具依赖"""
 
@@ -104,7 +184,8 @@ class FlashTool(QMainWindow):
                 print("所有工具下载成功！")
             else:
                 print("用户取消或部分工具下载失败")
-            self.flashing_toolbox = FlashingToolbox(PlatformTools(), MTKClientTool())
+            # 已找到的工具直接命中索引, 只重新探测刚下载的工具
+            self._discover_tools()
 
 
     def _init_ui(self):
@@ -167,7 +248,7 @@ class FlashTool(QMainWindow):
         self._init_pages()
 
         # 初始化Debug日志对话框
-        self.debug_log_dialog = DebugLogDialog(self)
+        self.debug_log_dialog = DebugLogDialog(self, self.log_buffer)
         self.settings_dialog = SettingsDialog(self)
 
     def _init_sidebar(self):
@@ -193,7 +274,7 @@ class FlashTool(QMainWindow):
         self.sidebar.currentItemChanged.connect(self._on_sidebar_item_changed)
 
     def _init_pages(self):
-        """初始化功能页面"""
+        """初始化功能页面, 除设备信息页外都在首次访问时才构建"""
         # 设备信息页面
         self.device_info_page = QWidget()
         self._init_device_info_page()
@@ -201,24 +282,28 @@ class FlashTool(QMainWindow):
 
         # 系统模式 (ADB) 页面
         self.adb_mode_page = QWidget()
-        self._init_adb_mode_page()
         self.stacked_widget.addWidget(self.adb_mode_page)
 
         # 引导模式 (Fastboot) 页面
         self.fastboot_mode_page = QWidget()
-        self._init_fastboot_mode_page()
         self.stacked_widget.addWidget(self.fastboot_mode_page)
 
         # 恢复模式 (Recovery) 页面
         self.recovery_mode_page = QWidget()
-        self._init_recovery_mode_page()
         self.stacked_widget.addWidget(self.recovery_mode_page)
 
         # 救砖模式 (Bootrom) 页面
         self.bootrom_mode_page = QWidget()
-        self._init_bootrom_mode_page()
         self.stacked_widget.addWidget(self.bootrom_mode_page)
 
+        # 尚未构建的页面
+        self._page_builders = {
+            "adb_mode": self._init_adb_mode_page,
+            "fastboot_mode": self._init_fastboot_mode_page,
+            "recovery_mode": self._init_recovery_mode_page,
+            "bootrom_mode": self._init_bootrom_mode_page,
+        }
+
         # 设置页面 (使用设备信息页面作为占位符)
         self.stacked_widget.addWidget(QLabel("设置页面"))
 
@@ -228,6 +313,27 @@ class FlashTool(QMainWindow):
         # 关于页面 (使用设备信息页面作为占位符)
         self.stacked_widget.addWidget(QLabel("关于页面"))
 
+    def _ensure_page(self, tag):
+        """首次访问时构建页面, 并同步构建前发生的状态变化"""
+        builder = self._page_builders.pop(tag, None)
+        if builder is None:
+            return
+        builder()
+        self._update_button_states()
+        if tag == "bootrom_mode":
+            self._prepare_mtk_worker()
+            if self.current_mode == "mtk":
+                self.mtk_status_label.setText(f"设备状态: 已连接 (端口: {self.device_id})")
+
+    def _prepare_mtk_worker(self):
+        """打开MTK工具页面时提前启动MTKClient工作进程, 第一条命令不必等待导入mtkclient"""
+        mtk_client = self.flashing_toolbox.mtk_client
+        if mtk_client and mtk_client.persistent:
+            try:
+                mtk_client.worker().start()
+            except OSError as e:
+                self.log_signal.emit(f"启动MTKClient进程失败: {str(e)}")
+
     def _init_device_info_page(self):
         """初始化设备信息页面"""
         layout = QVBoxLayout()
@@ -344,7 +450,7 @@ class FlashTool(QMainWindow):
 
         self.adb_status = QLabel("ADB: 检测中...")
         self.fastboot_status = QLabel("Fastboot: 检测中...")
-        self.mtk_status = QLabel(f"MTKClient: {'可用' if self.flashing_toolbox.mtk_client else '不可用'}")
+        self.mtk_status = QLabel("MTKClient: 检测中...")
 
         tools_layout.addWidget(self.adb_status)
         tools_layout.addWidget(self.fastboot_status)
@@ -629,8 +735,16 @@ class FlashTool(QMainWindow):
         """)
         execute_btn.clicked.connect(self._execute_adb_command)
 
+        stop_btn = QPushButton("停止")
+        stop_btn.setStyleSheet("padding: 8px; min-width: 80px; border-radius: 5px;")
+        stop_btn.clicked.connect(self._cancel_device_commands)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(execute_btn)
+        button_layout.addWidget(stop_btn)
+
         input_layout.addWidget(self.adb_command_input)
-        input_layout.addWidget(execute_btn)
+        input_layout.addLayout(button_layout)
         input_group.setLayout(input_layout)
 
         # 输出显示
@@ -651,6 +765,7 @@ class FlashTool(QMainWindow):
 
         self.adb_output = QPlainTextEdit()
         self.adb_output.setReadOnly(True)
+        self.adb_output.setMaximumBlockCount(20000)
         self.adb_output.setStyleSheet("""
             font-family: monospace; 
             font-size: 9pt; 
@@ -966,7 +1081,14 @@ class FlashTool(QMainWindow):
         self.partition_combo.setStyleSheet("padding: 6px; font-size: 10pt; border-radius: 5px;")
         self.partition_combo.addItems(["全部", "boot", "recovery", "system", "vendor", "userdata", "cache", "vbmeta"])
 
+        self.delta_flash_check = QCheckBox("增量刷写 (在ADB模式下先读取分区哈希, 只写入变化的块, 需要root)")
+        self.delta_flash_check.setStyleSheet("font-size: 10pt; color: #e0e0e0;")
+        self.delta_flash_check.setChecked(self.settings.value("delta_flash", False, type=bool))
+        self.delta_flash_check.toggled.connect(lambda checked: self.settings.setValue("delta_flash", checked))
+        self.delta_flash_check.toggled.connect(lambda checked: self._update_button_states())
+
         partition_layout.addWidget(self.partition_combo)
+        partition_layout.addWidget(self.delta_flash_check)
         partition_group.setLayout(partition_layout)
 
         # 进度条
@@ -1054,8 +1176,16 @@ class FlashTool(QMainWindow):
         """)
         execute_btn.clicked.connect(self._execute_fastboot_command)
 
+        stop_btn = QPushButton("停止")
+        stop_btn.setStyleSheet("padding: 8px; min-width: 80px; border-radius: 5px;")
+        stop_btn.clicked.connect(self._cancel_device_commands)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(execute_btn)
+        button_layout.addWidget(stop_btn)
+
         input_layout.addWidget(self.fastboot_command_input)
-        input_layout.addWidget(execute_btn)
+        input_layout.addLayout(button_layout)
         input_group.setLayout(input_layout)
 
         # 输出显示
@@ -1076,6 +1206,7 @@ class FlashTool(QMainWindow):
 
         self.fastboot_output = QPlainTextEdit()
         self.fastboot_output.setReadOnly(True)
+        self.fastboot_output.setMaximumBlockCount(20000)
         self.fastboot_output.setStyleSheet("""
             font-family: monospace; 
             font-size: 9pt; 
@@ -1544,6 +1675,8 @@ class FlashTool(QMainWindow):
             padding: 5px;
         """)
 
+        self.mtk_sink.attach(self.mtk_output)
+
         output_layout.addWidget(self.mtk_output)
         output_group.setLayout(output_layout)
 
@@ -1686,6 +1819,7 @@ class FlashTool(QMainWindow):
             return
 
         tag = current.data(Qt.ItemDataRole.UserRole)
+        self._ensure_page(tag)
 
         # 根据标签切换到相应页面
         if tag == "device_info":
@@ -1706,101 +1840,96 @@ class FlashTool(QMainWindow):
             self._show_about()
 
     def _start_device_check(self):
-        """启动设备检测线程"""
+        """启动设备监视, 设备集合变化时才更新界面"""
         self.running = True
+        self._stop_device_check()
+        if not self.flashing_toolbox.platform_tools:
+            return
 
-        def check_loop():
-            while self.running:
-                try:
-                    # 检查ADB设备
-                    adb_devices = self.flashing_toolbox.platform_tools.get_adb_devices()
-                    if adb_devices:
-                        self.mode_signal.emit("adb", adb_devices[0][0])
-                        self._update_device_details(adb_devices[0][0])
-                        time.sleep(3)
-                        continue
-                except Exception as e:
-                    self.log_signal.emit(f"ADB设备检测错误: {str(e)}")
-
-                # 检查Fastboot设备
-                try:
-                    fastboot_devices = self.flashing_toolbox.platform_tools.get_fastboot_devices()
-                    if fastboot_devices:
-                        self.mode_signal.emit("fastboot", fastboot_devices[0][0])
-                        self._update_device_details(fastboot_devices[0][0])
-                        time.sleep(3)
-                        continue
-                except Exception as e:
-                    self.log_signal.emit(f"Fastboot设备检测错误: {str(e)}")
-
-                # 检查MTK设备
-                if self.mtk_detecting:  # 只有开始识别时才检测
-                    try:
-                        mtk_devices = self.flashing_toolbox.mtk_client.detect_devices()
-                        if mtk_devices:
-                            self.mtk_device_signal.emit(mtk_devices[0][0])
-                            self.mtk_detecting = False  # 检测到设备后停止检测
-                            self.stop_detect_btn.setEnabled(False)
-                            self.start_detect_btn.setEnabled(True)
-                            self.mtk_status_label.setText(f"设备状态: 已连接 (端口: {mtk_devices[0][0]})")
-                            time.sleep(3)
-                            continue
-                    except Exception as e:
-                        self.log_signal.emit(f"MTK设备检测错误: {str(e)}")
-                        self.mtk_status_label.setText(f"设备状态: 检测错误 - {str(e)}")
-                        time.sleep(1)
-
-                # 没有检测到设备
-                self.mode_signal.emit(None, None)
-                self.device_details.setText("设备详细信息将在此显示")
-                self.mtk_status_label.setText("设备状态: 未连接")
-                time.sleep(3)
-
-        self.check_thread = threading.Thread(target=check_loop, daemon=True)
-        self.check_thread.start()
+        self.device_watcher = DeviceWatcher(self.flashing_toolbox.platform_tools, self.devices_signal.emit,
+                                            error_callback=self.log_signal.emit)
+        self.device_watcher.start()
+
+    def _stop_device_check(self):
+        """停止设备监视"""
+        if getattr(self, 'device_watcher', None):
+            self.device_watcher.stop()
+            self.device_watcher = None
+
+    def _on_devices_changed(self, adb_devices, fastboot_devices):
+        """设备集合变化: 监视线程通过devices_signal排队到界面线程执行, 参数是变化时的设备快照"""
+        if adb_devices:
+            target = (adb_devices[0][0], "adb")
+        elif fastboot_devices:
+            target = (fastboot_devices[0][0], "fastboot")
+        else:
+            target = None
+        self._details_target = target
+        if target:
+            self.mode_signal.emit(target[1], target[0])
+            self._update_device_details(*target)
+            return
 
-    def _update_device_details(self, device_id):
-        """更新设备详细信息"""
-        try:
-            if self.current_mode == "adb":
-                # 获取设备信息
-                result = self.flashing_toolbox.platform_tools.execute_adb_command(f"-s {device_id} shell getprop")
-                if result and result['success']:
-                    props = result['output'].splitlines()
-                    details = []
-
-                    # 提取重要属性
-                    important_props = {
-                        "ro.product.model": "型号",
-                        "ro.product.brand": "品牌",
-                        "ro.product.name": "产品名",
-                        "ro.build.version.release": "Android版本",
-                        "ro.build.id": "构建ID",
-                        "ro.serialno": "序列号"
-                    }
-
-                    for prop in props:
-                        if "]: [" in prop:
-                            key, value = prop.split("]: [")
-                            key = key.strip("[")
-                            value = value.strip("]")
-                            if key in important_props:
-                                details.append(f"{important_props[key]}: {value}")
-
-                    self.device_details.setText("\n".join(details))
-                else:
-                    self.device_details.setText("无法获取设备详细信息")
+        # 没有检测到设备
+        self.jobs.cancel(DETAILS_DEVICE)
+        if self.current_mode != "mtk":
+            self.mode_signal.emit(None, None)
+            self.device_details.setText("设备详细信息将在此显示")
+            if hasattr(self, 'mtk_status_label'):
+                self.mtk_status_label.setText("设备状态: 未连接")
 
-            elif self.current_mode == "fastboot":
-                # 获取fastboot设备信息
-                result = self.flashing_toolbox.platform_tools.execute_fastboot_command(f"-s {device_id} getvar all")
+    def _update_device_details(self, device_id, mode=None):
+        """在任务中读取设备详细信息, 结果在界面线程显示; 读取期间设备又变化时结束后按最新设备重新读取"""
+        if mode is None:
+            mode = self.current_mode
+        platform_tools = self.flashing_toolbox.platform_tools
+
+        def run(token):
+            if mode == "adb":
+                result = platform_tools.execute_adb_command(f"-s {device_id} shell getprop",
+                                                            runner=self._job_runner(token))
+                if not (result and result['success']):
+                    return None
+                # 提取重要属性
+                important_props = {
+                    "ro.product.model": "型号",
+                    "ro.product.brand": "品牌",
+                    "ro.product.name": "产品名",
+                    "ro.build.version.release": "Android版本",
+                    "ro.build.id": "构建ID",
+                    "ro.serialno": "序列号"
+                }
+                details = []
+                for prop in result['output'].splitlines():
+                    if "]: [" in prop:
+                        key, value = prop.split("]: [", 1)
+                        key = key.strip("[")
+                        value = value.strip("]")
+                        if key in important_props:
+                            details.append(f"{important_props[key]}: {value}")
+                return "\n".join(details)
+            if mode == "fastboot":
+                # fastboot的getvar输出在stderr中
+                result = platform_tools.execute_fastboot_command(f"-s {device_id} getvar all",
+                                                                 runner=self._job_runner(token))
                 if result and result['success']:
-                    self.device_details.setText(result['output'])
-                else:
-                    self.device_details.setText("无法获取设备详细信息")
-
-        except Exception as e:
-            self.log_signal.emit(f"获取设备详细信息错误: {str(e)}")
+                    return result['output'] or result['error']
+            return None
+
+        def done(job):
+            target = self._details_target
+            if target != (device_id, mode):
+                # 设备已经变化, 丢弃旧结果
+                if target:
+                    self._update_device_details(*target)
+                return
+            if job.state == "failed":
+                self.log_signal.emit(f"获取设备详细信息错误: {job.error}")
+            elif job.state == "done":
+                self.device_details.setText(job.result if job.result is not None else "无法获取设备详细信息")
+
+        # 已有读取任务时由它结束后按最新设备重新读取
+        self.jobs.submit("读取设备信息", run, device=DETAILS_DEVICE, on_done=done)
 
     def _handle_mode_change(self, mode, device_id):
         """处理设备模式变化"""
@@ -1834,7 +1963,8 @@ class FlashTool(QMainWindow):
         self.device_info.setText(f"设备端口: {device_id}")
         self.device_status.setStyleSheet("color: #FF9800;")
         self._update_button_states()
-        self.mtk_status_label.setText(f"设备状态: 已连接 (端口: {device_id})")
+        if hasattr(self, 'mtk_status_label'):
+            self.mtk_status_label.setText(f"设备状态: 已连接 (端口: {device_id})")
 
     def _update_button_states(self):
         """更新按钮状态"""
@@ -1844,8 +1974,13 @@ class FlashTool(QMainWindow):
         self.recovery_btn.setEnabled(has_device and self.current_mode == "adb")
         self.reboot_btn.setEnabled(has_device)
         self.detect_mtk_btn.setEnabled(True)
-        self.flash_btn.setEnabled(has_device and bool(self.firmware_path) and self.current_mode == "fastboot")
-        self.xiaomi_flash_btn.setEnabled(bool(self.xiaomi_flash_path))
+        # 刷机页面尚未构建时, 构建后会再次同步按钮状态
+        if hasattr(self, 'flash_btn'):
+            # 增量刷写需要先在ADB模式下读取分区哈希
+            flash_modes = ("fastboot", "adb") if self.delta_flash_check.isChecked() else ("fastboot",)
+            self.flash_btn.setEnabled(has_device and bool(self.firmware_path) and self.current_mode in flash_modes)
+        if hasattr(self, 'xiaomi_flash_btn'):
+            self.xiaomi_flash_btn.setEnabled(bool(self.xiaomi_flash_path))
 
     def _update_status(self, status_type, message):
         """更新状态显示"""
@@ -1855,65 +1990,34 @@ class FlashTool(QMainWindow):
             self.fastboot_status.setText(f"Fastboot: {message}")
 
     def _log_message(self, message):
-        """记录日志消息"""
-        self.statusBar().showMessage(message)
-        if self.debug_log_dialog:
-            self.debug_log_dialog.append_log(message)
+        """记录日志消息, 可在任意线程调用"""
+        self.log_buffer.append(message)
+        self._record_session_log(message, "app")
+
+    def _record_mtk_output(self, message):
+        """MTK命令输出写入会话日志, 可在任意线程调用"""
+        self._record_session_log(message, "mtk")
+
+    def _record_session_log(self, message, source):
+        """附带设备和所属任务写入会话日志; 任务线程中记录的日志属于该任务的设备"""
+        job = self.jobs.current_job()
+        if job is not None:
+            self.session_logger.log(message, level_of(message), source, job.device or self.device_id, job.id, job.name)
+        else:
+            self.session_logger.log(message, level_of(message), source, self.device_id)
+
+    def _flush_log_status(self):
+        """定时在状态栏显示最新一条日志"""
+        record = self.log_buffer.last()
+        if record is not None and record.seq != self._status_log_seq:
+            self._status_log_seq = record.seq
+            self.statusBar().showMessage(record.message)
 
     def _update_progress(self, value):
         """更新进度条"""
-        self.progress_bar.setValue(value)
-        self.xiaomi_progress_bar.setValue(value)
-        self.recovery_progress_bar.setValue(value)
-
-    def _update_mtk_log(self, message):
-        """更新MTK日志输出 - 修复线程安全问题"""
-        # 确保在主线程中执行UI更新
-        if not QThread.currentThread() is QApplication.instance().thread():
-            # 使用信号而不是直接调用
-            self.mtk_command_output.emit(message)
-            return
-
-        # 直接追加消息
-        if hasattr(self, 'mtk_output') and self.mtk_output:
-            self.mtk_output.append(message)
-
-            # 滚动到底部
-            self.mtk_output.moveCursor(QTextCursor.MoveOperation.End)
-            self.mtk_output.ensureCursorVisible()
-
-        current_time = time.time()
-        if current_time - self._last_update_time > 0.1:  # 每100ms更新一次
-            self.mtk_output.append(message)
-            self._last_update_time = current_time
-        else:
-            # 缓存消息，稍后一起更新
-            if not hasattr(self, '_mtk_message_buffer'):
-                self._mtk_message_buffer = []
-            self._mtk_message_buffer.append(message)
-
-            # 如果没有定时器，创建一个
-            if not hasattr(self, '_mtk_update_timer'):
-                self._mtk_update_timer = QTimer(self)
-                self._mtk_update_timer.timeout.connect(self._flush_mtk_buffer)
-                self._mtk_update_timer.start(100)  # 100ms后刷新
-
-    def _flush_mtk_buffer(self):
-        """刷新MTK消息缓冲区"""
-        if hasattr(self, '_mtk_message_buffer') and self._mtk_message_buffer:
-            # 批量更新消息
-            message = "\n".join(self._mtk_message_buffer)
-            if hasattr(self, 'mtk_output') and self.mtk_output:
-                self.mtk_output.append(message)
-                self.mtk_output.moveCursor(QTextCursor.MoveOperation.End)
-                self.mtk_output.ensureCursorVisible()
-
-            # 清空缓冲区
-            self._mtk_message_buffer.clear()
-
-        # 停止定时器
-        if hasattr(self, '_mtk_update_timer'):
-            self._mtk_update_timer.stop()
+        for name in ('progress_bar', 'xiaomi_progress_bar', 'recovery_progress_bar'):
+            if hasattr(self, name):
+                getattr(self, name).setValue(value)
 
     def _show_settings(self):
         """显示设置对话框"""
@@ -1949,161 +2053,110 @@ class FlashTool(QMainWindow):
 
     def _enter_bootloader(self):
         """进入Bootloader模式"""
-        if self.operation_in_progress:
-            return
-
-        self.operation_in_progress = True
-        self.log_signal.emit("尝试进入Bootloader模式...")
-
-        try:
+        def run(token):
             success, error = self.flashing_toolbox.platform_tools.adb_reboot("bootloader")
             if success:
                 self.log_signal.emit("设备正在重启到Bootloader...")
             else:
                 self.log_signal.emit(f"操作失败: {error}")
-        except Exception as e:
-            self.log_signal.emit(f"操作异常: {str(e)}")
-        finally:
-            self.operation_in_progress = False
+
+        if self._submit_job("进入Bootloader", run):
+            self.log_signal.emit("尝试进入Bootloader模式...")
 
     def _enter_recovery(self):
         """进入Recovery模式"""
-        if self.operation_in_progress:
-            return
-
-        self.operation_in_progress = True
-        self.log_signal.emit("尝试进入Recovery模式...")
-
-        try:
+        def run(token):
             success, error = self.flashing_toolbox.platform_tools.adb_reboot("recovery")
             if success:
                 self.log_signal.emit("设备正在重启到Recovery...")
             else:
                 self.log_signal.emit(f"操作失败: {error}")
-        except Exception as e:
-            self.log_signal.emit(f"操作异常: {str(e)}")
-        finally:
-            self.operation_in_progress = False
+
+        if self._submit_job("进入Recovery", run):
+            self.log_signal.emit("尝试进入Recovery模式...")
 
     def _detect_mtk_devices(self):
         """检测MTK设备"""
-        if self.operation_in_progress:
+        if self._device_busy(MTK_DEVICE):
             return
 
-        self.operation_in_progress = True
         self.log_signal.emit("开始检测MTK设备...")
-        self.mtk_output.clear()
-
-        try:
-            # 启动MTKClient命令
-            cmd = [sys.executable, self.flashing_toolbox.mtk_client.get_main_program(), "detect"]
-            self.mtk_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
-
-            # 启动线程读取输出
-            threading.Thread(target=self._read_mtk_output, daemon=True).start()
-        except Exception as e:
-            self.log_signal.emit(f"检测MTK设备失败: {str(e)}")
-            self.operation_in_progress = False
+        self._ensure_page("bootrom_mode")  # 输出显示在MTK工具页面
+        self.mtk_sink.clear()
+        self._submit_job("检测MTK设备", self._run_mtk_process, ["detect"], device=MTK_DEVICE)
 
     def _start_detect_mtk(self):
         """开始持续检测MTK设备"""
+        if not self._submit_job("持续检测MTK设备", self._detect_mtk_continuous, device=MTK_DEVICE,
+                                on_done=self._on_detect_mtk_finished):
+            return
         self.log_signal.emit("开始持续检测MTK设备...")
         self.mtk_detecting = True
         self.start_detect_btn.setEnabled(False)
         self.stop_detect_btn.setEnabled(True)
         self.mtk_status_label.setText("设备状态: 检测中...")
 
-        # 启动新的检测线程
-        threading.Thread(target=self._detect_mtk_continuous, daemon=True).start()
-
-    def _detect_mtk_continuous(self):
-        """持续检测MTK设备"""
-        while self.mtk_detecting:
-            try:
-                # 执行检测命令
-                cmd = [sys.executable, self.flashing_toolbox.mtk_client.get_main_program(), "detect"]
-                self.mtk_process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True
-                )
-
-                # 读取输出
-                while self.mtk_detecting:
-                    output = self.mtk_process.stdout.readline()
-                    if output == '' and self.mtk_process.poll() is not None:
-                        break
-                    if output:
-                        self.mtk_command_output.emit(output.strip())
-
-                # 检查是否检测到设备
-                if self.mtk_detecting and self.mtk_process.poll() == 0:
-                    # 尝试解析输出以获取设备信息
-                    mtk_devices = self.flashing_toolbox.mtk_client.detect_mtk_devices()
-                    if mtk_devices:
-                        self.mtk_device_signal.emit(mtk_devices[0][0])
-                        self.mtk_detecting = False  # 检测到设备后停止检测
-                        self.stop_detect_btn.setEnabled(False)
-                        self.start_detect_btn.setEnabled(True)
-                        self.mtk_status_label.setText(f"设备状态: 已连接 (端口: {mtk_devices[0][0]})")
-                        break
-
-                time.sleep(1)
-            except Exception as e:
-                self.mtk_command_output.emit(f"检测错误: {str(e)}")
-                self.mtk_status_label.setText(f"设备状态: 检测错误 - {str(e)}")
-                time.sleep(1)
-
-    def _stop_detect_mtk(self):
-        """停止检测MTK设备"""
-        self.log_signal.emit("已停止检测MTK设备")
+    def _detect_mtk_continuous(self, token):
+        """持续检测MTK设备, 检测到时返回端口"""
+        mtk_client = self.flashing_toolbox.mtk_client
+        token.on_cancel(mtk_client.worker().cancel)
+        while not token.cancelled:
+            lines = []
+
+            def on_output(line):
+                lines.append(line)
+                self.mtk_command_output.emit(line)
+
+            # 执行检测命令, 工作进程常驻, 每次检测不再重新导入mtkclient
+            if mtk_client.run(["detect"], on_output) == 0 and not token.cancelled:
+                # 解析本次输出获取设备信息
+                mtk_devices = mtk_client.parse_devices("\n".join(lines) + "\n")
+                if mtk_devices:
+                    self.mtk_device_signal.emit(mtk_devices[0][0])
+                    return mtk_devices[0][0]  # 检测到设备后停止检测
+            elif not token.cancelled and mtk_client.last_error:
+                self.mtk_command_output.emit(f"检测错误: {mtk_client.last_error}")
+            token.sleep(1)
+        return None
+
+    def _on_detect_mtk_finished(self, job):
+        """持续检测结束(检测到设备/停止/出错)"""
         self.mtk_detecting = False
         self.start_detect_btn.setEnabled(True)
         self.stop_detect_btn.setEnabled(False)
-        self.mtk_status_label.setText("设备状态: 检测已停止")
+        if job.result:
+            self.mtk_status_label.setText(f"设备状态: 已连接 (端口: {job.result})")
+        elif job.state == "failed":
+            self.mtk_status_label.setText(f"设备状态: 检测错误 - {job.error}")
+        else:
+            self.mtk_status_label.setText("设备状态: 检测已停止")
 
-        # 如果检测进程仍在运行，终止它
-        if self.mtk_process and self.mtk_process.poll() is None:
-            try:
-                self.mtk_process.terminate()
-            except:
-                pass
+    def _stop_detect_mtk(self):
+        """停止检测MTK设备"""
+        if self.mtk_detecting and self.jobs.cancel(MTK_DEVICE):
+            self.log_signal.emit("已停止检测MTK设备")
 
     def _reboot_device(self):
         """重启设备"""
-        if self.operation_in_progress:
+        if self.current_mode == "mtk":
+            self.log_signal.emit("MTK设备重启需要手动操作")
+            return
+        if self.current_mode not in ("adb", "fastboot"):
+            self.log_signal.emit("当前模式不支持重启")
             return
 
-        self.operation_in_progress = True
-        self.log_signal.emit("正在重启设备...")
+        mode = self.current_mode
 
-        try:
-            if self.current_mode == "adb":
+        def run(token):
+            if mode == "adb":
                 success, error = self.flashing_toolbox.platform_tools.adb_reboot()
-                if not success:
-                    self.log_signal.emit(f"重启失败: {error}")
-            elif self.current_mode == "fastboot":
-                success, error = self.flashing_toolbox.platform_tools.fastboot_reboot()
-                if not success:
-                    self.log_signal.emit(f"重启失败: {error}")
-            elif self.current_mode == "mtk":
-                self.log_signal.emit("MTK设备重启需要手动操作")
             else:
-                self.log_signal.emit("当前模式不支持重启")
-        except Exception as e:
-            self.log_signal.emit(f"操作异常: {str(e)}")
-        finally:
-            self.operation_in_progress = False
+                success, error = self.flashing_toolbox.platform_tools.fastboot_reboot()
+            if not success:
+                self.log_signal.emit(f"重启失败: {error}")
+
+        if self._submit_job("重启设备", run):
+            self.log_signal.emit("正在重启设备...")
 
     def _select_firmware(self):
         """选择固件文件"""
@@ -2157,35 +2210,13 @@ class FlashTool(QMainWindow):
 
     def _execute_adb_command(self):
         """执行ADB命令"""
-        if self.operation_in_progress:
-            return
-
         command = self.adb_command_input.text().strip()
         if not command:
             self.log_signal.emit("请输入ADB命令")
             return
 
-        self.operation_in_progress = True
-        self.log_signal.emit(f"执行ADB命令: {command}")
-
-        try:
-            result = self.flashing_toolbox.platform_tools.execute_adb_command(command)
-            if result is None:
-                self.adb_output.setPlainText(f"执行失败: {self.flashing_toolbox.platform_tools.last_error}")
-            else:
-                output = ""
-                if result['output']:
-                    output += f"输出:\n{result['output']}\n\n"
-                if result['error']:
-                    output += f"错误:\n{result['error']}\n\n"
-                output += f"结果: {'成功' if result['success'] else '失败'}"
-                self.adb_output.setPlainText(output)
-                self.log_signal.emit(f"ADB命令执行{'成功' if result['success'] else '失败'}")
-        except Exception as e:
-            self.adb_output.setPlainText(f"执行异常: {str(e)}")
-            self.log_signal.emit(f"ADB命令执行异常: {str(e)}")
-        finally:
-            self.operation_in_progress = False
+        self._start_device_command(self.adb_output, "ADB", self.flashing_toolbox.platform_tools.execute_adb_command,
+                                   command)
 
     def _set_fastboot_command(self, command):
         """设置Fastboot命令"""
@@ -2193,35 +2224,97 @@ class FlashTool(QMainWindow):
 
     def _execute_fastboot_command(self):
         """执行Fastboot命令"""
-        if self.operation_in_progress:
-            return
-
         command = self.fastboot_command_input.text().strip()
         if not command:
             self.log_signal.emit("请输入Fastboot命令")
             return
 
-        self.operation_in_progress = True
-        self.log_signal.emit(f"执行Fastboot命令: {command}")
+        self._start_device_command(self.fastboot_output, "Fastboot",
+                                   self.flashing_toolbox.platform_tools.execute_fastboot_command, command)
 
-        try:
-            result = self.flashing_toolbox.platform_tools.execute_fastboot_command(command)
+    def _start_device_command(self, output_widget, kind, execute, command):
+        """作为任务执行命令, 输出逐行进入队列, 由定时器批量追加到输出框"""
+        def run(token):
+            result = execute(command, lambda line: self._command_lines.append((output_widget, line)),
+                             self._job_runner(token))
             if result is None:
-                self.fastboot_output.setPlainText(f"执行失败: {self.flashing_toolbox.platform_tools.last_error}")
-            else:
-                output = ""
-                if result['output']:
-                    output += f"输出:\n{result['output']}\n\n"
-                if result['error']:
-                    output += f"错误:\n{result['error']}\n\n"
-                output += f"结果: {'成功' if result['success'] else '失败'}"
-                self.fastboot_output.setPlainText(output)
-                self.log_signal.emit(f"Fastboot命令执行{'成功' if result['success'] else '失败'}")
-        except Exception as e:
-            self.fastboot_output.setPlainText(f"执行异常: {str(e)}")
-            self.log_signal.emit(f"Fastboot命令执行异常: {str(e)}")
-        finally:
-            self.operation_in_progress = False
+                result = {'success': False, 'output': "",
+                          'error': f"执行失败: {self.flashing_toolbox.platform_tools.last_error}"}
+            return result
+
+        if not self._submit_job(f"{kind}命令", run,
+                                on_done=lambda job: self._on_command_finished(output_widget, kind, job)):
+            return
+        self.log_signal.emit(f"执行{kind}命令: {command}")
+        output_widget.clear()
+        self._streaming_commands += 1
+        self._command_output_timer.start()
+
+    def _flush_command_output(self):
+        """把队列中的命令输出一次性追加到对应的输出框"""
+        batches = {}
+        while self._command_lines:
+            widget, line = self._command_lines.popleft()
+            batches.setdefault(widget, []).append(line)
+        for widget, lines in batches.items():
+            widget.appendPlainText("\n".join(lines))
+
+    def _on_command_finished(self, output_widget, kind, job):
+        """命令结束: 输出剩余内容和结果"""
+        self._flush_command_output()
+        self._streaming_commands -= 1
+        if not self._streaming_commands:
+            self._command_output_timer.stop()
+        result = job.result
+        if result is None:
+            result = {'success': False, 'output': "", 'error': f"执行异常: {job.error}" if job.error else "",
+                      'cancelled': job.state == "cancelled"}
+        if not output_widget.toPlainText():
+            # 没有流式输出的命令(如push/pull)或执行前的错误(如工具不可用)
+            for text in (result['output'], result['error']):
+                if text:
+                    output_widget.appendPlainText(text.rstrip("\n"))
+        if result.get('truncated'):
+            output_widget.appendPlainText("(输出过多, 只保留了最近的部分)")
+        status = '已取消' if result.get('cancelled') else '成功' if result['success'] else '失败'
+        output_widget.appendPlainText(f"\n结果: {status}")
+        if job.state != "cancelled":  # 取消由_on_job_finished记录
+            self.log_signal.emit(f"{kind}命令执行{status}")
+
+    def _cancel_device_commands(self):
+        """停止当前设备上正在运行的命令"""
+        if not self.jobs.cancel(self.device_id or GLOBAL_DEVICE):
+            self.log_signal.emit("没有正在执行的命令")
+
+    @staticmethod
+    def _job_runner(token):
+        """创建随任务取消而终止的ProcessRunner"""
+        runner = ProcessRunner()
+        token.on_cancel(runner.cancel)
+        return runner
+
+    def _device_busy(self, device=None):
+        """设备上已有任务时提示并返回True"""
+        device = (self.device_id if device is None else device) or GLOBAL_DEVICE
+        job = self.jobs.job(device)
+        if job is None:
+            return False
+        self.log_signal.emit(f"设备正忙: {job.name}进行中")
+        return True
+
+    def _submit_job(self, name, fn, *args, device=None, on_done=None, interruptible=True):
+        """在任务线程池中运行设备操作 fn(token, *args), 默认属于当前设备; 设备正忙时返回None"""
+        if self._device_busy(device):
+            return None
+        device = (self.device_id if device is None else device) or GLOBAL_DEVICE
+        return self.jobs.submit(name, fn, *args, device=device, on_done=on_done, interruptible=interruptible)
+
+    def _on_job_finished(self, job):
+        """任务异常或被取消时记录日志"""
+        if job.state == "failed":
+            self.log_signal.emit(f"{job.name}异常: {job.error}")
+        elif job.state == "cancelled":
+            self.log_signal.emit(f"{job.name}已取消")
 
     def _set_mtk_command(self, command):
         """设置MTK命令"""
@@ -2229,83 +2322,115 @@ class FlashTool(QMainWindow):
 
     def _execute_mtk_command(self):
         """执行MTK命令"""
-        if self.operation_in_progress:
-            return
-
         command = self.mtk_command_input.text().strip()
         if not command:
             self.log_signal.emit("请输入MTK命令")
             return
+        if not self.flashing_toolbox.mtk_client:
+            self.log_signal.emit("未找到MTKClient工具")
+            return
 
-        self.operation_in_progress = True
+        # 分割命令为参数列表
+        args = command.split()
+        if not self._submit_job("MTK命令", self._run_mtk_process, args, device=MTK_DEVICE):
+            return
+        self._mtk_command_args = args
         self.log_signal.emit(f"执行MTK命令: {command}")
-        self.mtk_output.clear()
-        self.mtk_output.append(f">>> {command}")
+        self.mtk_sink.clear()
+        self.mtk_sink.write(f">>> {command}")
+
+    def _run_mtk_process(self, token, args):
+        """在MTKClient工作进程中运行命令并转发输出, 任务取消时结束工作进程"""
+        mtk_client = self.flashing_toolbox.mtk_client
+        token.on_cancel(mtk_client.worker().cancel)
+        existing = self._dump_files(args)
+        return_code = mtk_client.run(args, self.mtk_command_output.emit)
+
+        # 命令执行完成
+        if token.cancelled:
+            self.mtk_command_output.emit("命令已终止")
+        elif return_code == 0:
+            self.mtk_command_output.emit("命令执行成功")
+            self._pack_mtk_backup(args, existing)
+        elif return_code is None:
+            self.mtk_command_output.emit(f"命令执行失败: {mtk_client.last_error}")
+        else:
+            self.mtk_command_output.emit(f"命令执行失败，返回码: {return_code}")
+
+    @staticmethod
+    def _dump_directory(args):
+        """rl/dump <目录> 命令的输出目录, 其他命令返回None"""
+        if len(args) < 2 or args[0] not in ("rl", "dump") or args[1].startswith("-"):
+            return None
+        return args[1]
+
+    def _dump_files(self, args) -> dict:
+        """命令执行前输出目录中已有的镜像 {文件名: (修改时间, 大小)}, 用于区分本次命令写入的文件"""
+        directory = self._dump_directory(args)
+        files = {}
+        if directory is None or not os.path.isdir(directory):
+            return files
+        for file in os.listdir(directory):
+            if file.endswith(('.bin', '.img')):
+                stat = os.stat(os.path.join(directory, file))
+                files[file] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _backup_format(self):
+        """store / container / raw; 没有设置backup_format时沿用旧的backup_container设置"""
+        backup_format = self.settings.value("backup_format", None)
+        if backup_format is None and self.settings.contains("backup_container"):
+            backup_format = "container" if self.settings.value("backup_container", True, type=bool) else "raw"
+        return backup_format or "store"
+
+    def _pack_mtk_backup(self, args, existing=None):
+        """读取全部分区(rl/dump 目录)完成后, 把本次命令写入的raw镜像存入去重仓库或打包为压缩备份容器"""
+        directory = self._dump_directory(args)
+        if directory is None:
+            return
+        backup_format = self._backup_format()
+        if backup_format not in ("store", "container"):
+            return
+        # 目录中命令执行前就有且没有被改写的文件不属于这次备份
+        existing = existing or {}
+        images = [(os.path.splitext(file)[0], os.path.join(directory, file))
+                  for file, stat in sorted(self._dump_files(args).items()) if existing.get(file) != stat]
+        if not images:
+            return
+        # 默认保留原始镜像; 开启后只在校验通过后删除
+        remove = self.settings.value("backup_remove_images", False, type=bool)
 
-        try:
-            # 分割命令为参数列表
-            args = command.split()
+        def on_progress(name, done, total):
+            self.progress_signal.emit(int(done / max(total, 1) * 100))
 
-            # 启动MTKClient命令
-            if self.flashing_toolbox.mtk_client:
-                cmd = [sys.executable, self.flashing_toolbox.mtk_client.get_main_program()] + args
-
-                # 启动子进程
-                self.mtk_process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True
-                )
-
-                # 启动线程读取输出
-                threading.Thread(target=self._read_mtk_output, daemon=True).start()
-            else:
-                self.log_signal.emit("未找到MTKClient工具")
-                self.operation_in_progress = False
-        except Exception as e:
-            self.mtk_output.append(f"执行异常: {str(e)}")
-            self.log_signal.emit(f"MTK命令执行异常: {str(e)}")
-            self.operation_in_progress = False
+        if backup_format == "store":
+            self.mtk_command_output.emit(f"正在写入备份仓库: {self.backup_store.root}")
+            try:
+                manifest = self.backup_store.add_backup(images, device=self.device_id, remove=remove,
+                                                        progress_callback=on_progress)
+                stats = manifest["stats"]
+                self.mtk_command_output.emit(f"备份 {manifest['id']} 已写入仓库: 数据 {stats['logical']} 字节, "
+                                             f"新增 {stats['new_chunks']} 块 / {stats['written']} 字节")
+            except Exception as e:
+                self.mtk_command_output.emit(f"写入备份仓库失败, 保留原始镜像: {str(e)}")
+            return
 
-    def _read_mtk_output(self):
-        """读取MTK命令输出"""
+        container_path = directory.rstrip("\\/") + ".pftb"
+        self.mtk_command_output.emit(f"正在打包备份: {container_path}")
         try:
-            while True:
-                output = self.mtk_process.stdout.readline()
-                if output == '' and self.mtk_process.poll() is not None:
-                    break
-                if output:
-                    self.mtk_command_output.emit(output.strip())
-
-            # 命令执行完成
-            return_code = self.mtk_process.poll()
-            if return_code == 0:
-                self.mtk_command_output.emit("命令执行成功")
-            else:
-                self.mtk_command_output.emit(f"命令执行失败，返回码: {return_code}")
+            pack_images(container_path, images, remove=remove, progress_callback=on_progress)
+            self.mtk_command_output.emit(f"备份已打包: {container_path} ({os.path.getsize(container_path)} 字节)")
         except Exception as e:
-            self.mtk_command_output.emit(f"读取输出错误: {str(e)}")
-        finally:
-            self.mtk_process = None
-            self.operation_in_progress = False
+            self.mtk_command_output.emit(f"打包备份失败, 保留原始镜像: {str(e)}")
 
     def _stop_mtk_command(self):
         """停止当前MTK命令"""
-        if self.mtk_process and self.mtk_process.poll() is None:
-            try:
-                self.mtk_process.terminate()
-                self.mtk_command_output.emit("命令已终止")
-            except Exception as e:
-                self.mtk_command_output.emit(f"终止命令失败: {str(e)}")
-        else:
+        if not self.jobs.cancel(MTK_DEVICE):
             self.mtk_command_output.emit("没有正在执行的命令")
 
     def _unlock_bootloader(self):
         """解锁Bootloader"""
-        if self.operation_in_progress:
+        if self._device_busy():
             return
 
         reply = QMessageBox.warning(
@@ -2317,26 +2442,27 @@ class FlashTool(QMainWindow):
         if reply == QMessageBox.StandardButton.No:
             return
 
-        self.operation_in_progress = True
-        self.log_signal.emit("正在尝试解锁Bootloader...")
+        def run(token):
+            return self.flashing_toolbox.platform_tools.unlock_bootloader(self._job_runner(token))
 
-        try:
-            success, error = self.flashing_toolbox.platform_tools.unlock_bootloader()
+        def done(job):
+            if job.state == "failed":
+                self.unlock_status.setText("设备状态: 解锁异常")
+                return
+            success, error = job.result
             if success:
                 self.log_signal.emit("解锁Bootloader成功! 设备将自动重启")
                 self.unlock_status.setText("设备状态: 已解锁")
             else:
                 self.log_signal.emit(f"解锁失败: {error}")
                 self.unlock_status.setText("设备状态: 解锁失败")
-        except Exception as e:
-            self.log_signal.emit(f"解锁异常: {str(e)}")
-            self.unlock_status.setText("设备状态: 解锁异常")
-        finally:
-            self.operation_in_progress = False
+
+        if self._submit_job("解锁Bootloader", run, on_done=done):
+            self.log_signal.emit("正在尝试解锁Bootloader...")
 
     def _lock_bootloader(self):
         """锁定Bootloader"""
-        if self.operation_in_progress:
+        if self._device_busy():
             return
 
         reply = QMessageBox.warning(
@@ -2348,45 +2474,55 @@ class FlashTool(QMainWindow):
         if reply == QMessageBox.StandardButton.No:
             return
 
-        self.operation_in_progress = True
-        self.log_signal.emit("正在尝试锁定Bootloader...")
+        def run(token):
+            return self.flashing_toolbox.platform_tools.lock_bootloader(self._job_runner(token))
 
-        try:
-            success, error = self.flashing_toolbox.platform_tools.lock_bootloader()
+        def done(job):
+            if job.state == "failed":
+                self.unlock_status.setText("设备状态: 锁定异常")
+                return
+            success, error = job.result
             if success:
                 self.log_signal.emit("锁定Bootloader成功! 设备将自动重启")
                 self.unlock_status.setText("设备状态: 已锁定")
             else:
                 self.log_signal.emit(f"锁定失败: {error}")
                 self.unlock_status.setText("设备状态: 锁定失败")
-        except Exception as e:
-            self.log_signal.emit(f"锁定异常: {str(e)}")
-            self.unlock_status.setText("设备状态: 锁定异常")
-        finally:
-            self.operation_in_progress = False
+
+        if self._submit_job("锁定Bootloader", run, on_done=done):
+            self.log_signal.emit("正在尝试锁定Bootloader...")
 
     def _start_flashing(self):
         """开始刷机"""
-        if self.operation_in_progress or not self.firmware_path:
+        if not self.firmware_path or self._device_busy():
             return
 
         # 检查设备状态
-        if self.current_mode != "fastboot":
+        delta = self.delta_flash_check.isChecked() and self.current_mode == "adb"
+        if self.current_mode != "fastboot" and not delta:
             QMessageBox.warning(self, "警告", "设备未处于Fastboot模式，无法刷机")
             return
 
-        # 检查Bootloader锁定状态
+        # 检查Bootloader锁定状态, 查询结束后在界面线程中继续
         if self.current_mode == "fastboot":
-            result = self.flashing_toolbox.platform_tools.execute_fastboot_command("oem device-info")
-            if result and "Device unlocked: false" in result['output']:
-                reply = QMessageBox.question(
-                    self, "Bootloader已锁定",
-                    "设备Bootloader已锁定，刷机前需要解锁。是否现在解锁?",
-                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-                )
-                if reply == QMessageBox.StandardButton.Yes:
-                    self._unlock_bootloader()
-                    return
+            self._submit_job("检查Bootloader状态",
+                             lambda token: self.flashing_toolbox.platform_tools.execute_fastboot_command(
+                                 "oem device-info", runner=self._job_runner(token)),
+                             on_done=lambda job: self._confirm_flashing(delta, job.result))
+        else:
+            self._confirm_flashing(delta, None)
+
+    def _confirm_flashing(self, delta, device_info):
+        """根据Bootloader状态确认后开始刷机"""
+        if device_info and "Device unlocked: false" in device_info['output'] + device_info['error']:
+            reply = QMessageBox.question(
+                self, "Bootloader已锁定",
+                "设备Bootloader已锁定，刷机前需要解锁。是否现在解锁?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
+            if reply == QMessageBox.StandardButton.Yes:
+                self._unlock_bootloader()
+                return
 
         reply = QMessageBox.question(
             self, "确认",
@@ -2397,12 +2533,14 @@ class FlashTool(QMainWindow):
         if reply == QMessageBox.StandardButton.No:
             return
 
-        self.operation_in_progress = True
-        threading.Thread(target=self._execute_flash, daemon=True).start()
+        if delta:
+            self._submit_job("增量刷写", self._execute_delta_flash, interruptible=False)
+        else:
+            self._submit_job("刷机", self._execute_flash, interruptible=False)
 
     def _start_xiaomi_flashing(self):
         """开始小米线刷"""
-        if self.operation_in_progress or not self.xiaomi_flash_path:
+        if not self.xiaomi_flash_path or self._device_busy():
             return
 
         reply = QMessageBox.question(
@@ -2414,15 +2552,11 @@ class FlashTool(QMainWindow):
         if reply == QMessageBox.StandardButton.No:
             return
 
-        self.operation_in_progress = True
-        threading.Thread(target=self._execute_xiaomi_flash, daemon=True).start()
-
-    def _execute_xiaomi_flash(self):
-        pass
+        self._submit_job("小米线刷", self._execute_xiaomi_flashing, interruptible=False)
 
     def _start_recovery_flash(self):
         """开始Recovery卡刷"""
-        if self.operation_in_progress or not self.recovery_file_path:
+        if not self.recovery_file_path or self._device_busy():
             return
 
         # 检查设备状态
@@ -2439,77 +2573,64 @@ class FlashTool(QMainWindow):
         if reply == QMessageBox.StandardButton.No:
             return
 
-        self.operation_in_progress = True
-        threading.Thread(target=self._execute_recovery_flash, daemon=True).start()
+        self._submit_job("Recovery卡刷", self._execute_recovery_flash, interruptible=False)
 
     def _install_app(self):
         """安装应用"""
-        if self.operation_in_progress or not hasattr(self, 'app_path'):
+        if not hasattr(self, 'app_path'):
             return
 
-        self.operation_in_progress = True
-        self.log_signal.emit(f"正在安装应用: {self.app_path}")
+        app_path = self.app_path
 
-        try:
-            result = self.flashing_toolbox.platform_tools.execute_adb_command(f"install -r \"{self.app_path}\"")
+        def run(token):
+            result = self.flashing_toolbox.platform_tools.execute_adb_command(f"install -r \"{app_path}\"",
+                                                                              runner=self._job_runner(token))
             if result and result['success']:
                 self.log_signal.emit("应用安装成功")
-            else:
+            elif not token.cancelled:
                 error = result['error'] if result else "未知错误"
                 self.log_signal.emit(f"应用安装失败: {error}")
-        except Exception as e:
-            self.log_signal.emit(f"应用安装异常: {str(e)}")
-        finally:
-            self.operation_in_progress = False
+
+        if self._submit_job("安装应用", run):
+            self.log_signal.emit(f"正在安装应用: {app_path}")
 
     def _uninstall_app(self):
         """卸载应用"""
-        if self.operation_in_progress:
-            return
-
         package_name = self.package_name_input.text().strip()
         if not package_name:
             self.log_signal.emit("请输入包名")
             return
 
-        self.operation_in_progress = True
-        self.log_signal.emit(f"正在卸载应用: {package_name}")
-
-        try:
-            result = self.flashing_toolbox.platform_tools.execute_adb_command(f"uninstall {package_name}")
+        def run(token):
+            result = self.flashing_toolbox.platform_tools.execute_adb_command(f"uninstall {package_name}",
+                                                                              runner=self._job_runner(token))
             if result and result['success']:
                 self.log_signal.emit("应用卸载成功")
-            else:
+            elif not token.cancelled:
                 error = result['error'] if result else "未知错误"
                 self.log_signal.emit(f"应用卸载失败: {error}")
-        except Exception as e:
-            self.log_signal.emit(f"应用卸载异常: {str(e)}")
-        finally:
-            self.operation_in_progress = False
+
+        if self._submit_job("卸载应用", run):
+            self.log_signal.emit(f"正在卸载应用: {package_name}")
 
     def _refresh_app_list(self):
         """刷新应用列表"""
-        if self.operation_in_progress:
-            return
-
-        self.operation_in_progress = True
-        self.log_signal.emit("正在获取应用列表...")
+        def run(token):
+            return self.flashing_toolbox.platform_tools.execute_adb_command("shell pm list packages",
+                                                                             runner=self._job_runner(token))
 
-        try:
-            result = self.flashing_toolbox.platform_tools.execute_adb_command("shell pm list packages")
+        def done(job):
+            result = job.result
             if result and result['success']:
                 self.app_list.clear()
-                packages = result['output'].splitlines()
-                for package in packages:
-                    if package.startswith("package:"):
-                        self.app_list.addItem(package[8:])
+                packages = [package[8:] for package in result['output'].splitlines() if package.startswith("package:")]
+                self.app_list.addItems(packages)
                 self.log_signal.emit(f"已加载 {len(packages)} 个应用")
-            else:
+            elif job.state == "done":
                 self.log_signal.emit("获取应用列表失败")
-        except Exception as e:
-            self.log_signal.emit(f"获取应用列表异常: {str(e)}")
-        finally:
-            self.operation_in_progress = False
+
+        if self._submit_job("获取应用列表", run, on_done=done):
+            self.log_signal.emit("正在获取应用列表...")
 
     def _manage_ui_component(self):
         """管理系统界面组件"""
@@ -2532,27 +2653,32 @@ class FlashTool(QMainWindow):
         elif component == "notification":
             self._toggle_notification()
 
+    def _run_ui_command(self, name, command, success_text, failure_text):
+        """作为任务执行界面调整命令, 结果在界面线程写入界面日志"""
+        def run(token):
+            return self.flashing_toolbox.platform_tools.execute_adb_command(command, runner=self._job_runner(token))
+
+        def done(job):
+            result = job.result
+            if result and result['success']:
+                self.ui_log.appendPlainText(success_text)
+                self.log_signal.emit(success_text)
+            elif job.state != "cancelled":
+                self.ui_log.appendPlainText("操作失败")
+                self.log_signal.emit(failure_text)
+
+        if self._submit_job(name, run, on_done=done):
+            self.log_signal.emit(f"{name}...")
+
     def _toggle_statusbar(self):
         """切换状态栏可见性"""
-        self.log_signal.emit("切换状态栏可见性...")
-        result = self.flashing_toolbox.platform_tools.execute_adb_command("shell settings put global policy_control immersive.status=*")
-        if result and result['success']:
-            self.ui_log.appendPlainText("状态栏已隐藏")
-            self.log_signal.emit("状态栏已隐藏")
-        else:
-            self.ui_log.appendPlainText("操作失败")
-            self.log_signal.emit("切换状态栏失败")
+        self._run_ui_command("切换状态栏可见性", "shell settings put global policy_control immersive.status=*",
+                             "状态栏已隐藏", "切换状态栏失败")
 
     def _toggle_navbar(self):
         """切换导航栏可见性"""
-        self.log_signal.emit("切换导航栏可见性...")
-        result = self.flashing_toolbox.platform_tools.execute_adb_command("shell settings put global policy_control immersive.navigation=*")
-        if result and result['success']:
-            self.ui_log.appendPlainText("导航栏已隐藏")
-            self.log_signal.emit("导航栏已隐藏")
-        else:
-            self.ui_log.appendPlainText("操作失败")
-            self.log_signal.emit("切换导航栏失败")
+        self._run_ui_command("切换导航栏可见性", "shell settings put global policy_control immersive.navigation=*",
+                             "导航栏已隐藏", "切换导航栏失败")
 
     def _toggle_lockscreen(self):
         """切换锁屏样式"""
@@ -2568,14 +2694,7 @@ class FlashTool(QMainWindow):
 
     def _toggle_settings(self):
         """重置设置应用"""
-        self.log_signal.emit("重置设置应用...")
-        result = self.flashing_toolbox.platform_tools.execute_adb_command("shell pm clear com.android.settings")
-        if result and result['success']:
-            self.ui_log.appendPlainText("设置应用已重置")
-            self.log_signal.emit("设置应用已重置")
-        else:
-            self.ui_log.appendPlainText("操作失败")
-            self.log_signal.emit("重置设置应用失败")
+        self._run_ui_command("重置设置应用", "shell pm clear com.android.settings", "设置应用已重置", "重置设置应用失败")
 
     def _toggle_notification(self):
         """切换通知中心样式"""
@@ -2583,8 +2702,8 @@ class FlashTool(QMainWindow):
         self.ui_log.appendPlainText("通知中心样式已切换")
         self.log_signal.emit("通知中心样式已切换")
 
-    def _execute_flash(self):
-        """执行刷机"""
+    def _execute_flash(self, token):
+        """执行刷机, 取消后在当前分区写完时停止"""
         try:
             partition = self.partition_combo.currentText()
             self.log_signal.emit(f"开始刷写 {partition} 分区...")
@@ -2594,126 +2713,169 @@ class FlashTool(QMainWindow):
             if partition != "全部" and (self.firmware_path.lower().endswith('.img') or
                                         self.firmware_path.lower().endswith('.bin')):
                 self.log_signal.emit(f"正在刷入 {partition} 分区...")
+                self._check_image_size(os.path.getsize(self.firmware_path))
 
-                # 检查文件大小
-                file_size = os.path.getsize(self.firmware_path)
-                if file_size > 100 * 1024 * 1024:  # 大于100MB
-                    self.log_signal.emit(f"大文件刷写 ({file_size // 1024 // 1024}MB)，请保持USB连接稳定...")
-
-                if self.flashing_toolbox.platform_tools.flash_partition(partition, self.firmware_path):
+                if self._flash_images([(partition, self.firmware_path)], token=token):
                     self.log_signal.emit(f"{partition} 分区刷入成功!")
-                    self.progress_signal.emit(100)
-                else:
-                    self.log_signal.emit(f"刷入失败: {self.flashing_toolbox.platform_tools.last_error}")
-                    self.progress_signal.emit(0)
             else:
-                # 处理固件包（zip/tar.gz等）
-                temp_dir = tempfile.mkdtemp(prefix="firmware_")
-                try:
-                    # 解压固件包
-                    if self.firmware_path.lower().endswith('.zip'):
-                        with zipfile.ZipFile(self.firmware_path, 'r') as zip_ref:
-                            zip_ref.extractall(temp_dir)
-                    elif self.firmware_path.lower().endswith('.tar.gz') or self.firmware_path.lower().endswith('.tgz'):
-                        with tarfile.open(self.firmware_path, 'r:gz') as tar_ref:
-                            tar_ref.extractall(temp_dir)
-                    else:
-                        temp_dir = os.path.dirname(self.firmware_path)
-
+                # 处理固件包（zip/tar.gz等）: 直接从包内读取镜像, 不再整体解压到临时目录
+                with FirmwarePackage(self.firmware_path, cache=self.firmware_cache) as package:
                     if partition == "全部":
                         # 查找所有镜像文件
-                        img_files = []
-                        for root, dirs, files in os.walk(temp_dir):
-                            for file in files:
-                                if file.lower().endswith('.img') or file.lower().endswith('.bin'):
-                                    img_files.append(os.path.join(root, file))
-
-                        if not img_files:
+                        members = package.images()
+                        if not members:
                             self.log_signal.emit("在固件包中未找到任何镜像文件")
                             return
 
-                        total = len(img_files)
-                        for i, img_file in enumerate(img_files):
-                            # 提取分区名（不带扩展名）
-                            partition_name = os.path.splitext(os.path.basename(img_file))[0]
-                            self.log_signal.emit(f"正在刷写分区: {partition_name}")
-
-                            # 检查文件大小
-                            file_size = os.path.getsize(img_file)
-                            if file_size > 100 * 1024 * 1024:  # 大于100MB
-                                self.log_signal.emit(f"大文件刷写 ({file_size // 1024 // 1024}MB)，请保持USB连接稳定...")
-
-                            if self.flashing_toolbox.platform_tools.flash_partition(partition_name, img_file):
-                                self.log_signal.emit(f"{partition_name} 刷写成功")
-                            else:
-                                self.log_signal.emit(f"{partition_name} 刷写失败: {self.flashing_toolbox.platform_tools.last_error}")
-
-                            # 更新进度
-                            progress = int((i + 1) / total * 100)
-                            self.progress_signal.emit(progress)
-
-                        self.log_signal.emit("所有分区刷写完成")
+                        images = []
+                        for member in members:
+                            self._check_image_size(member.size)
+                            images.append((member.partition, member))
+
+                        # 解压/校验下一个分区与刷写当前分区同时进行
+                        if self._flash_images(images, prefetch=int(self.settings.value("flash_prefetch_depth", 2)),
+                                             token=token):
+                            self.log_signal.emit("所有分区刷写完成")
+                        elif not token.cancelled:
+                            self.log_signal.emit("部分分区刷写失败, 请查看上面的错误信息")
                     else:
                         # 查找特定分区镜像
-                        img_file = None
-                        for root, dirs, files in os.walk(temp_dir):
-                            for file in files:
-                                if file.lower().endswith(f"{partition}.img") or file.lower().endswith(
-                                        f"{partition}.bin"):
-                                    img_file = os.path.join(root, file)
-                                    break
-                            if img_file:
-                                break
-
-                        if img_file:
-                            self.log_signal.emit(f"找到分区镜像: {os.path.basename(img_file)}")
-                            self.progress_signal.emit(50)
-
-                            # 检查文件大小
-                            file_size = os.path.getsize(img_file)
-                            if file_size > 100 * 1024 * 1024:  # 大于100MB
-                                self.log_signal.emit(f"大文件刷写 ({file_size // 1024 // 1024}MB)，请保持USB连接稳定...")
-
-                            if self.flashing_toolbox.platform_tools.flash_partition(partition, img_file):
+                        member = package.find_image(partition)
+                        if member:
+                            self.log_signal.emit(f"找到分区镜像: {member.basename}")
+                            self._check_image_size(member.size)
+
+                            if self._flash_images([(partition, member)], token=token):
                                 self.log_signal.emit(f"{partition} 分区刷入成功!")
-                                self.progress_signal.emit(100)
-                            else:
-                                self.log_signal.emit(f"{partition} 分区刷入失败: {self.flashing_toolbox.platform_tools.last_error}")
-                                self.progress_signal.emit(0)
                         else:
                             self.log_signal.emit(f"在固件包中未找到 {partition} 分区镜像")
-                finally:
-                    if temp_dir != os.path.dirname(self.firmware_path):
-                        shutil.rmtree(temp_dir, ignore_errors=True)
         except Exception as e:
             self.log_signal.emit(f"刷机失败: {str(e)}")
             self.progress_signal.emit(0)
-        finally:
-            self.operation_in_progress = False
 
-    def _execute_xiaomi_flashing(self):
+    def _execute_delta_flash(self, token):
+        """增量刷写: 在ADB模式下读取设备分区哈希, 重启到Fastboot后只写入有变化的块"""
+        platform_tools = self.flashing_toolbox.platform_tools
+        serial = self.device_id
+        try:
+            partition = self.partition_combo.currentText()
+            self.progress_signal.emit(0)
+            with ExitStack() as stack:
+                if partition != "全部" and self.firmware_path.lower().endswith(('.img', '.bin')):
+                    images = [(partition, self.firmware_path, os.path.getsize(self.firmware_path))]
+                else:
+                    package = stack.enter_context(FirmwarePackage(self.firmware_path, cache=self.firmware_cache))
+                    members = package.images() if partition == "全部" else \
+                        [member for member in [package.find_image(partition)] if member]
+                    images = [(member.partition, member, member.size) for member in members]
+                if not images:
+                    self.log_signal.emit("在固件包中未找到任何镜像文件")
+                    return
+
+                # 第一步: 在ADB模式下读取设备上各分区的区域哈希
+                hashes = {}
+                for name, source, size in images:
+                    if not delta_supported(name):
+                        # 系统运行时可写的分区在重启前后内容会变化, 按旧哈希只写部分块会得到新旧混合的数据
+                        hashes[name] = None
+                        self.log_signal.emit(f"{name}: 可读写分区不支持增量刷写, 将完整刷写")
+                        continue
+                    self.log_signal.emit(f"正在读取设备 {name} 分区哈希...")
+                    hashes[name] = platform_tools.partition_hashes(name, size, serial)
+                    if hashes[name] is None:
+                        self.log_signal.emit(f"{name}: {platform_tools.last_error}, 将完整刷写")
+
+                # 第二步: 重启到Fastboot
+                self.log_signal.emit("正在重启到Fastboot...")
+                success, error = platform_tools.adb_reboot("bootloader")
+                if not success:
+                    self.log_signal.emit(f"重启到Fastboot失败: {error}")
+                    return
+                deadline = time.time() + 60
+                while not any(device[0] == serial for device in platform_tools.get_fastboot_devices()):
+                    if time.time() > deadline:
+                        self.log_signal.emit("等待Fastboot设备超时")
+                        return
+                    if not token.sleep(1):
+                        return
+
+                # 第三步: 只写入有变化的区域
+                total_written = total_size = 0
+                for i, (name, source, size) in enumerate(images):
+                    def on_chunk(sent, chunk_total, speed, i=i):
+                        self.progress_signal.emit(int((i + sent / max(chunk_total, 1)) / len(images) * 100))
+
+                    with (nullcontext(source) if isinstance(source, str) else source.extract()) as image_path:
+                        if hashes[name] is None:
+                            success, written = platform_tools.flash_partition(name, image_path, serial, on_chunk), size
+                        else:
+                            success, written = platform_tools.flash_partition_delta(name, image_path, hashes[name],
+                                                                                    serial, on_chunk)
+                    if not success:
+                        self.log_signal.emit(f"{name} 刷写失败: {platform_tools.last_error}")
+                        return
+                    total_written += written
+                    total_size += size
+                    self.log_signal.emit(f"{name} 刷写成功: 写入 {written // 1024 // 1024}MB / {size // 1024 // 1024}MB")
+                    self.progress_signal.emit(int((i + 1) / len(images) * 100))
+                self.log_signal.emit(f"增量刷写完成: 共写入 {total_written // 1024 // 1024}MB / "
+                                     f"{total_size // 1024 // 1024}MB")
+        except Exception as e:
+            self.log_signal.emit(f"增量刷写失败: {str(e)}")
+            self.progress_signal.emit(0)
+
+    def _check_image_size(self, file_size):
+        """大文件刷写提示"""
+        if file_size > 100 * 1024 * 1024:  # 大于100MB
+            self.log_signal.emit(f"大文件刷写 ({file_size // 1024 // 1024}MB)，请保持USB连接稳定...")
+
+    def _flash_images(self, images, prefetch=0, token=None):
+        """将镜像并行刷入所有已连接的Fastboot设备, 全部成功时返回True; token被取消时不再开始新的分区"""
+        scheduler = FlashScheduler(
+            self.flashing_toolbox.platform_tools,
+            max_workers=int(self.settings.value("max_parallel_flash", 8)),
+            progress_callback=lambda serial, percent: self.progress_signal.emit(scheduler.total_progress()),
+            log_callback=lambda serial, message: self.log_signal.emit(f"[{serial}] {message}" if serial else message)
+        )
+
+        # 未检测到设备时交给flash_partition的重试机制等待设备
+        serials = scheduler.get_serials() or [None]
+        if len(serials) > 1:
+            self.log_signal.emit(f"检测到 {len(serials)} 台Fastboot设备，开始并行刷写...")
+
+        results = scheduler.flash_all(images, serials, prefetch=prefetch, token=token)
+        if prefetch > 0:
+            self.log_signal.emit(scheduler.timeline.format_report())
+        failed = [serial for serial, success in results.items() if not success]
+        for serial in failed:
+            prefix = f"[{serial}] " if serial else ""
+            self.log_signal.emit(f"{prefix}刷入失败: {'; '.join(scheduler.errors.get(serial, []))}")
+
+        if len(serials) > 1:
+            self.log_signal.emit(f"并行刷写完成: 成功 {len(results) - len(failed)}/{len(results)} 台设备")
+        if failed and len(images) == 1:
+            self.progress_signal.emit(0)
+        return not failed
+
+    def _execute_xiaomi_flashing(self, token):
         """执行小米线刷"""
         try:
             self.log_signal.emit("开始小米线刷...")
-            self.xiaomi_progress_bar.setValue(0)
+            self.progress_signal.emit(0)
 
-            # 解压线刷包
+            if not (self.xiaomi_flash_path.endswith('.tgz') or self.xiaomi_flash_path.endswith('.tar.gz')):
+                self.log_signal.emit("不支持的小米线刷包格式")
+                return
+
+            # 刷机脚本需要完整目录, 先按索引确认有flash_all脚本再解压
             temp_dir = tempfile.mkdtemp(prefix="xiaomi_flash_")
             try:
-                if self.xiaomi_flash_path.endswith('.tgz') or self.xiaomi_flash_path.endswith('.tar.gz'):
-                    with tarfile.open(self.xiaomi_flash_path, 'r:gz') as tar_ref:
-                        tar_ref.extractall(temp_dir)
-                else:
-                    self.log_signal.emit("不支持的小米线刷包格式")
-                    return
-
-                # 查找flash_all脚本
-                flash_script = None
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        if file.startswith("flash_all") and (file.endswith(".bat") or file.endswith(".sh")):
-                            flash_script = os.path.join(root, file)
-                            break
+                with FirmwarePackage(self.xiaomi_flash_path) as package:
+                    script_member = package.find(
+                        lambda file: file.startswith("flash_all") and (file.endswith(".bat") or file.endswith(".sh")))
+                    if script_member:
+                        package.extract_all(temp_dir)
+                flash_script = os.path.join(temp_dir, script_member.name) if script_member else None
 
                 if flash_script:
                     self.log_signal.emit(f"正在执行刷机脚本: {os.path.basename(flash_script)}")
@@ -2726,93 +2888,90 @@ class FlashTool(QMainWindow):
                     else:
                         cmd = [sys.executable, flash_script]
 
-                    # 执行刷机命令
-                    process = subprocess.Popen(cmd, cwd=temp_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                               text=True, encoding='utf-8', errors='ignore')
+                    # 执行刷机命令: stdout和stderr(fastboot的进度输出在stderr)都逐行进入日志, 取消任务时终止脚本
+                    def log_line(line):
+                        if line.strip():
+                            self.log_signal.emit(line.strip())
 
-                    # 读取输出并更新日志
-                    while True:
-                        output = process.stdout.readline()
-                        if output == '' and process.poll() is not None:
-                            break
-                        if output:
-                            self.log_signal.emit(output.strip())
+                    result = self._job_runner(token).run(cmd, timeout=None, on_stdout=log_line, on_stderr=log_line,
+                                                         cwd=temp_dir)
 
                     # 检查结果
-                    if process.returncode == 0:
+                    if result['success']:
                         self.log_signal.emit("小米线刷完成!")
-                        self.xiaomi_progress_bar.setValue(100)
-                    else:
-                        self.log_signal.emit(f"小米线刷失败，返回码: {process.returncode}")
-                        self.xiaomi_progress_bar.setValue(0)
+                        self.progress_signal.emit(100)
+                    elif not result['cancelled']:
+                        self.log_signal.emit(f"小米线刷失败，返回码: {result['returncode']}")
+                        self.progress_signal.emit(0)
                 else:
                     self.log_signal.emit("在刷机包中未找到flash_all脚本")
             finally:
                 shutil.rmtree(temp_dir, ignore_errors=True)
         except Exception as e:
             self.log_signal.emit(f"小米线刷失败: {str(e)}")
-            self.xiaomi_progress_bar.setValue(0)
-        finally:
-            self.operation_in_progress = False
+            self.progress_signal.emit(0)
 
-    def _execute_recovery_flash(self):
+    def _execute_recovery_flash(self, token):
         """执行Recovery卡刷"""
         try:
             self.log_signal.emit("开始Recovery卡刷...")
-            self.recovery_progress_bar.setValue(0)
+            self.progress_signal.emit(0)
 
             # 推送卡刷包到设备
             self.log_signal.emit("推送卡刷包到设备...")
             remote_path = "/sdcard/recovery_flash.zip"
-            result = self.flashing_toolbox.platform_tools.execute_adb_command(f"push \"{self.recovery_file_path}\" {remote_path}")
+            result = self.flashing_toolbox.platform_tools.execute_adb_command(
+                f"push \"{self.recovery_file_path}\" {remote_path}", runner=self._job_runner(token))
 
             if result and result['success']:
-                self.recovery_progress_bar.setValue(30)
+                self.progress_signal.emit(30)
                 self.log_signal.emit("卡刷包推送成功")
 
                 # 进入Recovery模式
                 self.log_signal.emit("重启设备到Recovery模式...")
                 success, error = self.flashing_toolbox.platform_tools.adb_reboot("recovery")
                 if success:
-                    self.recovery_progress_bar.setValue(50)
+                    self.progress_signal.emit(50)
                     self.log_signal.emit("设备已重启到Recovery模式")
 
                     # 等待设备进入Recovery
-                    time.sleep(10)
+                    if not token.sleep(10):
+                        return
 
                     # 执行刷机命令
                     self.log_signal.emit("开始刷入卡刷包...")
-                    result = self.flashing_toolbox.platform_tools.execute_adb_command("recovery --update_package=/sdcard/recovery_flash.zip")
+                    result = self.flashing_toolbox.platform_tools.execute_adb_command(
+                        "recovery --update_package=/sdcard/recovery_flash.zip", runner=self._job_runner(token))
                     if result and result['success']:
-                        self.recovery_progress_bar.setValue(100)
+                        self.progress_signal.emit(100)
                         self.log_signal.emit("卡刷包刷入成功! 设备将自动重启")
-                    else:
+                    elif not token.cancelled:
                         self.log_signal.emit("卡刷包刷入失败")
                 else:
                     self.log_signal.emit(f"重启到Recovery失败: {error}")
-            else:
+            elif not token.cancelled:
                 self.log_signal.emit("卡刷包推送失败")
         except Exception as e:
             self.log_signal.emit(f"Recovery卡刷失败: {str(e)}")
-        finally:
-            self.operation_in_progress = False
 
     def closeEvent(self, event):
         """关闭事件处理"""
-        if self.operation_in_progress:
-            QMessageBox.warning(self, "警告", "请等待当前操作完成")
+        # 持续检测可以直接停止, 其他操作需要等待完成
+        self._stop_detect_mtk()
+        # 已取消的可中断任务会很快结束, 读取设备信息在关闭时直接取消; 刷机任务取消后仍要写完当前分区, 必须等待
+        running = [job.name for job in self.jobs.jobs()
+                   if job.device != DETAILS_DEVICE and not (job.interruptible and job.token.cancelled)]
+        if running:
+            QMessageBox.warning(self, "警告", f"请等待当前操作完成: {', '.join(running)}")
             event.ignore()
         else:
-            # 停止设备检测线程
+            # 停止设备监视
             self.running = False
-            # 等待线程结束，最多1秒
-            if hasattr(self, 'check_thread') and self.check_thread.is_alive():
-                self.check_thread.join(timeout=1.0)
+            self._stop_device_check()
 
             # 终止正在运行的MTK命令
-            if self.mtk_process and self.mtk_process.poll() is None:
-                try:
-                    self.mtk_process.terminate()
-                except:
-                    pass
+            self.jobs.shutdown()
+            if self.flashing_toolbox.mtk_client:
+                self.flashing_toolbox.mtk_client.close()
+            self.session_logger.close()
             event.accept()
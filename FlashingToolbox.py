@@ -1,12 +1,24 @@
 from Tool import MTKClientTool
 from Tool import PlatformTools
+from Tool import ToolRegistry
 
 class FlashingToolbox:
-    def __init__(self, platform_tools: PlatformTools, mtk_client: MTKClientTool):
+    def __init__(self, platform_tools: PlatformTools, mtk_client: MTKClientTool, registry: ToolRegistry = None,
+                 resolve: bool = True):
         self.platform_tools = platform_tools
         self.mtk_client = mtk_client
-        if not self.platform_tools.change_path_to_available():
+        if resolve:
+            self.resolve(registry)
+
+    def resolve(self, registry: ToolRegistry = None):
+        """查找可用的工具路径, 找不到的工具置为None"""
+        if registry is not None:
+            # 通过索引解析工具路径, 文件未变化时不启动任何进程
+            platform_ok, mtk_ok = registry.resolve_all([self.platform_tools, self.mtk_client])
+        else:
+            platform_ok = self.platform_tools.change_path_to_available()
+            mtk_ok = self.mtk_client.change_path_to_available()
+        if not platform_ok:
             self.platform_tools = None
-        if not self.mtk_client.change_path_to_available():
+        if not mtk_ok:
             self.mtk_client = None
-
@@ -0,0 +1,175 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, Signal
+
+GLOBAL_DEVICE = ""  # 不属于某台设备的任务
+
+
+class JobCancelled(Exception):
+    """任务在检查点发现已被取消"""
+
+
+class CancelToken:
+    """取消标记: 任务在适当的位置检查cancelled, 取消时立即调用注册的回调(如终止正在运行的子进程)"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        """注册取消回调, 已取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+    def sleep(self, seconds: float) -> bool:
+        """可被取消打断的等待, 被取消时返回False"""
+        return not self._event.wait(seconds)
+
+
+class Job:
+    """一个设备操作: 在线程池中运行 fn(token, *args), 结束后在界面线程调用 on_done(job)"""
+
+    def __init__(self, job_id: int, name: str, device: str, fn, args, on_done=None, interruptible: bool = True):
+        self.id = job_id
+        self.name = name
+        self.device = device
+        self.interruptible = interruptible  # False: 取消后仍要等到下一个检查点(如当前分区写完)才会结束
+        self.token = CancelToken()
+        self.state = "queued"  # queued / running / done / failed / cancelled
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._fn = fn
+        self._args = args
+        self._on_done = on_done
+
+    @property
+    def succeeded(self) -> bool:
+        return self.state == "done"
+
+    def cancel(self):
+        self.token.cancel()
+
+
+class JobExecutor(QObject):
+    """设备操作的线程池: 每台设备同一时间只运行一个任务, 任务可取消, 开始和结束通过Qt信号通知界面线程"""
+
+    job_started = Signal(object)  # Job
+    job_finished = Signal(object)  # Job
+    busy_changed = Signal(str, bool)  # 设备, 是否有任务
+
+    def __init__(self, max_workers: int = 4, parent=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._ids = itertools.count(1)
+        self._jobs = {}  # 设备 -> 正在排队或运行的任务
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # 回调在接收者(本对象, 属于界面线程)所在线程执行
+        self.job_finished.connect(self._dispatch)
+
+    def submit(self, name: str, fn, *args, device: str = GLOBAL_DEVICE, on_done=None,
+               interruptible: bool = True) -> Job | None:
+        """提交任务, 该设备已有任务时返回None"""
+        device = device or GLOBAL_DEVICE
+        with self._lock:
+            if device in self._jobs:
+                return None
+            job = Job(next(self._ids), name, device, fn, args, on_done, interruptible)
+            self._jobs[device] = job
+        self.busy_changed.emit(device, True)
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job):
+        if job.token.cancelled:
+            job.state = "cancelled"
+        else:
+            job.state = "running"
+            job.started = time.time()
+            self.job_started.emit(job)
+            self._local.job = job
+            try:
+                job.result = job._fn(job.token, *job._args)
+                job.state = "cancelled" if job.token.cancelled else "done"
+            except JobCancelled:
+                job.state = "cancelled"
+            except Exception as e:
+                job.error = str(e)
+                job.state = "failed"
+            finally:
+                self._local.job = None
+        job.finished = time.time()
+        with self._lock:
+            if self._jobs.get(job.device) is job:
+                del self._jobs[job.device]
+        self.busy_changed.emit(job.device, False)
+        self.job_finished.emit(job)
+
+    def _dispatch(self, job: Job):
+        if job._on_done:
+            job._on_done(job)
+
+    def current_job(self) -> Job | None:
+        """当前线程正在运行的任务"""
+        return getattr(self._local, "job", None)
+
+    def is_busy(self, device: str = None) -> bool:
+        """device为None时表示是否有任何任务"""
+        with self._lock:
+            if device is None:
+                return bool(self._jobs)
+            return (device or GLOBAL_DEVICE) in self._jobs
+
+    def job(self, device: str = GLOBAL_DEVICE) -> Job | None:
+        with self._lock:
+            return self._jobs.get(device or GLOBAL_DEVICE)
+
+    def jobs(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, device: str = GLOBAL_DEVICE) -> bool:
+        """取消设备上的任务"""
+        job = self.job(device)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def cancel_all(self):
+        for job in self.jobs():
+            job.cancel()
+
+    def shutdown(self, wait: bool = False):
+        self.cancel_all()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,68 @@
+import threading
+import time
+
+DEFAULT_CAPACITY = 100000
+
+
+class LogRecord:
+    __slots__ = ("seq", "time", "message")
+
+    def __init__(self, seq: int, timestamp: float, message: str):
+        self.seq = seq
+        self.time = timestamp
+        self.message = message
+
+    def format(self) -> str:
+        return f"{time.strftime('%H:%M:%S', time.localtime(self.time))} {self.message}"
+
+
+class LogBuffer:
+    """定长环形日志缓冲: 任意线程追加, 读取方不加锁按序号增量获取, 超出容量后最早的记录被覆盖
+
+    写入方在锁内分配序号、写入槽位并推进head, head始终是已写入的最大序号+1;
+    读取时槽位中记录的序号与预期不符说明尚未写入或已被覆盖
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = max(1, capacity)
+        self._slots = [None] * self.capacity
+        self._lock = threading.Lock()
+        self.head = 0  # 已写入的最大序号+1
+
+    def append(self, message: str) -> LogRecord:
+        """追加一条日志, 耗时与缓冲中已有多少记录无关"""
+        timestamp = time.time()
+        with self._lock:
+            seq = self.head
+            record = LogRecord(seq, timestamp, message)
+            self._slots[seq % self.capacity] = record
+            self.head = seq + 1
+        return record
+
+    def oldest(self) -> int:
+        """仍在缓冲中的最早序号"""
+        return max(0, self.head - self.capacity)
+
+    def read(self, start: int, limit: int = None) -> list[LogRecord]:
+        """按顺序读取序号>=start的记录; 读取方落后超过容量时从最早仍可用的记录开始"""
+        seq = max(start, self.oldest())
+        records = []
+        while limit is None or len(records) < limit:
+            record = self._slots[seq % self.capacity]
+            if record is None or record.seq < seq:
+                break  # 该序号还没写入
+            if record.seq > seq:
+                # 读取期间槽位被新记录覆盖, 跳到覆盖它的记录之后仍在缓冲中的最早记录, 每次都向前推进
+                seq = max(self.oldest(), record.seq - self.capacity + 1)
+                continue
+            records.append(record)
+            seq += 1
+        return records
+
+    def last(self) -> LogRecord | None:
+        if self.head == 0:
+            return None
+        return self._slots[(self.head - 1) % self.capacity]
+
+    def __len__(self) -> int:
+        return self.head - self.oldest()
@@ -0,0 +1,87 @@
+from collections import deque
+
+from PySide6.QtCore import QObject, QTimer, Signal
+from PySide6.QtGui import QTextCursor
+
+FLUSH_INTERVAL = 100  # 毫秒
+MAX_LINES = 20000  # 输出框最多保留的行数
+
+
+class OutputSink(QObject):
+    """合并输出: 任意线程write()只做入队, 界面线程定时把积累的行用一次QTextCursor插入追加到输出框
+
+    输出框(QTextEdit/QPlainTextEdit)只保留最近max_lines行, 来不及显示的行也最多缓存max_lines行;
+    没有新输出时定时器停止, 有新输出时再启动
+    """
+
+    _wake = Signal()
+
+    def __init__(self, widget=None, interval: int = FLUSH_INTERVAL, max_lines: int = MAX_LINES, parent=None):
+        super().__init__(parent)
+        self.max_lines = max(1, max_lines)
+        self.widget = None
+        self._lines = deque(maxlen=self.max_lines)
+        self._armed = False
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.flush)
+        # 在其他线程发出时排队到本对象所在的界面线程
+        self._wake.connect(self._arm)
+        if widget is not None:
+            self.attach(widget)
+
+    def attach(self, widget):
+        """绑定输出框, 之前缓存的行在下次刷新时显示"""
+        self.widget = widget
+        widget.document().setMaximumBlockCount(self.max_lines)
+        self._armed = False
+        if self._lines:
+            self._arm()
+
+    def write(self, line: str):
+        """追加一行, 可在任意线程调用"""
+        self._lines.append(line)
+        if not self._armed:
+            self._armed = True
+            self._wake.emit()
+
+    def _arm(self):
+        self._armed = True
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def clear(self):
+        """丢弃未显示的行并清空输出框, 只在界面线程调用"""
+        self._lines.clear()
+        if self.widget is not None:
+            self.widget.clear()
+
+    def flush(self):
+        """把缓存的行一次性插入输出框末尾, 原本停在底部时保持滚动到底部"""
+        if self.widget is None:
+            self._timer.stop()  # 保持_armed, 绑定输出框时再启动
+            return
+        if not self._lines:
+            self._timer.stop()
+            self._armed = False
+            # 判断为空之后、清除_armed之前写入的行不会再唤醒定时器
+            if self._lines:
+                self._arm()
+            return
+
+        lines = []
+        while self._lines:
+            lines.append(self._lines.popleft())
+
+        scrollbar = self.widget.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 2
+        document = self.widget.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.beginEditBlock()
+        if not document.isEmpty():
+            cursor.insertBlock()
+        cursor.insertText("\n".join(lines[-self.max_lines:]))
+        cursor.endEditBlock()
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
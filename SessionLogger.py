@@ -0,0 +1,211 @@
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+
+MAX_BYTES = 16 * 1024 * 1024  # 单个日志文件的大小上限, 超出后轮转并压缩
+KEEP_FILES = 50  # 最多保留的日志文件数
+FLUSH_INTERVAL = 1.0  # 秒, 崩溃时最多丢失这段时间的日志
+BATCH_SIZE = 1000  # 每次最多写入的条数, 轮转检查不会被一大批日志推迟
+
+ERROR_WORDS = ("失败", "错误", "异常", "error", "Error", "failed", "FAILED")
+WARNING_WORDS = ("警告", "超时", "取消", "已终止", "warning", "Warning")
+
+
+SESSION_NAME = re.compile(r"session-\d{8}-\d{6}-(\d+)-\d+\.jsonl$")
+
+
+def pid_alive(pid: int) -> bool:
+    """进程是否仍在运行"""
+    if pid == os.getpid():
+        return True
+    if sys.platform == "win32":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def level_of(message: str) -> str:
+    """根据日志内容判断严重程度"""
+    if any(word in message for word in ERROR_WORDS):
+        return "error"
+    if any(word in message for word in WARNING_WORDS):
+        return "warning"
+    return "info"
+
+
+class SessionLogger:
+    """会话日志: 任意线程调用log()只做入队, 后台线程写入JSON-lines文件, 按大小轮转, 轮转后的文件压缩为.gz
+
+    每行: {"ts", "level", "source", "device", "job", "op", "msg"}
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = MAX_BYTES, keep: int = KEEP_FILES,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.directory = directory or "logs"
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.flush_interval = flush_interval
+        self.session = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        self.last_error = None
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._file = None
+        self._path = None
+        self._index = 0
+        self._written = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-log", daemon=True)
+            self._thread.start()
+
+    def log(self, message: str, level: str = None, source: str = "app", device: str = None,
+            job: int = None, op: str = None):
+        """记录一条日志, 不做任何文件操作"""
+        self._queue.put((time.time(), level or level_of(message), source, device, job, op, message))
+
+    def close(self, timeout: float = 5):
+        """写完队列中剩余的日志并关闭当前文件"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def files(self) -> list[str]:
+        """所有日志文件, 按时间排序"""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith((".jsonl", ".jsonl.gz"))]
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    @property
+    def current_path(self) -> str | None:
+        return self._path
+
+    # ---- 后台线程 ----
+
+    def _run(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # 上次异常退出时留下的未压缩文件; 其他正在运行的实例的当前文件不能动
+            for path in self.files():
+                if path.endswith(".jsonl") and not self._in_use(path):
+                    self._compress(path)
+        except OSError as e:
+            self.last_error = str(e)
+
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            batch = []
+            while item is not None:
+                if item:
+                    batch.append(item)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if item is None:
+                running = False
+
+            try:
+                if batch:
+                    self._write(batch)
+                if self._file is not None and (not running or time.monotonic() - last_flush >= self.flush_interval):
+                    self._file.flush()
+                    last_flush = time.monotonic()
+            except OSError as e:
+                self.last_error = str(e)
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            # 正常退出时当前文件也压缩
+            self._compress(self._path)
+
+    def _write(self, batch):
+        lines = []
+        for timestamp, level, source, device, job, op, message in batch:
+            entry = {"ts": round(timestamp, 3), "level": level, "source": source, "msg": message}
+            if device:
+                entry["device"] = device
+            if job is not None:
+                entry["job"] = job
+                entry["op"] = op
+            lines.append(json.dumps(entry, ensure_ascii=False))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+
+        if self._file is None:
+            self._open()
+        self._file.write(data)
+        self._written += len(data)
+        if self._written >= self.max_bytes:
+            self._rotate()
+
+    def _open(self):
+        self._index += 1
+        self._path = os.path.join(self.directory, f"session-{self.session}-{self._index:03d}.jsonl")
+        self._file = open(self._path, 'ab')
+        self._written = 0
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        self._compress(self._path)
+        self._prune()
+
+    @staticmethod
+    def _in_use(path: str) -> bool:
+        """未压缩的文件是否属于仍在运行的实例(会话名中包含进程号)"""
+        match = SESSION_NAME.search(os.path.basename(path))
+        if match is None:
+            return False
+        return pid_alive(int(match.group(1)))
+
+    def _compress(self, path: str):
+        try:
+            with open(path, 'rb') as src, gzip.open(path + ".gz.tmp", 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(path + ".gz.tmp", path + ".gz")
+            os.remove(path)
+        except OSError as e:
+            self.last_error = str(e)
+
+    def _prune(self):
+        files = self.files()
+        for path in files[:max(0, len(files) - self.keep)]:
+            if path.endswith(".jsonl") and self._in_use(path):
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.last_error = str(e)
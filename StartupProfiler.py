@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+HISTORY_SIZE = 20  # 保留最近几次启动的记录, 用于对比回归
+
+
+class StartupProfiler:
+    """启动时间线: 记录各阶段耗时和可交互时间(time-to-interactive), 写入文件便于对比"""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join("cache", "startup_profile.json")
+        self.start_time = time.perf_counter()
+        self.run_id = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.phases = []  # [(阶段, 开始, 结束)], 相对启动时刻的秒数
+        self.interactive = None
+        self.last_error = None
+        self._last_mark = self.start_time
+        self._lock = threading.Lock()
+        self.listener = None  # (阶段, 耗时ms), 用于显示在启动画面上
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def record(self, name: str, start: float, end: float):
+        """记录一个阶段, start/end为perf_counter时刻"""
+        with self._lock:
+            self.phases.append((name, start - self.start_time, end - self.start_time))
+        if self.listener:
+            self.listener(name, (end - start) * 1000)
+
+    def mark(self, name: str):
+        """记录从上一个标记到现在的阶段"""
+        now = time.perf_counter()
+        start, self._last_mark = self._last_mark, now
+        self.record(name, start, now)
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录with块的耗时, 可在后台线程中使用"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def finish(self):
+        """主窗口已显示并开始处理事件"""
+        self.interactive = self.elapsed()
+        self.save()
+
+    def report(self) -> dict:
+        with self._lock:
+            phases = [{"name": name, "start": round(start * 1000, 1), "ms": round((end - start) * 1000, 1)}
+                      for name, start, end in self.phases]
+        return {
+            "run": self.run_id,
+            "interactive_ms": round(self.interactive * 1000, 1) if self.interactive is not None else None,
+            "phases": phases,
+        }
+
+    def format_report(self) -> str:
+        report = self.report()
+        phases = ", ".join(f"{phase['name']} {phase['ms']:.0f}ms" for phase in report["phases"])
+        if report["interactive_ms"] is None:
+            # 尚未调用finish()
+            return f"启动耗时: {phases}"
+        return f"启动耗时: 可交互 {report['interactive_ms']:.0f}ms ({phases})"
+
+    def save(self) -> bool:
+        """写入本次启动的时间线, 同一次启动重复保存时覆盖"""
+        try:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    runs = json.load(f).get("runs", [])
+            except (OSError, ValueError):
+                runs = []
+            report = self.report()
+            if runs and runs[-1].get("run") == report["run"]:
+                runs[-1] = report
+            else:
+                runs.append(report)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump({"runs": runs[-HISTORY_SIZE:]}, f, ensure_ascii=False, indent=1)
+            os.replace(self.path + ".tmp", self.path)
+            return True
+        except OSError as e:
+            self.last_error = str(e)
+            return False
@@ -0,0 +1,517 @@
+import bz2
+import lzma
+import os
+import queue
+import struct
+import tarfile
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+
+ZIP_LOCAL_MAGIC = b"PK\x03\x04"
+ZIP_CENTRAL_MAGIC = b"PK\x01\x02"
+ZIP_EOCD_MAGIC = b"PK\x05\x06"
+ZIP64_LOCATOR_MAGIC = b"PK\x06\x07"
+ZIP64_EOCD_MAGIC = b"PK\x06\x06"
+ZIP_EOCD_SEARCH = 22 + 0xFFFF  # EOCD + 最长注释
+ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+ZIP_CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+ZIP_EOCD = struct.Struct("<4s4H2LH")
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_EOCD = struct.Struct("<4sQ2H2L4Q")
+
+TAR_BLOCK = 512
+
+
+def detect_archive(head: bytes) -> str | None:
+    """根据文件开头判断压缩包类型: zip / gz / bz2 / xz / tar"""
+    if head[:4] == ZIP_LOCAL_MAGIC:
+        return "zip"
+    if head[:2] == b"\x1f\x8b":
+        return "gz"
+    if head[:3] == b"BZh":
+        return "bz2"
+    if head[:6] == b"\xfd7zXZ\x00":
+        return "xz"
+    if head[257:262] == b"ustar":
+        return "tar"
+    return None
+
+
+def safe_path(root: str, name: str) -> str | None:
+    """把包内路径映射到解压目录下, 拒绝绝对路径和..等越界路径"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or ".." in parts or ":" in parts[0]:
+        return None
+    return os.path.join(root, *parts)
+
+
+class ZipEntry:
+    """中央目录中的一项"""
+    __slots__ = ("name", "header_offset", "compress_size", "file_size", "method", "crc", "flags")
+
+    def __init__(self, name, header_offset, compress_size, file_size, method, crc, flags):
+        self.name = name
+        self.header_offset = header_offset
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.method = method
+        self.crc = crc
+        self.flags = flags
+
+    @property
+    def is_dir(self) -> bool:
+        return self.name.endswith("/")
+
+
+def locate_central_directory(tail: bytes, tail_offset: int) -> tuple[int, int]:
+    """从压缩包末尾数据中找到EOCD, 返回中央目录的 (偏移, 大小)"""
+    pos = tail.rfind(ZIP_EOCD_MAGIC)
+    if pos < 0 or pos + ZIP_EOCD.size > len(tail):
+        raise ValueError("未找到zip中央目录")
+    _, _, _, _, entries, cd_size, cd_offset, _ = ZIP_EOCD.unpack_from(tail, pos)
+    if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF or entries == 0xFFFF:
+        # zip64: 通过定位记录找到zip64 EOCD
+        locator = pos - ZIP64_LOCATOR.size
+        if locator < 0 or tail[locator:locator + 4] != ZIP64_LOCATOR_MAGIC:
+            raise ValueError("zip64定位记录缺失")
+        _, _, eocd64_offset, _ = ZIP64_LOCATOR.unpack_from(tail, locator)
+        start = eocd64_offset - tail_offset
+        if start < 0 or tail[start:start + 4] != ZIP64_EOCD_MAGIC:
+            raise ValueError("zip64中央目录记录不在末尾数据中")
+        fields = ZIP64_EOCD.unpack_from(tail, start)
+        cd_size, cd_offset = fields[7], fields[8]
+    return cd_offset, cd_size
+
+
+def parse_central_directory(data: bytes) -> list[ZipEntry]:
+    """解析中央目录"""
+    entries = []
+    pos = 0
+    while pos + ZIP_CENTRAL_HEADER.size <= len(data) and data[pos:pos + 4] == ZIP_CENTRAL_MAGIC:
+        (_, _, _, flags, method, _, _, crc, compress_size, file_size,
+         name_len, extra_len, comment_len, _, _, _, header_offset) = ZIP_CENTRAL_HEADER.unpack_from(data, pos)
+        pos += ZIP_CENTRAL_HEADER.size
+        raw_name = data[pos:pos + name_len]
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+        extra = data[pos + name_len:pos + name_len + extra_len]
+        pos += name_len + extra_len + comment_len
+
+        # zip64扩展字段: 按顺序只包含取值为0xFFFFFFFF的字段
+        extra_pos = 0
+        while extra_pos + 4 <= len(extra):
+            tag, size = struct.unpack_from("<2H", extra, extra_pos)
+            if tag == 0x0001:
+                values = iter(struct.unpack_from(f"<{size // 8}Q", extra, extra_pos + 4))
+                if file_size == 0xFFFFFFFF:
+                    file_size = next(values)
+                if compress_size == 0xFFFFFFFF:
+                    compress_size = next(values)
+                if header_offset == 0xFFFFFFFF:
+                    header_offset = next(values)
+                break
+            extra_pos += 4 + size
+        entries.append(ZipEntry(name, header_offset, compress_size, file_size, method, crc, flags))
+    return entries
+
+
+class StreamingExtractor(ABC):
+    """边下载边解压: 下载端按偏移投递数据, 工作线程负责解压; 出错时由调用方回退到下载完成后再解压"""
+
+    READ_SIZE = 1024 * 1024
+    MEMORY_LIMIT = 64 * 1024 * 1024  # 乱序到达、暂存在内存中的数据上限, 超出时放弃流式解压
+
+    def __init__(self, dest: str, archive_path: str):
+        self.dest = dest
+        self.archive_path = archive_path  # 下载中的压缩包, 续传时从中读取已下载部分
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def feed(self, offset: int, data: bytes):
+        """投递刚下载的数据"""
+        self._queue.put(("data", offset, data))
+
+    def feed_file(self, offset: int, length: int):
+        """投递已落盘的数据(续传时之前下载的部分)"""
+        self._queue.put(("file", offset, length))
+
+    def abort(self, reason: str):
+        if self.error is None:
+            self.error = reason
+
+    def finish(self) -> bool:
+        """等待剩余数据处理完毕, 全部成员解压成功时返回True"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self.error is None and not self._complete():
+            self.error = "压缩包数据不完整"
+        self._cleanup()
+        return self.error is None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                kind, offset, payload = item
+                if kind == "data":
+                    self._handle(offset, payload)
+                else:
+                    with open(self.archive_path, 'rb') as f:
+                        f.seek(offset)
+                        end = offset + payload
+                        while offset < end:
+                            data = f.read(min(self.READ_SIZE, end - offset))
+                            if not data:
+                                raise EOFError("已下载部分读取失败")
+                            self._handle(offset, data)
+                            offset += len(data)
+            except Exception as e:
+                self.error = str(e)
+
+    @abstractmethod
+    def _handle(self, offset: int, data: bytes):
+        """处理包内offset处的一段数据"""
+        pass
+
+    @abstractmethod
+    def _complete(self) -> bool:
+        """所有成员是否都已解压完成"""
+        pass
+
+    def _cleanup(self):
+        pass
+
+
+class _ZipMember:
+    """单个zip成员的解压状态, 成员范围内的数据可乱序到达"""
+
+    def __init__(self, entry: ZipEntry, end: int, path: str):
+        self.entry = entry
+        self.end = end  # 成员(含本地文件头)在包内的结束偏移
+        self.path = path
+        self.next = entry.header_offset  # 下一个期望的偏移
+        self.pending = {}  # 乱序到达的数据 {offset: bytes}
+        self.pending_size = 0
+        self.header = bytearray()
+        self.remaining = None  # 尚未处理的压缩数据字节数
+        self.decompressor = None
+        self.output = None
+        self.crc = 0
+        self.done = False
+
+    def receive(self, offset: int, data: bytes):
+        if self.done:
+            return
+        if offset != self.next:
+            self.pending[offset] = data
+            self.pending_size += len(data)
+            return
+        self._process(data)
+        self.next += len(data)
+        while not self.done and self.next in self.pending:
+            data = self.pending.pop(self.next)
+            self.pending_size -= len(data)
+            self._process(data)
+            self.next += len(data)
+
+    def _process(self, data: bytes):
+        if self.remaining is None:
+            self.header += data
+            if len(self.header) < ZIP_LOCAL_HEADER.size:
+                return
+            fields = ZIP_LOCAL_HEADER.unpack_from(self.header)
+            if fields[0] != ZIP_LOCAL_MAGIC:
+                raise ValueError(f"zip本地文件头损坏: {self.entry.name}")
+            data_start = ZIP_LOCAL_HEADER.size + fields[9] + fields[10]
+            if len(self.header) < data_start:
+                return
+            data = bytes(self.header[data_start:])
+            self.header = None
+            self._open()
+        if self.remaining <= 0 or self.done:
+            return
+
+        data = data[:self.remaining]
+        self.remaining -= len(data)
+        output = self.decompressor.decompress(data) if self.decompressor else data
+        self.crc = zlib.crc32(output, self.crc)
+        self.output.write(output)
+        if self.remaining == 0:
+            self._close()
+
+    def _open(self):
+        entry = self.entry
+        if entry.flags & 0x1:
+            raise ValueError(f"不支持加密的zip成员: {entry.name}")
+        if entry.method == 8:
+            self.decompressor = zlib.decompressobj(-15)
+        elif entry.method == 12:
+            self.decompressor = bz2.BZ2Decompressor()
+        elif entry.method != 0:
+            raise ValueError(f"不支持的zip压缩方式 {entry.method}: {entry.name}")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.output = open(self.path + ".part", 'wb')
+        self.remaining = entry.compress_size
+        if self.remaining == 0:
+            self._close()
+
+    def _close(self):
+        if self.decompressor is not None and hasattr(self.decompressor, "flush"):
+            tail = self.decompressor.flush()
+            self.crc = zlib.crc32(tail, self.crc)
+            self.output.write(tail)
+        self.output.close()
+        self.output = None
+        self.pending.clear()
+        self.pending_size = 0
+        if self.crc != self.entry.crc:
+            os.remove(self.path + ".part")
+            raise ValueError(f"CRC校验失败: {self.entry.name}")
+        os.replace(self.path + ".part", self.path)
+        self.done = True
+
+    def discard(self):
+        self.pending.clear()
+        self.pending_size = 0
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+            if os.path.exists(self.path + ".part"):
+                os.remove(self.path + ".part")
+
+
+class ZipStreamExtractor(StreamingExtractor):
+    """按中央目录定位成员, 任一成员的数据全部到达后即解压完成, 与其他成员的下载顺序无关"""
+
+    def __init__(self, dest: str, archive_path: str, entries: list[ZipEntry], cd_offset: int):
+        super().__init__(dest, archive_path)
+        self._members = []
+        for entry in sorted(entries, key=lambda e: e.header_offset):
+            path = safe_path(dest, entry.name)
+            if path is None:
+                continue
+            if entry.is_dir:
+                os.makedirs(path, exist_ok=True)
+                continue
+            self._members.append(_ZipMember(entry, 0, path))
+        for member, following in zip(self._members, self._members[1:]):
+            member.end = following.entry.header_offset
+        if self._members:
+            self._members[-1].end = cd_offset
+        self._starts = [member.entry.header_offset for member in self._members]
+        self._pending_size = 0  # 所有成员暂存的乱序数据
+
+    def _handle(self, offset: int, data: bytes):
+        end = offset + len(data)
+        index = max(0, bisect_right(self._starts, offset) - 1)
+        while index < len(self._members):
+            member = self._members[index]
+            start = member.entry.header_offset
+            if start >= end:
+                break
+            lo, hi = max(start, offset), min(member.end, end)
+            if lo < hi:
+                before = member.pending_size
+                member.receive(lo, data[lo - offset:hi - offset])
+                self._pending_size += member.pending_size - before
+            index += 1
+        if self._pending_size > self.MEMORY_LIMIT:
+            self._cleanup()
+            raise MemoryError("乱序数据过多, 放弃流式解压")
+
+    def _complete(self) -> bool:
+        return all(member.done for member in self._members)
+
+    def _cleanup(self):
+        for member in self._members:
+            member.discard()
+
+
+class TarStreamExtractor(StreamingExtractor):
+    """tar/tar.gz等流式格式只能顺序解压, 乱序到达的分段暂存在内存中, 超出上限时放弃流式解压"""
+
+    def __init__(self, dest: str, archive_path: str, compression: str):
+        super().__init__(dest, archive_path)
+        self.compression = compression
+        self._decompressor = self._new_decompressor()
+        self._position = 0
+        self._pending = {}
+        self._pending_size = 0
+        self._buffer = bytearray()
+        self._state = "header"
+        self._remaining = 0
+        self._padding = 0
+        self._output = None
+        self._entry = None  # (类型, 路径, 权限, 链接目标)
+        self._meta = None  # 正在读取的长文件名/pax扩展头
+        self._long_name = None
+        self._long_link = None
+        self._pax = {}
+        self._finished = False
+
+    def _new_decompressor(self):
+        if self.compression == "gz":
+            return zlib.decompressobj(47)
+        if self.compression == "bz2":
+            return bz2.BZ2Decompressor()
+        if self.compression == "xz":
+            return lzma.LZMADecompressor()
+        return None
+
+    def _handle(self, offset: int, data: bytes):
+        if offset != self._position:
+            self._pending[offset] = data
+            self._pending_size += len(data)
+            if self._pending_size > self.MEMORY_LIMIT:
+                raise MemoryError("乱序数据过多, 放弃流式解压")
+            return
+        self._decompress(data)
+        self._position += len(data)
+        while self._position in self._pending:
+            data = self._pending.pop(self._position)
+            self._pending_size -= len(data)
+            self._decompress(data)
+            self._position += len(data)
+
+    def _decompress(self, data: bytes):
+        if self._decompressor is None:
+            self._parse(data)
+            return
+        while data and not self._finished:
+            output = self._decompressor.decompress(data)
+            self._parse(output)
+            data = b""
+            if self._decompressor.eof and self._decompressor.unused_data:
+                # 多段gzip等拼接的压缩流
+                data = self._decompressor.unused_data
+                self._decompressor = self._new_decompressor()
+
+    def _parse(self, data: bytes):
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view) and not self._finished:
+            if self._state == "data":
+                size = min(self._remaining, len(view) - pos)
+                self._write(view[pos:pos + size])
+                pos += size
+                self._remaining -= size
+                if self._remaining == 0:
+                    self._end_entry()
+            elif self._state == "padding":
+                size = min(self._padding, len(view) - pos)
+                pos += size
+                self._padding -= size
+                if self._padding == 0:
+                    self._state = "header"
+            else:
+                size = min(TAR_BLOCK - len(self._buffer), len(view) - pos)
+                self._buffer += view[pos:pos + size]
+                pos += size
+                if len(self._buffer) == TAR_BLOCK:
+                    block = bytes(self._buffer)
+                    self._buffer.clear()
+                    self._header(block)
+
+    def _header(self, block: bytes):
+        if block == bytes(TAR_BLOCK):
+            # 结束标志
+            self._finished = True
+            return
+        info = tarfile.TarInfo.frombuf(block, "utf-8", "surrogateescape")
+        size = int(self._pax.get("size", info.size))
+        self._padding = -size % TAR_BLOCK
+
+        if info.type in (tarfile.GNUTYPE_LONGNAME, tarfile.GNUTYPE_LONGLINK, tarfile.XHDTYPE, tarfile.XGLTYPE):
+            self._meta = (info.type, bytearray())
+            self._entry = None
+        else:
+            name = self._long_name or self._pax.get("path") or info.name
+            link = self._long_link or self._pax.get("linkpath") or info.linkname
+            self._long_name = self._long_link = None
+            self._pax = {}
+            self._meta = None
+            self._entry = (info.type, safe_path(self.dest, name), info.mode, link)
+            self._start_entry()
+
+        self._remaining = size
+        self._state = "data"
+        if size == 0:
+            self._end_entry()
+
+    def _start_entry(self):
+        entry_type, path, mode, link = self._entry
+        if path is None:
+            return
+        if entry_type in tarfile.REGULAR_TYPES:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._output = open(path, 'wb')
+        elif entry_type == tarfile.DIRTYPE:
+            os.makedirs(path, exist_ok=True)
+        elif entry_type == tarfile.SYMTYPE:
+            # 只创建指向解压目录内部的相对链接
+            target = os.path.normpath(os.path.join(os.path.dirname(path), link))
+            if not os.path.isabs(link) and os.path.commonpath([os.path.abspath(self.dest),
+                                                               os.path.abspath(target)]) == os.path.abspath(self.dest):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.lexists(path):
+                    os.remove(path)
+                os.symlink(link, path)
+
+    def _write(self, data):
+        if self._meta is not None:
+            self._meta[1].extend(data)
+        elif self._output is not None:
+            self._output.write(data)
+
+    def _end_entry(self):
+        if self._meta is not None:
+            meta_type, data = self._meta
+            if meta_type == tarfile.GNUTYPE_LONGNAME:
+                self._long_name = bytes(data).rstrip(b"\0").decode("utf-8", "surrogateescape")
+            elif meta_type == tarfile.GNUTYPE_LONGLINK:
+                self._long_link = bytes(data).rstrip(b"\0").decode("utf-8", "surrogateescape")
+            elif meta_type == tarfile.XHDTYPE:
+                self._pax = self._parse_pax(bytes(data))
+            self._meta = None
+        elif self._output is not None:
+            self._output.close()
+            self._output = None
+            entry_type, path, mode, link = self._entry
+            if mode:
+                os.chmod(path, mode & 0o777)
+        self._state = "padding" if self._padding else "header"
+
+    @staticmethod
+    def _parse_pax(data: bytes) -> dict:
+        """pax扩展头: 每条记录为 "长度 key=value\\n" """
+        records = {}
+        pos = 0
+        while pos < len(data):
+            space = data.find(b" ", pos)
+            if space < 0:
+                break
+            length = int(data[pos:space])
+            key, _, value = data[space + 1:pos + length - 1].partition(b"=")
+            records[key.decode("utf-8")] = value.decode("utf-8", "surrogateescape")
+            pos += length
+        return records
+
+    def _complete(self) -> bool:
+        return self._finished and not self._pending
+
+    def _cleanup(self):
+        if self._output is not None:
+            self._output.close()
+            self._output = None
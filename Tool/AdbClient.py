@@ -0,0 +1,364 @@
+import os
+import posixpath
+import socket
+import stat
+import struct
+import threading
+import time
+
+
+class AdbError(Exception):
+    """ADB服务返回FAIL"""
+    pass
+
+
+class AdbClient:
+    """ADB Host协议客户端, 直接连接ADB server (默认 127.0.0.1:5037), 不再为每次调用启动adb进程"""
+
+    SYNC_DATA_MAX = 64 * 1024
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5037, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._features = {}
+        self._devices = None  # track-devices维护的设备快照
+        self._devices_lock = threading.Lock()
+        self._devices_changed = threading.Condition(self._devices_lock)
+        self._track_socket = None
+        self._track_thread = None
+        self._track_callbacks = []
+
+    # ---- 基础协议 ----
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _recv_exact(sock: socket.socket, size: int) -> bytes:
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            n = sock.recv_into(view[received:], size - received)
+            if n == 0:
+                raise ConnectionError("ADB连接已关闭")
+            received += n
+        return bytes(buf)
+
+    @staticmethod
+    def _send_request(sock: socket.socket, request: str):
+        payload = request.encode("utf-8")
+        sock.sendall(b"%04x" % len(payload) + payload)
+
+    def _read_length_prefixed(self, sock: socket.socket) -> bytes:
+        length = int(self._recv_exact(sock, 4), 16)
+        return self._recv_exact(sock, length)
+
+    def _read_status(self, sock: socket.socket):
+        status = self._recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(self._read_length_prefixed(sock).decode("utf-8", "ignore"))
+        raise AdbError(f"未知的ADB响应: {status!r}")
+
+    def _request(self, sock: socket.socket, request: str):
+        self._send_request(sock, request)
+        self._read_status(sock)
+
+    def _host_query(self, request: str) -> str:
+        with self._connect() as sock:
+            self._request(sock, request)
+            return self._read_length_prefixed(sock).decode("utf-8", "ignore")
+
+    def _open_transport(self, serial: str = None) -> socket.socket:
+        sock = self._connect()
+        try:
+            self._request(sock, f"host:transport:{serial}" if serial else "host:transport-any")
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    @staticmethod
+    def _parse_devices(text: str) -> list[tuple[str, str]]:
+        devices = []
+        for line in text.splitlines():
+            if '\t' in line:
+                parts = line.split('\t')
+                if len(parts) >= 2:
+                    devices.append((parts[0], parts[1]))
+        return devices
+
+    # ---- host服务 ----
+
+    def version(self) -> int:
+        """获取ADB server版本"""
+        return int(self._host_query("host:version"), 16)
+
+    def devices(self) -> list[tuple[str, str]]:
+        """获取设备列表, 正在跟踪时直接返回track-devices维护的快照"""
+        with self._devices_lock:
+            if self._devices is not None and self.is_tracking():
+                return list(self._devices)
+        return self._parse_devices(self._host_query("host:devices"))
+
+    def features(self, serial: str = None) -> set[str]:
+        """获取设备支持的特性(shell_v2等)"""
+        key = serial or ""
+        if key not in self._features:
+            request = f"host-serial:{serial}:features" if serial else "host:features"
+            self._features[key] = set(self._host_query(request).split(","))
+        return self._features[key]
+
+    def track_devices(self):
+        """订阅host:track-devices, 每次设备变化时生成新的设备列表"""
+        sock = self._connect()
+        sock.settimeout(None)
+        self._track_socket = sock
+        try:
+            self._request(sock, "host:track-devices")
+            while True:
+                yield self._parse_devices(self._read_length_prefixed(sock).decode("utf-8", "ignore"))
+        finally:
+            self._track_socket = None
+            sock.close()
+
+    def start_tracking(self, callback=None) -> bool:
+        """在后台线程保持一条track-devices长连接, callback(devices)在设备变化时调用"""
+        if callback is not None and callback not in self._track_callbacks:
+            self._track_callbacks.append(callback)
+        if self.is_tracking():
+            return True
+
+        ready = threading.Event()
+        state = {"error": None}
+
+        def track_loop():
+            try:
+                for devices in self.track_devices():
+                    with self._devices_changed:
+                        self._devices = devices
+                        self._devices_changed.notify_all()
+                    ready.set()
+                    for cb in list(self._track_callbacks):
+                        try:
+                            cb(devices)
+                        except Exception:
+                            pass
+            except Exception as e:
+                state["error"] = e
+            finally:
+                with self._devices_changed:
+                    self._devices = None
+                    self._devices_changed.notify_all()
+                ready.set()
+
+        self._track_thread = threading.Thread(target=track_loop, daemon=True)
+        self._track_thread.start()
+        ready.wait(self.timeout)
+        return state["error"] is None and self.is_tracking()
+
+    def remove_track_callback(self, callback):
+        """取消设备变化回调, 不关闭track-devices连接"""
+        if callback in self._track_callbacks:
+            self._track_callbacks.remove(callback)
+
+    def stop_tracking(self):
+        """关闭track-devices长连接"""
+        sock = self._track_socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._track_thread is not None:
+            self._track_thread.join(timeout=1.0)
+            self._track_thread = None
+        self._track_callbacks.clear()
+
+    def is_tracking(self) -> bool:
+        return self._track_thread is not None and self._track_thread.is_alive()
+
+    def wait_for_change(self, timeout: float = None) -> list[tuple[str, str]] | None:
+        """阻塞直到track-devices报告变化, 超时返回None"""
+        with self._devices_changed:
+            if not self._devices_changed.wait(timeout):
+                return None
+            return list(self._devices) if self._devices is not None else None
+
+    # ---- shell服务 ----
+
+    def shell(self, serial: str, command: str) -> tuple[int, str, str]:
+        """执行shell命令, 返回 (返回码, stdout, stderr); 设备不支持shell_v2时返回码固定为0且stderr混入stdout"""
+        stdout, stderr = [], []
+        exit_code = self.shell_stream(serial, command, stdout.append, stderr.append)
+        return (exit_code,
+                b"".join(stdout).decode("utf-8", "ignore"),
+                b"".join(stderr).decode("utf-8", "ignore"))
+
+    def shell_stream(self, serial: str, command: str, on_stdout, on_stderr, cancel_event=None) -> int:
+        """执行shell命令, 收到的数据块立即交给 on_stdout/on_stderr(bytes), 返回返回码
+
+        cancel_event被设置时断开连接, 设备上的命令随之结束, 返回-1
+        """
+        use_v2 = "shell_v2" in self.features(serial)
+        with self._open_transport(serial) as sock:
+            # 需要响应取消时定期醒来检查
+            sock.settimeout(0.5 if cancel_event is not None else None)
+
+            def recv(size, exact=True):
+                data = bytearray()
+                while len(data) < size:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return None
+                    try:
+                        chunk = sock.recv(size - len(data))
+                    except socket.timeout:
+                        continue
+                    if not chunk:
+                        break
+                    data += chunk
+                    if not exact:
+                        break
+                return bytes(data)
+
+            if not use_v2:
+                self._request(sock, f"shell:{command}")
+                while True:
+                    data = recv(65536, exact=False)
+                    if data is None:
+                        return -1
+                    if not data:
+                        return 0
+                    on_stdout(data)
+
+            self._request(sock, f"shell,v2,raw:{command}")
+            while True:
+                header = recv(5)
+                if header is None:
+                    return -1
+                if len(header) < 5:
+                    return 0
+                packet_id, length = struct.unpack("<BI", header)
+                data = recv(length)
+                if data is None:
+                    return -1
+                if packet_id == 1:
+                    on_stdout(data)
+                elif packet_id == 2:
+                    on_stderr(data)
+                elif packet_id == 3:
+                    return data[0] if data else 0
+
+    # ---- sync服务 ----
+
+    def _open_sync(self, serial: str) -> socket.socket:
+        sock = self._open_transport(serial)
+        try:
+            self._request(sock, "sync:")
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    @staticmethod
+    def _sync_send(sock: socket.socket, command: bytes, payload: bytes = b"", length: int = None):
+        if length is None:
+            length = len(payload)
+        sock.sendall(command + struct.pack("<I", length) + payload)
+
+    def _sync_fail(self, sock: socket.socket, length: int):
+        raise AdbError(self._recv_exact(sock, length).decode("utf-8", "ignore"))
+
+    def _sync_stat(self, sock: socket.socket, remote_path: str) -> tuple[int, int, int]:
+        self._sync_send(sock, b"STAT", remote_path.encode("utf-8"))
+        response = self._recv_exact(sock, 16)
+        if response[:4] != b"STAT":
+            raise AdbError(f"未知的sync响应: {response[:4]!r}")
+        return struct.unpack("<III", response[4:])
+
+    def _sync_is_dir(self, sock: socket.socket, remote_path: str) -> bool:
+        # STAT不跟随符号链接(如/sdcard), 加上/后由设备解析链接目标
+        mode = self._sync_stat(sock, remote_path)[0]
+        if stat.S_ISLNK(mode):
+            mode = self._sync_stat(sock, remote_path.rstrip("/") + "/")[0]
+        return stat.S_ISDIR(mode)
+
+    def stat(self, serial: str, remote_path: str) -> tuple[int, int, int]:
+        """获取设备文件的 (mode, size, mtime), 文件不存在时mode为0"""
+        with self._open_sync(serial) as sock:
+            result = self._sync_stat(sock, remote_path)
+            self._sync_send(sock, b"QUIT")
+            return result
+
+    def pull(self, serial: str, remote_path: str, local_path: str, progress_callback=None) -> int:
+        """从设备拉取文件, 返回字节数; 远程路径是目录时抛出IsADirectoryError
+
+        收到第一块数据后才创建本地文件, 设备返回FAIL时不会覆盖已有的本地文件; 中途失败时删除不完整的文件
+        """
+        received = 0
+        f = None
+        with self._open_sync(serial) as sock:
+            sock.settimeout(None)
+            if self._sync_is_dir(sock, remote_path):
+                raise IsADirectoryError(f"{remote_path} 是目录")
+            self._sync_send(sock, b"RECV", remote_path.encode("utf-8"))
+            try:
+                while True:
+                    command, length = struct.unpack("<4sI", self._recv_exact(sock, 8))
+                    if command == b"DATA":
+                        if f is None:
+                            f = open(local_path, "wb")
+                        f.write(self._recv_exact(sock, length))
+                        received += length
+                        if progress_callback:
+                            progress_callback(received)
+                    elif command == b"DONE":
+                        if f is None:
+                            f = open(local_path, "wb")  # 空文件
+                        break
+                    elif command == b"FAIL":
+                        self._sync_fail(sock, length)
+                    else:
+                        raise AdbError(f"未知的sync响应: {command!r}")
+            except BaseException:
+                if f is not None:
+                    f.close()
+                    os.remove(local_path)
+                raise
+            f.close()
+            self._sync_send(sock, b"QUIT")
+        return received
+
+    def push(self, serial: str, local_path: str, remote_path: str, mode: int = 0o644,
+             progress_callback=None) -> int:
+        """推送文件到设备, 返回字节数; 与adb相同, 远程路径是目录(或以/结尾)时写入该目录下的同名文件"""
+        sent = 0
+        with self._open_sync(serial) as sock, open(local_path, "rb") as f:
+            sock.settimeout(None)
+            if remote_path.endswith("/") or self._sync_is_dir(sock, remote_path):
+                remote_path = posixpath.join(remote_path, os.path.basename(local_path))
+            self._sync_send(sock, b"SEND", f"{remote_path},{mode | 0o100000}".encode("utf-8"))
+            buf = bytearray(self.SYNC_DATA_MAX)
+            view = memoryview(buf)
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                self._sync_send(sock, b"DATA", length=n)
+                sock.sendall(view[:n])
+                sent += n
+                if progress_callback:
+                    progress_callback(sent)
+            self._sync_send(sock, b"DONE", length=int(os.path.getmtime(local_path) or time.time()))
+            command, length = struct.unpack("<4sI", self._recv_exact(sock, 8))
+            if command == b"FAIL":
+                self._sync_fail(sock, length)
+            if command != b"OKAY":
+                raise AdbError(f"未知的sync响应: {command!r}")
+            self._sync_send(sock, b"QUIT")
+        return sent
@@ -0,0 +1,316 @@
+import bisect
+import hashlib
+import json
+import lzma
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .SparseImage import CHUNK_TYPE_FILL, CHUNK_TYPE_RAW, SparseImage, close_mapping
+
+MAGIC = b"PFTBAK01"
+FOOTER = struct.Struct("<QQ8s")  # 索引偏移, 索引长度, MAGIC
+INDEX_VERSION = 1
+EXTENT_SIZE = 4 * 1024 * 1024  # 数据区段的最大长度, 也是随机读取时最少需要解压的大小
+READ_SIZE = 1024 * 1024
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "lzma"
+
+
+def _compress(codec: str, data: bytes, level: int) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return lzma.compress(data, preset=level)
+
+
+def _decompress(codec: str, data: bytes, size: int) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("解压zstd备份需要安装zstandard")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    return lzma.decompress(data)
+
+
+class BackupWriter:
+    """分区备份容器: 全零块不保存, 填充块只保存4字节图案, 其余数据按区段在进程池中并行压缩, 末尾写入块索引
+
+    格式: MAGIC | 压缩区段... | 索引(JSON) | FOOTER
+    """
+
+    def __init__(self, path: str, codec: str = None, level: int = None, workers: int = None):
+        self.path = path
+        self.codec = codec or default_codec()
+        self.level = level if level is not None else (3 if self.codec == "zstd" else 6)
+        self.workers = workers or os.cpu_count() or 1
+        self.partitions = []
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def add_image(self, name: str, image_path: str, progress_callback=None) -> dict:
+        """把raw镜像文件加入容器"""
+        if os.path.getsize(image_path) == 0:
+            return self.add_view(name, b"", progress_callback)
+        with open(image_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            return self.add_view(name, view, progress_callback)
+        finally:
+            close_mapping(mapped, view)
+
+    def _data_extents(self, image: SparseImage):
+        """把RAW chunk切成不超过EXTENT_SIZE的区段, 生成 (起始字节, 长度)"""
+        bs = image.block_size
+        size = len(image.view)
+        for chunk in image.chunks:
+            if chunk.chunk_type != CHUNK_TYPE_RAW:
+                continue
+            start = chunk.start * bs
+            end = min(chunk.end * bs, size)
+            for pos in range(start, end, EXTENT_SIZE):
+                yield pos, min(EXTENT_SIZE, end - pos)
+
+    def add_view(self, name: str, view, progress_callback=None) -> dict:
+        """把内存视图中的raw镜像加入容器, progress_callback(已处理, 总数)"""
+        view = memoryview(view).cast("B")
+        size = len(view)
+        digest = hashlib.sha256()
+        for pos in range(0, size, READ_SIZE):
+            digest.update(view[pos:pos + READ_SIZE])
+
+        extents = []
+        image = SparseImage(view)
+        try:
+            bs = image.block_size
+            for chunk in image.chunks:
+                if chunk.chunk_type == CHUNK_TYPE_FILL and chunk.fill != b"\0\0\0\0":
+                    start = chunk.start * bs
+                    extents.append([start, min(chunk.end * bs, size) - start, "fill", chunk.fill.hex()])
+
+            # 限制同时在途的区段数量, 避免整个分区的数据都堆积在内存中
+            pending = []
+            done = 0
+            limit = self.workers * 2
+            for start, length in self._data_extents(image):
+                future = self._pool().submit(_compress, self.codec, view[start:start + length].tobytes(), self.level)
+                pending.append((start, length, future))
+                while len(pending) > limit:
+                    done = self._write_extent(extents, *pending.pop(0), done, size, progress_callback)
+            for item in pending:
+                done = self._write_extent(extents, *item, done, size, progress_callback)
+        finally:
+            image.release()
+
+        extents.sort(key=lambda extent: extent[0])
+        entry = {"name": name, "size": size, "sha256": digest.hexdigest(), "extents": extents}
+        self.partitions.append(entry)
+        return entry
+
+    def _write_extent(self, extents: list, start: int, length: int, future, done: int, size: int,
+                      progress_callback) -> int:
+        data = future.result()
+        offset = self._file.tell()
+        self._file.write(data)
+        extents.append([start, length, "data", offset, len(data)])
+        done += length
+        if progress_callback:
+            progress_callback(done, size)
+        return done
+
+    def close(self):
+        """写入索引并关闭"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._file is None:
+            return
+        index = json.dumps({"version": INDEX_VERSION, "codec": self.codec, "partitions": self.partitions},
+                           ensure_ascii=False).encode("utf-8")
+        offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(FOOTER.pack(offset, len(index), MAGIC))
+        # 调用方可能随后删除原始镜像, 容器必须已写入磁盘
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def abort(self):
+        """放弃写入并删除不完整的容器"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self.path)
+
+
+class BackupReader:
+    """读取分区备份容器, 通过块索引只解压需要的区段"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._file.seek(-FOOTER.size, os.SEEK_END)
+            offset, length, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+            self._file.seek(0)
+            if magic != MAGIC or self._file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是分区备份容器: {path}")
+            self._file.seek(offset)
+            index = json.loads(self._file.read(length).decode("utf-8"))
+        except Exception:
+            self._file.close()
+            raise
+        if index.get("version") != INDEX_VERSION:
+            self._file.close()
+            raise ValueError(f"不支持的备份容器版本: {index.get('version')}")
+        self.codec = index["codec"]
+        self._partitions = {entry["name"]: entry for entry in index["partitions"]}
+        self._starts = {name: [extent[0] for extent in entry["extents"]] for name, entry in self._partitions.items()}
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def partitions(self) -> list[str]:
+        return list(self._partitions)
+
+    def info(self, name: str) -> dict:
+        """分区的 {name, size, sha256, extents}"""
+        return self._partitions[name]
+
+    def _extent_bytes(self, extent: list) -> bytes:
+        start, length, kind = extent[:3]
+        if kind == "fill":
+            pattern = bytes.fromhex(extent[3])
+            return (pattern * (length // 4 + 1))[:length]
+        self._file.seek(extent[3])
+        return _decompress(self.codec, self._file.read(extent[4]), length)
+
+    def read(self, name: str, offset: int = 0, length: int = None) -> bytes:
+        """读取分区中的一段数据, 只解压与之重叠的区段"""
+        entry = self._partitions[name]
+        size = entry["size"]
+        offset = max(0, min(offset, size))
+        end = size if length is None else min(size, offset + length)
+        result = bytearray(end - offset)
+        extents = entry["extents"]
+        index = max(0, bisect.bisect_right(self._starts[name], offset) - 1)
+        for extent in extents[index:]:
+            start, extent_length = extent[0], extent[1]
+            if start >= end:
+                break
+            if start + extent_length <= offset:
+                continue
+            data = self._extent_bytes(extent)
+            lo = max(start, offset)
+            hi = min(start + extent_length, end)
+            result[lo - offset:hi - offset] = data[lo - start:hi - start]
+        return bytes(result)
+
+    def _restore(self, name: str, f=None, progress_callback=None) -> bool:
+        """按顺序解压分区的所有区段并校验sha256, f不为None时同时写入文件(全零部分保留为文件空洞)"""
+        entry = self._partitions[name]
+        size = entry["size"]
+        digest = hashlib.sha256()
+        zeros = bytes(READ_SIZE)
+
+        def hash_zeros(length):
+            for pos in range(0, length, READ_SIZE):
+                digest.update(zeros[:min(READ_SIZE, length - pos)])
+
+        position = 0
+        if f is not None:
+            f.truncate(size)
+        for extent in entry["extents"]:
+            hash_zeros(extent[0] - position)
+            data = self._extent_bytes(extent)
+            if f is not None:
+                f.seek(extent[0])
+                f.write(data)
+            digest.update(data)
+            position = extent[0] + extent[1]
+            if progress_callback:
+                progress_callback(position, size)
+        hash_zeros(size - position)
+        if progress_callback:
+            progress_callback(size, size)
+        return digest.hexdigest() == entry["sha256"]
+
+    def extract(self, name: str, output_path: str, progress_callback=None) -> bool:
+        """还原整个分区到文件(全零部分保留为文件空洞), 写入的同时校验sha256"""
+        with open(output_path, 'wb') as f:
+            return self._restore(name, f, progress_callback)
+
+    def verify(self, name: str) -> bool:
+        """解压整个分区并校验sha256, 不写入文件"""
+        return self._restore(name)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while data := f.read(READ_SIZE):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def verify_container(container_path: str, images: list[tuple[str, str]]) -> str | None:
+    """重新打开容器, 确认每个分区都能完整还原且与原始镜像的sha256一致; 返回第一个不一致的分区, 全部一致时返回None"""
+    with BackupReader(container_path) as reader:
+        for name, image_path in images:
+            if name not in reader.partitions():
+                return name
+            if reader.info(name)["sha256"] != file_sha256(image_path) or not reader.verify(name):
+                return name
+    return None
+
+
+def pack_images(container_path: str, images: list[tuple[str, str]], remove: bool = False, codec: str = None,
+                progress_callback=None) -> list[dict]:
+    """把多个raw镜像 [(分区, 文件路径)] 打包为一个备份容器
+
+    remove为True时重新打开容器逐个校验, 全部与原文件一致后才删除原文件, 校验失败时抛出ValueError并保留原文件
+    """
+    with BackupWriter(container_path, codec) as writer:
+        for name, image_path in images:
+            writer.add_image(name, image_path,
+                             (lambda done, total, name=name: progress_callback(name, done, total))
+                             if progress_callback else None)
+    if remove:
+        mismatch = verify_container(container_path, images)
+        if mismatch is not None:
+            raise ValueError(f"备份容器校验失败, 已保留原始镜像: {mismatch}")
+        for name, image_path in images:
+            os.remove(image_path)
+    return writer.partitions
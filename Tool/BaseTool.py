@@ -73,6 +73,15 @@ class Tool(ABC):
         pass
 
 
+    def fingerprint_files(self, system: str = None, path: str = None) -> list[str]:
+        """标识工具版本的文件, 用于判断缓存的工具路径是否仍然有效"""
+        if system is None:
+            system = platform.system().lower()
+        if path is None:
+            path = self.get_path()
+        return [os.path.join(path, file) for file in self.get_runnable_files(system)]
+
+
     def change_path_to_available(self) -> bool:
         if self.is_available():
             return True
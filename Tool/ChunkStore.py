@@ -0,0 +1,425 @@
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .BackupContainer import _compress, _decompress, default_codec, file_sha256
+from .SparseImage import close_mapping
+
+BLOCK_SIZE = 4096
+MIN_BLOCKS = 64  # 最小块 256KB
+MAX_BLOCKS = 1024  # 最大块 4MB
+BOUNDARY_MASK = 0xFF  # 平均在最小块之后再过256个块(1MB)出现切分点
+CODEC_TAGS = {"zstd": b"Z", "lzma": b"X", "raw": b"R"}
+MANIFEST_VERSION = 1
+
+_backup_ids = itertools.count(1)
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _lock_file(f, blocking: bool = True):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if not blocking:
+                    raise
+                time.sleep(0.05)
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f, blocking: bool = True):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def chunk_boundaries(view) -> list[tuple[int, int]]:
+    """内容定义分块: 以4KB块的crc32决定切分点, 插入/删除整块数据后其余切分点不变, 返回 [(偏移, 长度)]"""
+    view = memoryview(view).cast("B")
+    size = len(view)
+    chunks = []
+    start = 0
+    blocks = 0
+    for pos in range(0, size, BLOCK_SIZE):
+        blocks += 1
+        end = min(pos + BLOCK_SIZE, size)
+        if blocks >= MAX_BLOCKS or (blocks >= MIN_BLOCKS and zlib.crc32(view[pos:end]) & BOUNDARY_MASK == 0):
+            chunks.append((start, end - start))
+            start = end
+            blocks = 0
+    if start < size:
+        chunks.append((start, size - start))
+    return chunks
+
+
+class ChunkStore:
+    """去重备份仓库: 分区数据按内容分块, 每个不同的块只保存一次, 每次备份一个清单, 按引用计数回收无用的块
+
+    目录结构: chunks/<sha256前两位>/<sha256>, manifests/<备份ID>.json, refs.json, pending/<正在写入的备份ID>
+    多个实例/进程可以共用一个仓库: 引用计数每次修改都在文件锁内重新读取
+    """
+
+    def __init__(self, root: str = None, codec: str = None, workers: int = None):
+        self.root = root or os.path.join("backups", "store")
+        self.codec = codec or default_codec()
+        self.workers = workers or os.cpu_count() or 1
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.root, "chunks", digest[:2], digest)
+
+    def _manifest_path(self, backup_id: str) -> str:
+        return os.path.join(self.root, "manifests", f"{backup_id}.json")
+
+    # ---- 锁与引用计数 ----
+
+    @contextmanager
+    def _locked(self):
+        """线程锁加仓库的文件锁: 修改引用计数/清单和回收块在所有实例和进程之间互斥"""
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, "store.lock"), 'a+b') as f:
+                _lock_file(f)
+                try:
+                    yield
+                finally:
+                    _unlock_file(f)
+
+    @contextmanager
+    def _in_flight(self, backup_id: str):
+        """备份写入期间在pending目录持有一个加锁的标记, gc不删除标记创建之后写入或复用的块"""
+        path = os.path.join(self.root, "pending", backup_id)
+        with self._locked():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            marker = open(path, 'wb')
+            _lock_file(marker)
+        try:
+            yield
+        finally:
+            _unlock_file(marker)
+            marker.close()
+            os.remove(path)
+
+    def _oldest_in_flight(self) -> float | None:
+        """正在写入的备份中最早的开始时间, 清理进程退出后遗留的标记; 在_locked内调用"""
+        directory = os.path.join(self.root, "pending")
+        oldest = None
+        try:
+            files = os.listdir(directory)
+        except OSError:
+            return None
+        for file in files:
+            path = os.path.join(directory, file)
+            try:
+                with open(path, 'r+b') as f:
+                    try:
+                        _lock_file(f, blocking=False)
+                    except OSError:
+                        started = os.path.getmtime(path)
+                        oldest = started if oldest is None else min(oldest, started)
+                        continue
+                    _unlock_file(f)
+                os.remove(path)
+            except OSError as e:
+                self.last_error = str(e)
+        return oldest
+
+    def _load_refs(self) -> dict:
+        """从磁盘读取引用计数, 其他实例可能已经修改过; 在_locked内调用"""
+        try:
+            with open(os.path.join(self.root, "refs.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            # 引用计数损坏时根据所有清单重新统计
+            self.last_error = str(e)
+            return self._count_refs()
+
+    def _save_refs(self, refs: dict):
+        path = os.path.join(self.root, "refs.json")
+        os.makedirs(self.root, exist_ok=True)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(refs, f)
+            # gc按引用计数删除块, 计数必须与已写入的清单一致
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _count_refs(self) -> dict:
+        refs = {}
+        for manifest in self.backups():
+            for partition in manifest["partitions"]:
+                for digest, length in partition["chunks"]:
+                    refs[digest] = refs.get(digest, 0) + 1
+        return refs
+
+    # ---- 写入 ----
+
+    def _store_chunk(self, digest: str, data: bytes) -> int:
+        """压缩并写入一个新块, 返回写入的字节数"""
+        compressed = _compress(self.codec, data, 3 if self.codec == "zstd" else 1)
+        tag = CODEC_TAGS[self.codec]
+        if len(compressed) >= len(data):
+            compressed, tag = data, CODEC_TAGS["raw"]
+        path = self._chunk_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 其他进程可能同时写入同一个块, 临时文件不能同名
+        temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(tag)
+            f.write(compressed)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        return len(compressed) + 1
+
+    def _reuse_chunk(self, digest: str) -> bool:
+        """仓库中已有该块时更新其修改时间并返回True, 正在进行的gc因此不会删除它; 在_locked内调用"""
+        try:
+            os.utime(self._chunk_path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _add_image(self, image_path: str, stats: dict, seen: set, progress_callback=None) -> dict:
+        """分块并写入仓库中还没有的块, 返回分区清单 {size, sha256, chunks: [[sha256, 长度]]}; seen为本次备份已写入的块"""
+        size = os.path.getsize(image_path)
+        if size == 0:
+            return {"size": 0, "sha256": hashlib.sha256().hexdigest(), "chunks": []}
+
+        with open(image_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            digest = hashlib.sha256()
+            chunks = []
+            pending = []
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="chunk") as executor:
+                for offset, length in chunk_boundaries(view):
+                    with view[offset:offset + length] as data:
+                        digest.update(data)
+                        chunk_digest = hashlib.sha256(data).hexdigest()
+                        chunks.append([chunk_digest, length])
+                        stats["logical"] += length
+                        known = chunk_digest in seen
+                        if not known:
+                            with self._locked():
+                                known = self._reuse_chunk(chunk_digest)
+                        if not known:
+                            seen.add(chunk_digest)
+                            stats["new_chunks"] += 1
+                            pending.append(executor.submit(self._store_chunk, chunk_digest, data.tobytes()))
+                        # 限制同时在途的块, 新分区的数据不会全部堆积在内存中
+                        while len(pending) > self.workers * 2:
+                            stats["written"] += pending.pop(0).result()
+                    if progress_callback:
+                        progress_callback(offset + length, size)
+                for future in pending:
+                    stats["written"] += future.result()
+        finally:
+            close_mapping(mapped, view)
+        return {"size": size, "sha256": digest.hexdigest(), "chunks": chunks}
+
+    def add_backup(self, images: list[tuple[str, str]], device: str = None, remove: bool = False,
+                   progress_callback=None) -> dict:
+        """把一次备份的raw镜像 [(分区, 文件路径)] 写入仓库, 返回清单; progress_callback(分区, 已处理, 总数)
+
+        remove为True时从仓库读回每个分区, 与原文件的sha256一致后才删除原文件, 校验失败时抛出ValueError并保留原文件
+        """
+        # 同一秒内的多次备份用进程内序号区分, 不能覆盖彼此的清单
+        backup_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}-{next(_backup_ids)}"
+        stats = {"logical": 0, "written": 0, "new_chunks": 0}
+        partitions = []
+        seen = set()
+        with self._in_flight(backup_id):
+            for name, image_path in images:
+                entry = self._add_image(image_path, stats, seen,
+                                       (lambda done, total, name=name: progress_callback(name, done, total))
+                                       if progress_callback else None)
+                entry["name"] = name
+                partitions.append(entry)
+
+            manifest = {"version": MANIFEST_VERSION, "id": backup_id, "device": device, "created": time.time(),
+                        "codec": self.codec, "stats": stats, "partitions": partitions}
+            path = self._manifest_path(backup_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._locked():
+                with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(path + ".tmp", path)
+                refs = self._load_refs()
+                for partition in partitions:
+                    for digest, length in partition["chunks"]:
+                        refs[digest] = refs.get(digest, 0) + 1
+                self._save_refs(refs)
+
+        if remove:
+            if not self.verify(backup_id, images):
+                raise ValueError(f"备份校验失败, 已保留原始镜像: {self.last_error}")
+            for name, image_path in images:
+                os.remove(image_path)
+        return manifest
+
+    # ---- 读取 ----
+
+    def backups(self) -> list[dict]:
+        """所有备份清单, 按时间排序"""
+        directory = os.path.join(self.root, "manifests")
+        manifests = []
+        try:
+            files = os.listdir(directory)
+        except OSError:
+            return []
+        for file in files:
+            if not file.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, file), 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == MANIFEST_VERSION:
+                    manifests.append(manifest)
+            except (OSError, ValueError) as e:
+                self.last_error = str(e)
+        return sorted(manifests, key=lambda manifest: manifest["created"])
+
+    def load(self, backup_id: str) -> dict:
+        with open(self._manifest_path(backup_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_chunk(self, digest: str) -> bytes:
+        with open(self._chunk_path(digest), 'rb') as f:
+            tag = f.read(1)
+            data = f.read()
+        if tag == CODEC_TAGS["raw"]:
+            return data
+        codec = "zstd" if tag == CODEC_TAGS["zstd"] else "lzma"
+        return _decompress(codec, data, MAX_BLOCKS * BLOCK_SIZE)
+
+    def _read_partition(self, entry: dict, f=None, progress_callback=None) -> bool:
+        """按顺序读取分区的所有块并校验长度和sha256, f不为None时同时写入文件"""
+        digest = hashlib.sha256()
+        done = 0
+        for chunk_digest, length in entry["chunks"]:
+            data = self.read_chunk(chunk_digest)
+            if len(data) != length:
+                self.last_error = f"块 {chunk_digest} 长度不符"
+                return False
+            if f is not None:
+                f.write(data)
+            digest.update(data)
+            done += length
+            if progress_callback:
+                progress_callback(done, entry["size"])
+        if digest.hexdigest() != entry["sha256"]:
+            self.last_error = f"{entry['name']} 校验失败"
+            return False
+        return True
+
+    def restore(self, backup_id: str, partition: str, output_path: str, progress_callback=None) -> bool:
+        """从备份中还原一个分区并校验sha256"""
+        try:
+            manifest = self.load(backup_id)
+            entry = next((item for item in manifest["partitions"] if item["name"] == partition), None)
+            if entry is None:
+                self.last_error = f"备份 {backup_id} 中没有分区 {partition}"
+                return False
+            with open(output_path, 'wb') as f:
+                return self._read_partition(entry, f, progress_callback)
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    def verify(self, backup_id: str, images: list[tuple[str, str]] = None) -> bool:
+        """读回备份的每个分区并校验sha256; 给出原始镜像 [(分区, 文件路径)] 时同时与原文件比较"""
+        try:
+            manifest = self.load(backup_id)
+            entries = {entry["name"]: entry for entry in manifest["partitions"]}
+            for name, image_path in images or []:
+                entry = entries.get(name)
+                if entry is None or entry["sha256"] != file_sha256(image_path):
+                    self.last_error = f"{name} 与原始镜像不一致"
+                    return False
+            return all(self._read_partition(entry) for entry in entries.values())
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    # ---- 删除与回收 ----
+
+    def remove_backup(self, backup_id: str) -> bool:
+        """删除备份清单并减少其引用的块的计数, 块本身在gc时删除"""
+        try:
+            with self._locked():
+                manifest = self.load(backup_id)
+                refs = self._load_refs()
+                for partition in manifest["partitions"]:
+                    for digest, length in partition["chunks"]:
+                        count = refs.get(digest, 0) - 1
+                        if count > 0:
+                            refs[digest] = count
+                        else:
+                            refs.pop(digest, None)
+                self._save_refs(refs)
+                os.remove(self._manifest_path(backup_id))
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    def gc(self) -> tuple[int, int]:
+        """删除引用计数为0的块, 返回 (删除的块数, 释放的字节数)
+
+        正在写入的备份新写入或复用的块还没有计入引用计数, 修改时间不早于最早的写入中备份的块都保留
+        """
+        removed = freed = 0
+        with self._locked():
+            refs = self._load_refs()
+            oldest = self._oldest_in_flight()
+            chunks_dir = os.path.join(self.root, "chunks")
+            for root, dirs, files in os.walk(chunks_dir):
+                for file in files:
+                    if file in refs:
+                        continue
+                    path = os.path.join(root, file)
+                    try:
+                        if oldest is not None and os.path.getmtime(path) >= oldest:
+                            continue
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                        removed += 1
+                    except OSError as e:
+                        self.last_error = str(e)
+        return removed, freed
+
+    def stats(self) -> dict:
+        """{备份数, 逻辑大小, 实际占用}"""
+        manifests = self.backups()
+        stored = 0
+        for root, dirs, files in os.walk(os.path.join(self.root, "chunks")):
+            for file in files:
+                try:
+                    stored += os.path.getsize(os.path.join(root, file))
+                except OSError:
+                    pass
+        logical = sum(partition["size"] for manifest in manifests for partition in manifest["partitions"])
+        return {"backups": len(manifests), "logical": logical, "stored": stored}
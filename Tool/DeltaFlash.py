@@ -0,0 +1,65 @@
+import hashlib
+import re
+
+REGION_SIZE = 1024 * 1024  # 比较哈希的区域大小
+
+# 系统运行时不会被写入的分区, 读取哈希到重启后写入之间内容不变; 其他分区(userdata/cache/metadata等)必须完整刷写
+READ_ONLY_PARTITIONS = {
+    "boot", "init_boot", "vendor_boot", "recovery", "dtbo",
+    "vbmeta", "vbmeta_system", "vbmeta_vendor",
+    "system", "system_ext", "system_dlkm", "vendor", "vendor_dlkm", "product", "odm", "odm_dlkm",
+}
+
+
+def delta_supported(partition: str) -> bool:
+    """分区是否可以增量刷写(忽略_a/_b槽位后缀)"""
+    return re.sub(r"_[ab]$", "", partition) in READ_ONLY_PARTITIONS
+
+
+def region_hashes(view, region_size: int = REGION_SIZE) -> list[str]:
+    """镜像中每个完整区域的sha256, 末尾不足一个区域的部分总是写入"""
+    view = memoryview(view).cast("B")
+    return [hashlib.sha256(view[pos:pos + region_size]).hexdigest()
+            for pos in range(0, len(view) - region_size + 1, region_size)]
+
+
+def device_region_hashes(adb_client, serial: str, partition: str, count: int,
+                         region_size: int = REGION_SIZE) -> list[str] | None:
+    """在设备上用dd逐区域读取分区并计算sha256(需要root), 只传回哈希; 失败时返回None"""
+    if not re.fullmatch(r"[A-Za-z0-9_\-]+", partition) or count <= 0:
+        return None
+    script = (f"p=/dev/block/by-name/{partition}$(getprop ro.boot.slot_suffix); "
+              f"[ -e $p ] || p=/dev/block/by-name/{partition}; "
+              f"i=0; while [ $i -lt {count} ]; do "
+              f"dd if=$p bs={region_size} skip=$i count=1 2>/dev/null | sha256sum; i=$((i+1)); done")
+    returncode, stdout, stderr = adb_client.shell(serial, "id -u")
+    if stdout.strip() != "0":
+        script = f"su -c '{script}'"
+    returncode, stdout, stderr = adb_client.shell(serial, script)
+    hashes = [line.split()[0] for line in stdout.splitlines() if re.match(r"^[0-9a-f]{64}\b", line)]
+    if returncode != 0 or len(hashes) != count:
+        return None
+    return hashes
+
+
+def changed_ranges(new_hashes: list[str], device_hashes: list[str], size: int,
+                   region_size: int = REGION_SIZE, block_size: int = 4096) -> list[tuple[int, int]]:
+    """比较区域哈希, 返回需要写入的块区间 [(起始块, 块数)]"""
+    blocks_per_region = region_size // block_size
+    total_blocks = (size + block_size - 1) // block_size
+    ranges = []
+    for index, new_hash in enumerate(new_hashes):
+        if index < len(device_hashes) and device_hashes[index] == new_hash:
+            continue
+        start = index * blocks_per_region
+        if ranges and ranges[-1][0] + ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + blocks_per_region)
+        else:
+            ranges.append((start, blocks_per_region))
+    tail = len(new_hashes) * blocks_per_region
+    if tail < total_blocks:
+        if ranges and ranges[-1][0] + ranges[-1][1] == tail:
+            ranges[-1] = (ranges[-1][0], total_blocks - ranges[-1][0])
+        else:
+            ranges.append((tail, total_blocks - tail))
+    return ranges
@@ -0,0 +1,189 @@
+import threading
+
+from .FastbootDevice import FASTBOOT_INTERFACE
+from .PlatformTools import PlatformTools
+
+try:
+    import usb1
+except ImportError:
+    usb1 = None
+
+try:
+    import usb.core
+except ImportError:
+    usb = None
+
+
+class DeviceWatcher:
+    """设备监视器: ADB通过track-devices事件驱动, Fastboot通过USB热插拔或枚举探测, 仅在设备集合变化时回调"""
+
+    def __init__(self, platform_tools: PlatformTools, callback,
+                 usb_interval: float = 0.1, fallback_interval: float = 3.0, error_callback=None):
+        self.platform_tools = platform_tools
+        self.callback = callback  # (adb_devices, fastboot_devices), 在监视线程中调用, 不应阻塞
+        self.error_callback = error_callback  # (message)
+        self.usb_interval = usb_interval
+        self.fallback_interval = fallback_interval
+        self.last_error = None
+        self._adb_devices = []
+        self._fastboot_devices = []
+        self._last_state = None
+        self._lock = threading.Lock()
+        self._emit_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._usb_changed = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """启动监视线程"""
+        self._stop_event.clear()
+        self._start_adb_tracking()
+        for target in (self._fastboot_loop, self._adb_keepalive_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """停止监视线程"""
+        self._stop_event.set()
+        self._usb_changed.set()
+        self.platform_tools.adb_client.remove_track_callback(self._on_adb_devices)
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._threads = []
+
+    def refresh(self):
+        """立即重新探测Fastboot设备"""
+        self._usb_changed.set()
+
+    # ---- ADB ----
+
+    def _start_adb_tracking(self) -> bool:
+        client = self.platform_tools.adb_client
+        if client.start_tracking(self._on_adb_devices):
+            return True
+        # ADB server未启动时才启动adb进程
+        if self.platform_tools.get_adb_stat():
+            return client.start_tracking(self._on_adb_devices)
+        return False
+
+    def _on_adb_devices(self, devices):
+        with self._lock:
+            self._adb_devices = devices
+        self._emit()
+
+    def _adb_keepalive_loop(self):
+        # track-devices连接断开(如adb kill-server)时重连, 重连失败则退回轮询
+        while not self._stop_event.wait(self.fallback_interval):
+            if self.platform_tools.adb_client.is_tracking():
+                continue
+            try:
+                if not self._start_adb_tracking():
+                    self._on_adb_devices(self.platform_tools.get_adb_devices())
+            except Exception as e:
+                self._report_error(f"ADB设备监视异常: {e}")
+
+    # ---- Fastboot ----
+
+    def _probe_usb(self):
+        """枚举USB设备, 返回fastboot接口的特征集合; 不可用时返回None"""
+        if usb is None:
+            return None
+        try:
+            found = set()
+            for device in usb.core.find(find_all=True):
+                for config in device:
+                    for interface in config:
+                        if (interface.bInterfaceClass, interface.bInterfaceSubClass,
+                                interface.bInterfaceProtocol) == FASTBOOT_INTERFACE:
+                            found.add((device.bus, device.address, device.idVendor, device.idProduct))
+            return frozenset(found)
+        except Exception as e:
+            self.last_error = str(e)
+            return None
+
+    def _start_hotplug(self):
+        """注册libusb热插拔回调, 平台不支持时返回None"""
+        if usb1 is None:
+            return None
+        try:
+            context = usb1.USBContext()
+            if not context.hasCapability(usb1.CAP_HAS_HOTPLUG):
+                context.close()
+                return None
+
+            def on_hotplug(context, device, event):
+                self._usb_changed.set()
+                return False
+
+            context.hotplugRegisterCallback(on_hotplug)
+            return context
+        except Exception as e:
+            self.last_error = str(e)
+            return None
+
+    def _refresh_fastboot(self):
+        devices = self.platform_tools.get_fastboot_devices()
+        with self._lock:
+            self._fastboot_devices = devices
+        self._emit()
+
+    def _fastboot_loop(self):
+        # 异常时记录并稍后重新开始, 不让Fastboot监视悄悄停止
+        while not self._stop_event.is_set():
+            try:
+                self._watch_fastboot()
+            except Exception as e:
+                self._report_error(f"Fastboot设备监视异常: {e}")
+                self._stop_event.wait(self.fallback_interval)
+
+    def _watch_fastboot(self):
+        context = self._start_hotplug()
+        last_probe = None
+        try:
+            self._refresh_fastboot()
+            while not self._stop_event.is_set():
+                if context is not None:
+                    # 热插拔: 阻塞在libusb事件上, 空闲时不唤醒
+                    context.handleEventsTimeout(tv=self.fallback_interval)
+                    if not self._usb_changed.is_set():
+                        continue
+                    self._usb_changed.clear()
+                    self._refresh_fastboot()
+                    continue
+
+                probe = self._probe_usb()
+                if probe is None:
+                    # 没有USB库时退回到原来的fastboot devices轮询
+                    if self._usb_changed.wait(self.fallback_interval):
+                        self._usb_changed.clear()
+                    self._refresh_fastboot()
+                    continue
+
+                # 只有USB上的fastboot接口变化时才启动fastboot进程读取序列号
+                if probe != last_probe or self._usb_changed.is_set():
+                    self._usb_changed.clear()
+                    last_probe = probe
+                    self._refresh_fastboot()
+                self._stop_event.wait(self.usb_interval)
+        finally:
+            if context is not None:
+                context.close()
+
+    # ---- 回调 ----
+
+    def _emit(self):
+        # ADB和Fastboot线程都会回调: 比较状态和回调在同一个锁内完成, 最后一次回调总是最新的设备集合
+        with self._emit_lock:
+            with self._lock:
+                state = (tuple(self._adb_devices), tuple(self._fastboot_devices))
+                if state == self._last_state:
+                    return
+                self._last_state = state
+            if self.callback and not self._stop_event.is_set():
+                self.callback(list(state[0]), list(state[1]))
+
+    def _report_error(self, message: str):
+        self.last_error = message
+        if self.error_callback and not self._stop_event.is_set():
+            self.error_callback(message)
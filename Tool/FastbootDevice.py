@@ -0,0 +1,362 @@
+import mmap
+import os
+import time
+from abc import ABC, abstractmethod
+
+try:
+    import usb.core
+    import usb.util
+except ImportError:
+    usb = None
+
+# 与usb.core.find()相同的后端查找顺序
+USB_BACKENDS = ("libusb1", "openusb", "libusb0")
+
+from .SparseImage import SparseImage, close_mapping
+
+# fastboot接口: class 0xff, subclass 0x42, protocol 0x03
+FASTBOOT_INTERFACE = (0xff, 0x42, 0x03)
+
+
+class FastbootError(Exception):
+    """设备返回FAIL或传输异常"""
+    pass
+
+
+_usb_backend = None
+_usb_backend_checked = False
+
+
+def usb_backend():
+    """可用的pyusb后端, 只查找一次; 未安装pyusb或没有libusb等后端时返回None"""
+    global _usb_backend, _usb_backend_checked
+    if not _usb_backend_checked:
+        _usb_backend_checked = True
+        if usb is not None:
+            import importlib
+            for name in USB_BACKENDS:
+                try:
+                    _usb_backend = importlib.import_module(f"usb.backend.{name}").get_backend()
+                except Exception:
+                    _usb_backend = None
+                if _usb_backend is not None:
+                    break
+    return _usb_backend
+
+
+class FastbootTransport(ABC):
+    """fastboot传输层基类, 子类实现USB或测试用的模拟设备"""
+
+    @abstractmethod
+    def write(self, data) -> int:
+        """发送一个数据包, 返回写入的字节数"""
+        pass
+
+    @abstractmethod
+    def read(self, size: int, timeout: float = None) -> bytes:
+        """读取一个数据包"""
+        pass
+
+    def close(self):
+        pass
+
+
+class UsbTransport(FastbootTransport):
+    """基于pyusb的fastboot USB传输"""
+
+    def __init__(self, device, interface, ep_in, ep_out, timeout: float = 30):
+        self.device = device
+        self.interface = interface
+        self.ep_in = ep_in
+        self.ep_out = ep_out
+        self.timeout = timeout
+
+    @staticmethod
+    def is_supported() -> bool:
+        return usb_backend() is not None
+
+    @staticmethod
+    def _devices():
+        """枚举USB设备; USB后端出错时抛出FastbootError, 调用方据此回退到fastboot程序"""
+        backend = usb_backend()
+        if backend is None:
+            raise FastbootError("USB不可用: 未安装pyusb或没有可用的libusb后端")
+        try:
+            return list(usb.core.find(find_all=True, backend=backend))
+        except (usb.core.USBError, ValueError, NotImplementedError) as e:
+            raise FastbootError(f"USB不可用: {e}") from e
+
+    @staticmethod
+    def _find_interface(device):
+        for config in device:
+            for interface in config:
+                if (interface.bInterfaceClass, interface.bInterfaceSubClass,
+                        interface.bInterfaceProtocol) == FASTBOOT_INTERFACE:
+                    return interface
+        return None
+
+    @classmethod
+    def list_serials(cls) -> list[str]:
+        """列出USB上所有fastboot设备的序列号"""
+        try:
+            devices = cls._devices()
+        except FastbootError:
+            return []
+        serials = []
+        for device in devices:
+            try:
+                if cls._find_interface(device) is not None:
+                    serials.append(usb.util.get_string(device, device.iSerialNumber))
+            except (usb.core.USBError, ValueError, NotImplementedError):
+                continue
+        return serials
+
+    @classmethod
+    def open(cls, serial: str = None, timeout: float = 30) -> "UsbTransport":
+        """打开指定序列号的fastboot设备, serial为None时打开第一个"""
+        for device in cls._devices():
+            try:
+                interface = cls._find_interface(device)
+                if interface is None:
+                    continue
+                if serial is not None and usb.util.get_string(device, device.iSerialNumber) != serial:
+                    continue
+                ep_in = usb.util.find_descriptor(interface, custom_match=lambda e: usb.util.endpoint_direction(
+                    e.bEndpointAddress) == usb.util.ENDPOINT_IN and usb.util.endpoint_type(
+                    e.bmAttributes) == usb.util.ENDPOINT_TYPE_BULK)
+                ep_out = usb.util.find_descriptor(interface, custom_match=lambda e: usb.util.endpoint_direction(
+                    e.bEndpointAddress) == usb.util.ENDPOINT_OUT and usb.util.endpoint_type(
+                    e.bmAttributes) == usb.util.ENDPOINT_TYPE_BULK)
+                if ep_in is None or ep_out is None:
+                    continue
+                usb.util.claim_interface(device, interface.bInterfaceNumber)
+                return cls(device, interface.bInterfaceNumber, ep_in, ep_out, timeout)
+            except (usb.core.USBError, ValueError, NotImplementedError):
+                continue
+        raise FastbootError(f"未找到Fastboot USB设备: {serial or ''}")
+
+    def write(self, data) -> int:
+        return self.ep_out.write(data, timeout=int(self.timeout * 1000))
+
+    def read(self, size: int, timeout: float = None) -> bytes:
+        if timeout is None:
+            timeout = self.timeout
+        return bytes(self.ep_in.read(size, timeout=int(timeout * 1000)))
+
+    def close(self):
+        try:
+            usb.util.release_interface(self.device, self.interface)
+            usb.util.dispose_resources(self.device)
+        except Exception:
+            pass
+
+
+class FastbootDevice:
+    """fastboot协议实现: 命令/应答, 以memoryview分块流式下载镜像并回报每块吞吐量"""
+
+    RESPONSE_SIZE = 256
+    TRANSFER_SIZE = 1024 * 1024
+    PACKET_ALIGN = 512
+    SPARSE_THRESHOLD = 0.5  # sparse大小低于raw的一半时才转换
+
+    def __init__(self, transport: FastbootTransport, info_callback=None):
+        self.transport = transport
+        self.info_callback = info_callback  # INFO/TEXT消息
+        self._max_download_size = None
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _read_response(self, timeout: float = None) -> tuple[str, str]:
+        while True:
+            packet = self.transport.read(self.RESPONSE_SIZE, timeout).decode("utf-8", "ignore")
+            status, payload = packet[:4], packet[4:]
+            if status in ("INFO", "TEXT"):
+                if self.info_callback:
+                    self.info_callback(payload)
+                continue
+            if status == "FAIL":
+                raise FastbootError(payload or "设备返回FAIL")
+            if status in ("OKAY", "DATA"):
+                return status, payload
+            raise FastbootError(f"未知的fastboot响应: {packet!r}")
+
+    def command(self, command: str, timeout: float = None) -> str:
+        """发送命令并等待OKAY, 返回OKAY后的内容"""
+        self.transport.write(command.encode("utf-8"))
+        status, payload = self._read_response(timeout)
+        if status != "OKAY":
+            raise FastbootError(f"命令 {command} 返回了意外的 {status}")
+        return payload
+
+    def getvar(self, name: str) -> str:
+        return self.command(f"getvar:{name}")
+
+    def max_download_size(self) -> int:
+        """设备单次download允许的最大字节数"""
+        if self._max_download_size is None:
+            try:
+                self._max_download_size = int(self.getvar("max-download-size"), 0)
+            except (FastbootError, ValueError):
+                self._max_download_size = 512 * 1024 * 1024
+        return self._max_download_size
+
+    def partition_size(self, partition: str) -> int:
+        return int(self.getvar(f"partition-size:{partition}"), 0)
+
+    def max_fetch_size(self) -> int:
+        """设备单次fetch允许的最大字节数, 不支持时按max-download-size计算"""
+        try:
+            return int(self.getvar("max-fetch-size"), 0)
+        except (FastbootError, ValueError):
+            return self.max_download_size()
+
+    def fetch(self, partition: str, offset: int, size: int, sink, progress_callback=None) -> int:
+        """读取分区中[offset, offset+size)的数据, 每收到一块调用sink(bytes), 返回读取的字节数"""
+        self.transport.write(f"fetch:{partition}:0x{offset:08x}:0x{size:08x}".encode("utf-8"))
+        status, payload = self._read_response()
+        if status != "DATA":
+            raise FastbootError(f"设备拒绝读取 {partition}: {status}{payload}")
+        total = int(payload, 16)
+        received = 0
+        while received < total:
+            start = time.perf_counter()
+            chunk = self.transport.read(min(self.TRANSFER_SIZE, total - received))
+            if not chunk:
+                raise FastbootError("USB读取失败")
+            sink(chunk)
+            received += len(chunk)
+            if progress_callback:
+                elapsed = time.perf_counter() - start
+                progress_callback(received, total, len(chunk) / elapsed if elapsed > 0 else 0.0)
+        self._read_response()
+        return total
+
+    def download(self, data, progress_callback=None):
+        """把data(bytes/memoryview)下载到设备, progress_callback(已发送, 总数, 本块吞吐量B/s)"""
+        view = memoryview(data).cast("B")
+        self.download_stream(len(view), [view], progress_callback)
+
+    def download_stream(self, total: int, buffers, progress_callback=None):
+        """把依次生成的多个缓冲区作为一次download发送, total为总字节数"""
+        self.transport.write(f"download:{total:08x}".encode("utf-8"))
+        status, payload = self._read_response()
+        if status != "DATA" or int(payload, 16) != total:
+            raise FastbootError(f"设备拒绝下载 {total} 字节: {status}{payload}")
+
+        state = {"sent": 0}
+
+        def send(chunk):
+            start = time.perf_counter()
+            written = self.transport.write(chunk)
+            if not written:
+                raise FastbootError("USB写入失败")
+            state["sent"] += written
+            if progress_callback:
+                elapsed = time.perf_counter() - start
+                progress_callback(state["sent"], total, written / elapsed if elapsed > 0 else 0.0)
+
+        # 小块(chunk头部等)合并到pending中, 大块数据直接发送memoryview切片;
+        # 除最后一次外每次写入都是USB包大小的整数倍, 避免中途出现短包
+        pending = bytearray()
+        for buffer in buffers:
+            view = memoryview(buffer).cast("B")
+            if pending:
+                # 先用当前缓冲区的开头把pending补齐到整包
+                need = -len(pending) % self.PACKET_ALIGN
+                pending += view[:need]
+                view = view[need:]
+                if len(pending) % self.PACKET_ALIGN or len(view) < self.PACKET_ALIGN:
+                    pending += view
+                    if len(pending) >= self.TRANSFER_SIZE:
+                        aligned = len(pending) - len(pending) % self.PACKET_ALIGN
+                        send(pending[:aligned])
+                        del pending[:aligned]
+                    continue
+                send(pending)
+                pending = bytearray()
+
+            aligned = len(view) - len(view) % self.PACKET_ALIGN
+            for pos in range(0, aligned, self.TRANSFER_SIZE):
+                send(view[pos:min(pos + self.TRANSFER_SIZE, aligned)])
+            pending += view[aligned:]
+        if pending:
+            send(pending)
+        if state["sent"] != total:
+            raise FastbootError(f"下载字节数不符: 预期 {total}, 实际 {state['sent']}")
+        self._read_response()
+
+    def flash(self, partition: str, timeout: float = 300) -> str:
+        return self.command(f"flash:{partition}", timeout)
+
+    def flash_sparse(self, partition: str, image: SparseImage, progress_callback=None):
+        """按max-download-size分割sparse镜像并逐片刷入"""
+        pieces = image.split(self.max_download_size())
+        total = sum(piece.size() for piece in pieces)
+        done = 0
+        for piece in pieces:
+            def on_chunk(sent, size, speed, done=done):
+                if progress_callback:
+                    progress_callback(done + sent, total, speed)
+
+            self.download_stream(piece.size(), piece.iter_buffers(), on_chunk)
+            self.flash(partition)
+            done += piece.size()
+
+    def flash_image(self, partition: str, image_path: str, progress_callback=None):
+        """以mmap零拷贝方式读取镜像文件并刷入分区"""
+        if os.path.getsize(image_path) == 0:
+            self.flash_view(partition, b"", progress_callback)
+            return
+
+        with open(image_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            self.flash_view(partition, view, progress_callback)
+        finally:
+            close_mapping(mapped, view)
+
+    def flash_view(self, partition: str, view, progress_callback=None):
+        """从内存视图刷入分区; 超过max-download-size或大部分为空块时以sparse格式发送"""
+        view = memoryview(view).cast("B")
+        if len(view) == 0:
+            self.download(view, progress_callback)
+            self.flash(partition)
+            return
+
+        image = SparseImage(view)
+        try:
+            if not image.sparse_input and len(view) <= self.max_download_size() and \
+                    image.size() > len(view) * self.SPARSE_THRESHOLD:
+                self.download(view, progress_callback)
+                self.flash(partition)
+            else:
+                self.flash_sparse(partition, image, progress_callback)
+        finally:
+            image.release()
+
+    def flash_stream(self, partition: str, size: int, reader, progress_callback=None) -> bool:
+        """边读边发送(如压缩包中的成员); 超过max-download-size时返回False, 由调用方解压后随机访问"""
+        if size > self.max_download_size():
+            return False
+
+        def buffers():
+            while True:
+                chunk = reader.read(self.TRANSFER_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+        self.download_stream(size, buffers(), progress_callback)
+        self.flash(partition)
+        return True
+
+    def reboot(self, target: str = None):
+        self.command(f"reboot-{target}" if target else "reboot")
@@ -1,15 +1,16 @@
 import os
 import re
-import subprocess
-import sys
 
 from .BaseTool import Tool
+from .MTKWorker import MTKWorker
 
 
 class MTKClientTool(Tool):
-    def __init__(self, path: str = None):
+    def __init__(self, path: str = None, persistent: bool = True):
         super().__init__(path)
         self.last_error = None
+        self.persistent = persistent  # 为False时每条命令单独启动mtk.py进程
+        self._worker = None
 
     @property
     def common_paths(self) -> dict[str, list[str]]:
@@ -34,50 +35,70 @@ class MTKClientTool(Tool):
         return os.path.exists(self.get_main_program(path))
 
 
+    def fingerprint_files(self, system: str = None, path: str = None) -> list[str]:
+        return [self.get_main_program(path)]
+
     def get_main_program(self, path: str = None) -> str:
         if path is None:
             path = self.get_path()
         return os.path.join(path, os.path.join("mtkclient-main", "mtk.py"))
 
+    def worker(self) -> MTKWorker:
+        """常驻的mtk.py工作进程, 工具路径变化后重新创建"""
+        main_program = self.get_main_program()
+        if self._worker is None or self._worker.main_program != main_program:
+            if self._worker is not None:
+                self._worker.close()
+            self._worker = MTKWorker(main_program, self.persistent)
+        return self._worker
+
+    def run(self, args: list[str], on_output=None, timeout: float = None) -> int | None:
+        """在工作进程中执行mtk.py命令, 返回退出码, 失败时返回None"""
+        worker = self.worker()
+        code = worker.run(args, on_output, timeout)
+        if code is None:
+            self.last_error = worker.last_error
+        return code
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.close()
+            self._worker = None
+
+    @staticmethod
+    def parse_devices(output: str) -> list[tuple[str, str]]:
+        """从detect命令的输出中解析设备, 返回[(端口, 设备信息)]"""
+        devices = []
+
+        # 匹配端口信息
+        port_pattern = r"Found Port:\s*(\S+)\s"
+        port_matches = re.findall(port_pattern, output)
+
+        # 匹配设备信息
+        device_pattern = r"Device detected:\s*(.+)"
+        device_matches = re.findall(device_pattern, output)
+
+        # 匹配芯片信息
+        chip_pattern = r"HW Chip:\s*(.+)"
+        chip_matches = re.findall(chip_pattern, output)
+
+        # 组合设备信息
+        if port_matches:
+            port = port_matches[0]
+            device_info = "MTK Device"
+
+            if device_matches:
+                device_info = device_matches[0]
+                if chip_matches:
+                    device_info += f" ({chip_matches[0]})"
+
+            devices.append((port, device_info))
+
+        return devices
+
     def detect_devices(self):
-        try:
-            # 使用更长的超时时间，因为检测可能需要一些时间
-            result = subprocess.run([sys.executable, self.get_main_program(), "detect"],
-                                    capture_output=True,
-                                    text=True,
-                                    timeout=30,  # 增加超时时间
-                                    encoding='utf-8',
-                                    errors='ignore')
-
-            # 解析MTK设备 - 使用更健壮的正则表达式匹配
-            devices = []
-
-            # 匹配端口信息
-            port_pattern = r"Found Port:\s*(\S+)\s"
-            port_matches = re.findall(port_pattern, result.stdout)
-
-            # 匹配设备信息
-            device_pattern = r"Device detected:\s*(.+)"
-            device_matches = re.findall(device_pattern, result.stdout)
-
-            # 匹配芯片信息
-            chip_pattern = r"HW Chip:\s*(.+)"
-            chip_matches = re.findall(chip_pattern, result.stdout)
-
-            # 组合设备信息
-            if port_matches:
-                port = port_matches[0]
-                device_info = "MTK Device"
-
-                if device_matches:
-                    device_info = device_matches[0]
-                    if chip_matches:
-                        device_info += f" ({chip_matches[0]})"
-
-                devices.append((port, device_info))
-
-            return devices
-        except Exception as e:
-            self.last_error = str(e)
+        lines = []
+        # 使用更长的超时时间，因为检测可能需要一些时间
+        if self.run(["detect"], lines.append, timeout=30) is None:
             return []
-
+        return self.parse_devices("\n".join(lines) + "\n")
@@ -0,0 +1,310 @@
+"""MTKClient常驻进程
+
+父进程通过 MTKWorker 启动本文件作为子进程, 子进程只导入一次mtkclient, 之后在同一个解释器中执行每条命令。
+通信使用JSON-lines:
+
+    请求(stdin):  {"id": 1, "cmd": "run", "args": ["detect"]} / {"cmd": "exit"}
+    响应(stdout): {"type": "ready", "error": null}
+                  {"id": 1, "type": "out", "line": "..."}
+                  {"id": 1, "type": "done", "code": 0}
+"""
+import itertools
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+START_TIMEOUT = 60  # 秒, 导入mtkclient的最长时间
+EXIT_TIMEOUT = 3
+
+
+class MTKWorker:
+    """mtk.py常驻工作进程: 第一条命令时启动, 之后的命令不再重新启动解释器和导入mtkclient
+
+    同一时间只执行一条命令; 取消或超时时结束整个进程, 下一条命令自动重新启动。
+    persistent为False时每条命令后进程退出, 与直接运行mtk.py相同
+    """
+
+    def __init__(self, main_program: str, persistent: bool = True):
+        self.main_program = main_program
+        self.persistent = persistent
+        self.last_error = None
+        self._process = None
+        self._messages = None
+        self._ready = False  # 已导入mtkclient
+        self._stderr = deque(maxlen=50)  # 进程异常退出时用于说明原因
+        self._ids = itertools.count(1)
+        self._run_lock = threading.Lock()  # 一次只执行一条命令
+        self._lock = threading.Lock()  # 保护_process
+
+    @property
+    def running(self) -> bool:
+        with self._lock:
+            return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """启动工作进程并在后台导入mtkclient, 不等待导入完成; 可以提前调用以预热"""
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                return
+            args = [sys.executable, "-u", os.path.abspath(__file__), self.main_program]
+            if not self.persistent:
+                args.append("--once")
+            process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            self._process = process
+            self._messages = queue.Queue()
+            self._ready = False
+            self._stderr.clear()
+        threading.Thread(target=self._read_messages, args=(process, self._messages), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(process,), daemon=True).start()
+
+    def _read_messages(self, process, messages):
+        try:
+            for raw in process.stdout:
+                try:
+                    messages.put(json.loads(raw))
+                except ValueError:
+                    continue
+        except (OSError, ValueError):
+            pass
+        messages.put(None)  # 进程已退出
+
+    def _read_stderr(self, process):
+        try:
+            for raw in process.stderr:
+                self._stderr.append(raw.decode("utf-8", "ignore").rstrip())
+        except (OSError, ValueError):
+            pass
+
+    def run(self, args: list[str], on_output=None, timeout: float = None) -> int | None:
+        """执行一条mtk.py命令, on_output(行) 在调用线程中调用; 返回退出码, 进程异常退出/取消/超时时返回None"""
+        with self._run_lock:
+            self.last_error = None
+            try:
+                self.start()
+            except OSError as e:
+                self.last_error = f"无法启动MTKClient进程: {e}"
+                return None
+            with self._lock:
+                process, messages = self._process, self._messages
+            request_id = next(self._ids)
+            try:
+                process.stdin.write(json.dumps({"id": request_id, "cmd": "run", "args": args}).encode("utf-8") + b"\n")
+                process.stdin.flush()
+            except (OSError, ValueError):
+                pass  # 进程已退出, 下面读取到结束标记
+
+            deadline = None
+            while True:
+                # 导入mtkclient的时间不计入命令超时
+                if not self._ready:
+                    wait = START_TIMEOUT
+                elif timeout is None:
+                    wait = None
+                else:
+                    if deadline is None:
+                        deadline = time.monotonic() + timeout
+                    wait = max(0.0, deadline - time.monotonic())
+                try:
+                    message = messages.get(timeout=wait)
+                except queue.Empty:
+                    self.last_error = f"命令超时 ({timeout}秒)" if self._ready else "导入MTKClient超时"
+                    self.stop()
+                    return None
+                if message is None:
+                    self._on_exit(process)
+                    return None
+                if message.get("type") == "ready":
+                    if message.get("error"):
+                        self.last_error = f"导入MTKClient失败: {message['error']}"
+                        self.stop()
+                        return None
+                    self._ready = True
+                    continue
+                if message.get("id") != request_id:
+                    continue
+                if message["type"] == "out":
+                    if on_output:
+                        on_output(message["line"])
+                elif message["type"] == "done":
+                    if not self.persistent:
+                        self._on_exit(process)
+                    return message["code"]
+
+    def _on_exit(self, process):
+        try:
+            process.wait(EXIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            pass
+        with self._lock:
+            if self._process is process:
+                self._process = None
+        if self.last_error is None:
+            detail = "\n".join(list(self._stderr)[-5:])
+            self.last_error = f"MTKClient进程已退出, 返回码: {process.returncode}" + (f"\n{detail}" if detail else "")
+
+    def cancel(self):
+        """取消正在执行的命令: 结束进程, 可以在任意线程调用"""
+        self.last_error = "已取消"
+        self.stop()
+
+    def stop(self):
+        """结束工作进程"""
+        with self._lock:
+            process, self._process = self._process, None
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(EXIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def close(self):
+        """通知工作进程退出, 未及时退出时结束进程"""
+        with self._lock:
+            process = self._process
+        if process is not None and process.poll() is None:
+            try:
+                process.stdin.write(b'{"cmd": "exit"}\n')
+                process.stdin.flush()
+                process.wait(EXIT_TIMEOUT)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                pass
+        self.stop()
+
+
+# ---- 子进程 ----
+
+class _LineWriter:
+    """替换子进程的sys.stdout/sys.stderr: 按行发送给父进程, \\r也作为行结束(进度条)"""
+
+    def __init__(self, send, request_id):
+        self._send = send
+        self._id = request_id
+        self._partial = ""
+        self._continued = False  # 当前行已经发出(flush或\r), 随后的换行不再产生空行
+        self._lock = threading.Lock()
+        self.encoding = "utf-8"
+
+    def write(self, text):
+        output = []
+        with self._lock:
+            lines = (self._partial + text).replace("\r\n", "\n").split("\n")
+            self._partial = lines.pop()
+            for line in lines:
+                parts = [part for part in line.split("\r") if part]
+                if parts or not self._continued:
+                    output.extend(parts or [""])
+                self._continued = False
+            if "\r" in self._partial:
+                *parts, self._partial = self._partial.split("\r")
+                parts = [part for part in parts if part]
+                if parts:
+                    output.extend(parts)
+                    self._continued = True
+        for line in output:
+            self._send({"id": self._id, "type": "out", "line": line})
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            line, self._partial = self._partial, ""
+            if line:
+                self._continued = True
+        if line:
+            self._send({"id": self._id, "type": "out", "line": line})
+
+    def isatty(self):
+        return False
+
+
+def _logging_handlers():
+    import logging
+    loggers = [logging.getLogger()] + [logger for logger in logging.Logger.manager.loggerDict.values()
+                                       if isinstance(logger, logging.Logger)]
+    return {(logger, handler) for logger in loggers for handler in logger.handlers}
+
+
+def _run_command(main_program, args, send, request_id):
+    import gc
+    import runpy
+    import traceback
+
+    writer = _LineWriter(send, request_id)
+    handlers = _logging_handlers()
+    stdout, stderr, argv = sys.stdout, sys.stderr, sys.argv
+    sys.stdout = sys.stderr = writer
+    sys.argv = [main_program] + args
+    code = 0
+    try:
+        runpy.run_path(main_program, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        writer.flush()
+        sys.stdout, sys.stderr, sys.argv = stdout, stderr, argv
+        # mtkclient每次运行都会添加日志处理器, 不移除的话之后的命令会重复输出
+        for logger, handler in _logging_handlers() - handlers:
+            logger.removeHandler(handler)
+            handler.close()
+        gc.collect()  # 尽快释放上一条命令打开的USB设备
+    return code
+
+
+def _serve(main_program, once=False):
+    # 协议使用原来的stdout, 之后直接写入文件描述符1的输出转到stderr, 不会混入协议
+    channel = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    requests = sys.stdin.buffer
+    sys.stdin = open(os.devnull)  # 命令中的input()不会读取请求
+    lock = threading.Lock()
+
+    def send(message):
+        data = json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+        with lock:
+            channel.write(data)
+            channel.flush()
+
+    # 与直接运行mtk.py相同, 从其所在目录导入mtkclient
+    sys.path[0] = os.path.dirname(os.path.abspath(main_program))
+    error = None
+    try:
+        import runpy
+        runpy.run_path(main_program, run_name="mtk_preload")  # 只导入, 不执行main
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+    send({"type": "ready", "error": error})
+    if error:
+        return
+
+    for raw in requests:
+        try:
+            request = json.loads(raw)
+        except ValueError:
+            continue
+        if request.get("cmd") == "exit":
+            break
+        if request.get("cmd") == "run":
+            code = _run_command(main_program, list(request.get("args", [])), send, request.get("id"))
+            send({"id": request.get("id"), "type": "done", "code": code})
+            if once:
+                break
+
+
+if __name__ == "__main__":
+    _serve(sys.argv[1], once="--once" in sys.argv[2:])
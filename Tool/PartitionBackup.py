@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import time
+
+from .FastbootDevice import FastbootDevice, FastbootError
+
+JOURNAL_VERSION = 1
+WRITE_BUFFER = 4 * 1024 * 1024
+
+
+class PartitionBackup:
+    """可续传的分区备份: 按偏移分块fetch, 日志记录每个已完成块的sha256, 边写入边计算整个分区的sha256
+
+    日志在备份完成后也保留, 由调用方随备份文件一起删除
+    """
+
+    CHUNK_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, device: FastbootDevice, chunk_size: int = None):
+        self.device = device
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.resumed_from = 0  # 本次从哪个偏移继续
+
+    @staticmethod
+    def journal_path(output_path: str) -> str:
+        return output_path + ".journal"
+
+    @staticmethod
+    def checksum_path(output_path: str) -> str:
+        return output_path + ".sha256"
+
+    def _load_journal(self, output_path: str, partition: str, size: int, chunk_size: int) -> list[str]:
+        """读取已完成块的sha256列表; 分区/大小/分块不一致或文件缺失时从头开始"""
+        try:
+            with open(self.journal_path(output_path), 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+            if journal.get("version") != JOURNAL_VERSION or journal.get("partition") != partition or \
+                    journal.get("size") != size or journal.get("chunk_size") != chunk_size:
+                return []
+            if os.path.getsize(output_path) != size:
+                return []
+            return list(journal.get("chunks", []))
+        except (OSError, ValueError):
+            return []
+
+    def _save_journal(self, output_path: str, partition: str, size: int, chunk_size: int, chunks: list[str]):
+        journal = {"version": JOURNAL_VERSION, "partition": partition, "size": size,
+                   "chunk_size": chunk_size, "chunks": chunks}
+        path = self.journal_path(output_path)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(journal, f)
+        os.replace(path + ".tmp", path)
+
+    def _verify_prefix(self, f, size: int, chunk_size: int, chunks: list[str], digest) -> list[str]:
+        """续传时重新读取已完成的部分, 既恢复整体sha256也校验每块; 返回校验通过的块"""
+        for index, expected in enumerate(chunks):
+            offset = index * chunk_size
+            f.seek(offset)
+            data = f.read(min(chunk_size, size - offset))
+            if hashlib.sha256(data).hexdigest() != expected:
+                return chunks[:index]
+            digest.update(data)
+        return chunks
+
+    def backup(self, partition: str, output_path: str, progress_callback=None) -> str:
+        """备份分区到output_path, 返回sha256; 中断后再次调用会从最后一个完整块继续
+
+        完成后保留日志: 再次调用只校验已有文件并返回sha256, 不会重新读取或截断已完成的分区
+        progress_callback(已读取, 总数, 吞吐量B/s)
+        """
+        size = self.device.partition_size(partition)
+        chunk_size = max(1, min(self.chunk_size, self.device.max_fetch_size()))
+        chunks = self._load_journal(output_path, partition, size, chunk_size)
+        digest = hashlib.sha256()
+
+        mode = 'r+b' if chunks else 'w+b'
+        with open(output_path, mode, buffering=WRITE_BUFFER) as f:
+            if chunks:
+                chunks = self._verify_prefix(f, size, chunk_size, chunks, digest)
+            else:
+                f.truncate(size)
+                self._save_journal(output_path, partition, size, chunk_size, chunks)
+            self.resumed_from = len(chunks) * chunk_size
+
+            offset = self.resumed_from
+            f.seek(offset)
+            while offset < size:
+                length = min(chunk_size, size - offset)
+                chunk_digest = hashlib.sha256()
+
+                def sink(data):
+                    f.write(data)
+                    digest.update(data)
+                    chunk_digest.update(data)
+
+                def on_chunk(received, total, speed, offset=offset):
+                    if progress_callback:
+                        progress_callback(offset + received, size, speed)
+
+                start = time.perf_counter()
+                received = self.device.fetch(partition, offset, length, sink, on_chunk)
+                if received != length:
+                    raise FastbootError(f"读取 {partition} 偏移 {offset} 时字节数不符: 预期 {length}, 实际 {received}")
+                # 先把数据写入磁盘再记录日志, 日志中的块一定已经完整
+                f.flush()
+                chunks.append(chunk_digest.hexdigest())
+                self._save_journal(output_path, partition, size, chunk_size, chunks)
+                offset += length
+                if progress_callback:
+                    elapsed = time.perf_counter() - start
+                    progress_callback(offset, size, length / elapsed if elapsed > 0 else 0.0)
+
+        checksum = digest.hexdigest()
+        with open(self.checksum_path(output_path), 'w', encoding='utf-8') as f:
+            f.write(f"{checksum}  {os.path.basename(output_path)}\n")
+        return checksum
@@ -1,15 +1,29 @@
+import hashlib
 import os
 import platform
+import re
+import shlex
+import shutil
 import subprocess
+import tempfile
 import time
 
+from .AdbClient import AdbClient, AdbError
+from .BackupContainer import pack_images
 from .BaseTool import Tool
+from .DeltaFlash import REGION_SIZE, changed_ranges, delta_supported, device_region_hashes, region_hashes
+from .FastbootDevice import FastbootDevice, FastbootError, UsbTransport
+from .PartitionBackup import PartitionBackup
+from .ProcessRunner import ProcessRunner
+from .SparseImage import close_mapping, is_sparse, open_image
 
 
 class PlatformTools(Tool):
     def __init__(self, path: str = None):
         super().__init__(path)
         self.last_error = None
+        self.adb_client = AdbClient()
+        self._runners = set()
 
     @property
     def common_paths(self) -> dict[str, list[str]]:
@@ -121,9 +135,20 @@ class PlatformTools(Tool):
 
     def get_adb_devices(self):
         """获取设备列表"""
+        # 优先通过ADB server套接字获取, server未启动时才启动adb进程
+        try:
+            return self._get_adb_devices_by_socket()
+        except (OSError, AdbError):
+            pass
+
         if not self.get_adb_stat():
             return []
 
+        try:
+            return self._get_adb_devices_by_socket()
+        except (OSError, AdbError):
+            pass
+
         try:
             result = subprocess.run([self.get_adb_path(), "devices"],
                                     capture_output=True,
@@ -145,6 +170,56 @@ class PlatformTools(Tool):
 
         return []
 
+    def _get_adb_devices_by_socket(self):
+        # 保持一条track-devices长连接, 之后的查询直接读取快照
+        if not self.adb_client.is_tracking():
+            self.adb_client.start_tracking()
+        return self.adb_client.devices()
+
+    def _execute_adb_command_by_socket(self, command, runner, output_callback=None):
+        """通过ADB server套接字执行shell/push/pull命令, 不支持的命令返回None"""
+        tokens = command.split()
+        serial = None
+        if len(tokens) >= 2 and tokens[0] == "-s":
+            serial = tokens[1]
+            tokens = tokens[2:]
+        if not tokens:
+            return None
+
+        if tokens[0] == "shell" and len(tokens) > 1:
+            # adb会把shell后面的参数用空格拼接, 这里保持相同的行为
+            stdout, stderr = runner.streams(output_callback, output_callback)
+            returncode = self.adb_client.shell_stream(serial, " ".join(tokens[1:]), stdout.feed, stderr.feed,
+                                                      runner.cancel_event)
+            stdout.close()
+            stderr.close()
+            if runner.cancelled:
+                return {'success': False, 'output': stdout.text(), 'error': stderr.text() + "已取消",
+                        'cancelled': True}
+            return {'success': returncode == 0, 'output': stdout.text(), 'error': stderr.text(),
+                    'truncated': stdout.truncated or stderr.truncated}
+
+        if tokens[0] in ("push", "pull"):
+            args = [arg.strip('"\'') for arg in shlex.split(" ".join(tokens[1:]), posix=False)]
+            if len(args) != 2 or (tokens[0] == "push" and os.path.isdir(args[0])):
+                # 多个源文件和目录交给adb程序处理; 拉取设备上的目录时pull抛出IsADirectoryError, 同样回退
+                return None
+            start = time.time()
+            if tokens[0] == "push":
+                size = self.adb_client.push(serial, args[0], args[1])
+            else:
+                local_path = args[1]
+                if os.path.isdir(local_path):
+                    local_path = os.path.join(local_path, os.path.basename(args[0]))
+                size = self.adb_client.pull(serial, args[0], local_path)
+            elapsed = max(time.time() - start, 1e-6)
+            return {
+                'success': True,
+                'output': f"{args[0]}: 1 file {tokens[0]}ed. {size / elapsed / 1024 / 1024:.1f} MB/s ({size} bytes in {elapsed:.3f}s)",
+                'error': ""
+            }
+        return None
+
     def get_fastboot_devices(self):
         """获取fastboot设备列表"""
         try:
@@ -168,50 +243,60 @@ class PlatformTools(Tool):
 
         return []
 
-    def execute_adb_command(self, command):
-        """执行ADB命令"""
-
+    def _run_command(self, args, timeout=60, output_callback=None, runner=None):
+        """通过ProcessRunner运行命令, 运行期间可被cancel_commands取消"""
+        runner = runner or ProcessRunner()
+        self._runners.add(runner)
         try:
-            result = subprocess.run([self.get_adb_path()] + command.split(),
-                                    capture_output=True,
-                                    text=True,
-                                    timeout=60,
-                                    encoding='utf-8',
-                                    errors='ignore')
-
-            # 检查授权问题
-            output = result.stdout + result.stderr
-            if "unauthorized" in output or "device unauthorized" in output:
+            return runner.run(args, timeout, output_callback, output_callback)
+        finally:
+            self._runners.discard(runner)
+
+    def cancel_commands(self):
+        """取消所有正在运行的ADB/Fastboot命令"""
+        for runner in list(self._runners):
+            runner.cancel()
+
+    def execute_adb_command(self, command, output_callback=None, runner=None):
+        """执行ADB命令, output_callback(行) 在输出产生时逐行调用"""
+        runner = runner or ProcessRunner()
+        try:
+            self._runners.add(runner)
+            try:
+                result = self._execute_adb_command_by_socket(command, runner, output_callback)
+            finally:
+                self._runners.discard(runner)
+            if result is not None:
+                return result
+        except AdbError as e:
+            if "unauthorized" in str(e):
                 return {
                     'success': False,
-                    'output': result.stdout,
+                    'output': "",
                     'error': "设备未授权，请检查设备屏幕并确认授权"
                 }
+            return {'success': False, 'output': "", 'error': str(e)}
+        except (OSError, ValueError):
+            # ADB server不可用或命令无法解析, 回退到adb进程
+            pass
 
-            return {
-                'success': result.returncode == 0,
-                'output': result.stdout,
-                'error': result.stderr
-            }
+        try:
+            result = self._run_command([self.get_adb_path()] + command.split(), 60, output_callback, runner)
+
+            # 检查授权问题(只看错误输出, 避免logcat等大量输出中的内容误判)
+            if "unauthorized" in result['error']:
+                result['success'] = False
+                result['error'] = "设备未授权，请检查设备屏幕并确认授权"
+            return result
         except Exception as e:
             self.last_error = str(e)
             return None
 
-    def execute_fastboot_command(self, command):
-        """执行Fastboot命令"""
+    def execute_fastboot_command(self, command, output_callback=None, runner=None):
+        """执行Fastboot命令, output_callback(行) 在输出产生时逐行调用; fastboot的大部分输出在stderr中"""
 
         try:
-            result = subprocess.run([self.get_fastboot_path()] + command.split(),
-                                    capture_output=True,
-                                    text=True,
-                                    timeout=60,
-                                    encoding='utf-8',
-                                    errors='ignore')
-            return {
-                'success': result.returncode == 0,
-                'output': result.stdout,
-                'error': result.stderr
-            }
+            return self._run_command([self.get_fastboot_path()] + command.split(), 60, output_callback, runner)
         except Exception as e:
             self.last_error = str(e)
             return None
@@ -224,17 +309,16 @@ class PlatformTools(Tool):
             cmd.append(mode)
 
         try:
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                    timeout=15, encoding='utf-8', errors='ignore')
+            result = self._run_command(cmd, 15)
 
             # 检查授权问题
-            output = result.stdout + result.stderr
+            output = result['output'] + result['error']
             if "unauthorized" in output or "device unauthorized" in output:
                 self.last_error = "设备未授权，请检查设备屏幕并确认授权"
                 return False, self.last_error
 
-            if result.returncode != 0:
-                self.last_error = result.stderr.strip() or result.stdout.strip() or "未知错误"
+            if not result['success']:
+                self.last_error = result['error'].strip() or result['output'].strip() or "未知错误"
                 return False, self.last_error
             return True, ""
         except Exception as e:
@@ -245,74 +329,328 @@ class PlatformTools(Tool):
         """Fastboot模式重启"""
 
         try:
-            result = subprocess.run([self.get_fastboot_path(), "reboot"],
-                                    capture_output=True,
-                                    text=True,
-                                    encoding='utf-8',
-                                    errors='ignore',
-                                    timeout=15)
+            result = self._run_command([self.get_fastboot_path(), "reboot"], 15)
 
-            if result.returncode != 0:
-                self.last_error = result.stderr.strip() or result.stdout.strip() or "未知错误"
+            if not result['success']:
+                self.last_error = result['error'].strip() or result['output'].strip() or "未知错误"
                 return False, self.last_error
             return True, ""
         except Exception as e:
             self.last_error = str(e)
             return False, str(e)
 
-    def unlock_bootloader(self):
-        """解锁Bootloader"""
+    def unlock_bootloader(self, runner=None):
+        """解锁Bootloader, 传入runner时可以通过它取消"""
         try:
-            result = subprocess.run([self.get_fastboot_path(), "flashing", "unlock"],
-                                    capture_output=True,
-                                    text=True,
-                                    timeout=60,
-                                    encoding='utf-8',
-                                    errors='ignore')
-            if result.returncode != 0:
-                result = subprocess.run([self.get_fastboot_path(), "oem", "unlock"],
-                                        capture_output=True,
-                                        text=True,
-                                        timeout=60,
-                                        encoding='utf-8',
-                                        errors='ignore')
+            # 需要在设备上确认, 等待期间可以通过cancel_commands取消
+            result = self._run_command([self.get_fastboot_path(), "flashing", "unlock"], 60, runner=runner)
+            if not result['success'] and not result['cancelled']:
+                result = self._run_command([self.get_fastboot_path(), "oem", "unlock"], 60, runner=runner)
 
-            if result.returncode != 0:
-                self.last_error = result.stderr.strip() or result.stdout.strip() or "解锁失败"
+            if not result['success']:
+                self.last_error = result['error'].strip() or result['output'].strip() or "解锁失败"
                 return False, self.last_error
             return True, ""
         except Exception as e:
             self.last_error = str(e)
             return False, str(e)
 
-    def lock_bootloader(self):
-        """锁定Bootloader"""
+    def lock_bootloader(self, runner=None):
+        """锁定Bootloader, 传入runner时可以通过它取消"""
 
         try:
-            result = subprocess.run([self.get_fastboot_path(), "flashing", "lock"],
-                                    capture_output=True,
-                                    text=True,
-                                    timeout=60,
-                                    encoding='utf-8',
-                                    errors='ignore')
-            if result.returncode != 0:
-                result = subprocess.run([self.get_fastboot_path(), "oem", "lock"],
-                                        capture_output=True,
-                                        text=True,
-                                        timeout=60,
-                                        encoding='utf-8',
-                                        errors='ignore')
+            # 需要在设备上确认, 等待期间可以通过cancel_commands取消
+            result = self._run_command([self.get_fastboot_path(), "flashing", "lock"], 60, runner=runner)
+            if not result['success'] and not result['cancelled']:
+                result = self._run_command([self.get_fastboot_path(), "oem", "lock"], 60, runner=runner)
 
-            if result.returncode != 0:
-                self.last_error = result.stderr.strip() or result.stdout.strip() or "锁定失败"
+            if not result['success']:
+                self.last_error = result['error'].strip() or result['output'].strip() or "锁定失败"
                 return False, self.last_error
             return True, ""
         except Exception as e:
             self.last_error = str(e)
             return False, str(e)
 
-    def flash_partition(self, partition, image_path):
-        """刷入分区"""
+    def max_download_size(self, serial=None):
+        """设备单次download的上限; USB不可用时返回None, 此时刷写回退到fastboot程序, 压缩成员都需要先解压"""
+        if not UsbTransport.is_supported():
+            return None
+        try:
+            with FastbootDevice(UsbTransport.open(serial)) as device:
+                return device.max_download_size()
+        except Exception as e:
+            self.last_error = str(e)
+            return None
+
+    def _flash_partition_native(self, partition, image_path, serial=None, progress_callback=None):
+        """通过USB直接刷入分区, USB不可用时返回None以回退到fastboot程序"""
+        if not UsbTransport.is_supported():
+            return None
+        try:
+            transport = UsbTransport.open(serial)
+        except FastbootError:
+            return None
+
+        with FastbootDevice(transport) as device:
+            device.flash_image(partition, image_path, progress_callback)
+        return True
+
+    def _flash_member_native(self, partition, member, serial=None, progress_callback=None):
+        """通过USB直接刷入固件包成员, 需要回退时返回None"""
+        if not UsbTransport.is_supported():
+            return None
+        try:
+            transport = UsbTransport.open(serial)
+        except FastbootError:
+            return None
+
+        with FastbootDevice(transport) as device:
+            view = member.map()
+            if view is not None:
+                try:
+                    device.flash_view(partition, view, progress_callback)
+                finally:
+                    view.release()
+                return True
+            with member.open() as reader:
+                if device.flash_stream(partition, member.size, reader, progress_callback):
+                    return True
+            # 超过max-download-size的压缩成员需要sparse分割, 解压后随机访问
+            with member.extract() as image_path:
+                device.flash_image(partition, image_path, progress_callback)
+            return True
+
+    def flash_partition_member(self, partition, member, serial=None, progress_callback=None):
+        """直接从固件包成员刷入: 存储成员零拷贝发送, 压缩成员边解压边发送, 需要随机访问时才解压到临时文件"""
+        try:
+            if self._flash_member_native(partition, member, serial, progress_callback):
+                return True
+        except Exception as e:
+            self.last_error = str(e)
+
+        # 回退到fastboot程序, 需要文件路径
+        try:
+            with member.extract() as image_path:
+                return self.flash_partition(partition, image_path, serial, progress_callback)
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    def _backup_partition_native(self, partition, output_path, serial=None, progress_callback=None):
+        """通过USB分块读取分区, USB不可用时返回None以回退到fastboot程序"""
+        if not UsbTransport.is_supported():
+            return None
+        try:
+            transport = UsbTransport.open(serial)
+        except FastbootError:
+            return None
+
+        with FastbootDevice(transport) as device:
+            return PartitionBackup(device).backup(partition, output_path, progress_callback)
+
+    def backup_partition(self, partition, output_path, serial=None, progress_callback=None):
+        """备份分区, 返回sha256, 失败时返回None; 通过USB读取时中断后再次调用可续传
+
+        progress_callback(已读取, 总数, 吞吐量B/s)
+        """
+        try:
+            checksum = self._backup_partition_native(partition, output_path, serial, progress_callback)
+            if checksum:
+                return checksum
+        except Exception as e:
+            # 保留日志和已读取的部分, 下次从断点继续
+            self.last_error = f"备份 {partition} 失败: {e}"
+            return None
+
+        # 回退到fastboot程序: 整体读取, 完成后再计算校验值
+        try:
+            cmd = [self.get_fastboot_path()]
+            if serial is not None:
+                cmd += ["-s", serial]
+            result = subprocess.run(cmd + ["getvar", f"partition-size:{partition}"],
+                                    capture_output=True, text=True, encoding='utf-8', errors='ignore',
+                                    timeout=60)
+            match = re.search(rf"partition-size:{re.escape(partition)}:\s*(0x[0-9a-fA-F]+|\d+)",
+                              result.stderr + result.stdout)
+            if not match:
+                self.last_error = f"无法获取分区大小: {partition}"
+                return None
+            partition_size = int(match.group(1), 0)
+
+            # 之前已完整备份(如打包失败后重试)时只校验文件, 不重新读取
+            checksum = self._verified_backup(output_path, partition_size)
+            if checksum:
+                return checksum
+
+            result = subprocess.run(cmd + ["fetch", partition, output_path],
+                                    capture_output=True, text=True, encoding='utf-8', errors='ignore')
+            if result.returncode != 0:
+                self.last_error = result.stderr.strip() or result.stdout.strip() or "备份失败"
+                return None
+            actual_size = os.path.getsize(output_path)
+            if actual_size != partition_size:
+                self.last_error = f"备份文件大小不匹配: 预期 {partition_size} 字节, 实际 {actual_size} 字节"
+                return None
+
+            checksum = self._file_sha256(output_path)
+            with open(PartitionBackup.checksum_path(output_path), 'w', encoding='utf-8') as f:
+                f.write(f"{checksum}  {os.path.basename(output_path)}\n")
+            return checksum
+        except Exception as e:
+            self.last_error = str(e)
+            return None
+
+    @staticmethod
+    def _file_sha256(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _verified_backup(self, output_path, size):
+        """备份文件大小正确且与.sha256记录一致时返回sha256, 否则返回None"""
+        try:
+            with open(PartitionBackup.checksum_path(output_path), 'r', encoding='utf-8') as f:
+                expected = f.read().split()[0]
+            if os.path.getsize(output_path) != size:
+                return None
+        except (OSError, IndexError):
+            return None
+        checksum = self._file_sha256(output_path)
+        return checksum if checksum == expected else None
+
+    def _backup_raw(self, partitions, work_dir, serial=None, progress_callback=None):
+        """把多个分区可续传地备份到work_dir, 返回 [(分区, 文件路径)], 失败时返回None; 已完成的分区再次调用时只做校验"""
+        os.makedirs(work_dir, exist_ok=True)
+        images = []
+        for partition in partitions:
+            image_path = os.path.join(work_dir, f"{partition}.img")
+            on_chunk = (lambda done, total, speed, partition=partition: progress_callback(partition, done, total)) \
+                if progress_callback else None
+            if not self.backup_partition(partition, image_path, serial, on_chunk):
+                return None
+            images.append((partition, image_path))
+        return images
+
+    def backup_partitions(self, partitions, container_path, serial=None, progress_callback=None, remove=False):
+        """备份多个分区并打包为压缩备份容器; 失败时保留已读取的raw文件, 再次调用可续传
+
+        remove为True时容器校验通过后删除raw文件, 否则保留在 <容器>.parts 目录中
+        progress_callback(分区, 已处理, 总数)
+        """
+        work_dir = container_path + ".parts"
+        images = self._backup_raw(partitions, work_dir, serial, progress_callback)
+        if images is None:
+            return False
+
+        try:
+            pack_images(container_path, images, remove=remove, progress_callback=progress_callback)
+        except Exception as e:
+            self.last_error = f"打包备份失败: {e}"
+            return False
+        if remove:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return True
+
+    def backup_partitions_to_store(self, partitions, store, serial=None, progress_callback=None, remove=False):
+        """备份多个分区到去重仓库, 返回备份清单, 失败时返回None; remove为True时仓库校验通过后删除raw文件"""
+        work_dir = os.path.join(store.root, "incoming", serial or "default")
+        images = self._backup_raw(partitions, work_dir, serial, progress_callback)
+        if images is None:
+            return None
+
+        try:
+            manifest = store.add_backup(images, device=serial, remove=remove, progress_callback=progress_callback)
+        except Exception as e:
+            self.last_error = f"写入备份仓库失败: {e}"
+            return None
+        if remove:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return manifest
+
+    def partition_hashes(self, partition, size, serial=None, region_size=REGION_SIZE):
+        """设备处于ADB模式时读取分区各区域的sha256(需要root), 失败时返回None"""
+        try:
+            hashes = device_region_hashes(self.adb_client, serial, partition, size // region_size, region_size)
+            if hashes is None:
+                self.last_error = f"无法读取 {partition} 分区哈希, 请确认设备已root"
+            return hashes
+        except (OSError, AdbError) as e:
+            self.last_error = str(e)
+            return None
+
+    def flash_partition_delta(self, partition, image_path, device_hashes, serial=None, progress_callback=None,
+                              region_size=REGION_SIZE):
+        """只刷入与设备上内容不同的区域, 其余块作为DONT_CARE跳过; 返回 (是否成功, 写入的数据字节数)"""
+        try:
+            size = os.path.getsize(image_path)
+            if size == 0 or is_sparse(image_path) or not delta_supported(partition):
+                # sparse镜像无法直接按raw区域比较, 可读写分区的内容在读取哈希后可能已改变, 都完整刷入
+                return self.flash_partition(partition, image_path, serial, progress_callback), size
+
+            image, mapped = open_image(image_path)
+            try:
+                ranges = changed_ranges(region_hashes(image.view, region_size), device_hashes, size,
+                                        region_size, image.block_size)
+                changed = min(size, sum(blocks for start, blocks in ranges) * image.block_size)
+                if not ranges:
+                    return True, 0
+                delta = image.only(ranges)
+
+                if UsbTransport.is_supported():
+                    try:
+                        transport = UsbTransport.open(serial)
+                    except FastbootError:
+                        transport = None
+                    if transport is not None:
+                        with FastbootDevice(transport) as device:
+                            device.flash_sparse(partition, delta, progress_callback)
+                        return True, changed
+
+                # 回退到fastboot程序, 写入临时sparse文件
+                cmd = [self.get_fastboot_path()]
+                if serial is not None:
+                    cmd += ["-s", serial]
+                fd, sparse_path = tempfile.mkstemp(prefix="delta_", suffix=".img")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        delta.write(f)
+                    result = subprocess.run(cmd + ["flash", partition, sparse_path],
+                                            capture_output=True, text=True, encoding='utf-8', errors='ignore',
+                                            timeout=300)
+                finally:
+                    os.remove(sparse_path)
+                if result.returncode != 0:
+                    self.last_error = result.stderr.strip() or result.stdout.strip() or "刷入失败"
+                    return False, changed
+                return True, changed
+            finally:
+                close_mapping(mapped, image.view)
+        except Exception as e:
+            self.last_error = str(e)
+            return False, 0
+
+    @staticmethod
+    def _make_sparse_image(image_path):
+        """大部分为空块的raw镜像先转换为sparse临时文件, 减少fastboot程序的传输量; 不需要转换时返回None"""
+        size = os.path.getsize(image_path)
+        if size == 0 or is_sparse(image_path):
+            return None
+        image, mapped = open_image(image_path)
+        try:
+            if image.size() > size * FastbootDevice.SPARSE_THRESHOLD:
+                return None
+            fd, sparse_path = tempfile.mkstemp(prefix="sparse_", suffix=".img")
+            with os.fdopen(fd, "wb") as f:
+                image.write(f)
+            return sparse_path
+        finally:
+            close_mapping(mapped, image.view)
+
+    def flash_partition(self, partition, image_path, serial=None, progress_callback=None):
+        """刷入分区, 指定serial时只刷写该设备; progress_callback(已发送, 总数, 吞吐量B/s)"""
 
         try:
             # 增加重试机制
@@ -325,16 +663,30 @@ class PlatformTools(Tool):
                 try:
                     # 检查设备连接
                     devices = self.get_fastboot_devices()
+                    if serial is not None:
+                        devices = [device for device in devices if device[0] == serial]
                     if not devices:
                         error_log.append(f"第{retry_count + 1}次重试: 未检测到Fastboot设备")
                         time.sleep(2)
                         retry_count += 1
                         continue
 
+                    # 优先通过USB直接刷入, 可以回报进度且没有整体超时
+                    if self._flash_partition_native(partition, image_path, serial, progress_callback):
+                        return True
+
                     # 执行刷入命令
-                    result = subprocess.run([self.get_fastboot_path(), "flash", partition, image_path],
-                                            capture_output=True, text=True, encoding='utf-8', errors='ignore',
-                                            timeout=300)
+                    cmd = [self.get_fastboot_path()]
+                    if serial is not None:
+                        cmd += ["-s", serial]
+                    sparse_path = self._make_sparse_image(image_path)
+                    try:
+                        result = subprocess.run(cmd + ["flash", partition, sparse_path or image_path],
+                                                capture_output=True, text=True, encoding='utf-8', errors='ignore',
+                                                timeout=300)
+                    finally:
+                        if sparse_path:
+                            os.remove(sparse_path)
                     if result.returncode == 0:
                         return True
                     else:
@@ -0,0 +1,159 @@
+import codecs
+import subprocess
+import threading
+from collections import deque
+
+MAX_OUTPUT = 2 * 1024 * 1024  # 每个输出流最多保留的字符数, 超出后丢弃最早的行
+MAX_LINE = 64 * 1024  # 没有换行符的超长输出按此长度强制分行
+READ_SIZE = 64 * 1024
+KILL_TIMEOUT = 3  # 取消时先terminate, 超过此秒数仍未退出则kill
+
+
+class OutputStream:
+    """逐行解码输出: 每行交给回调, 并在环形缓冲中只保留最近的 max_chars 个字符"""
+
+    def __init__(self, callback=None, max_chars: int = MAX_OUTPUT):
+        self.callback = callback
+        self.max_chars = max_chars
+        self.dropped_lines = 0
+        self._lines = deque()
+        self._chars = 0
+        self._partial = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._lock = threading.Lock()
+
+    def feed(self, data: bytes):
+        text = self._partial + self._decoder.decode(data)
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        if len(self._partial) > MAX_LINE:
+            lines.append(self._partial)
+            self._partial = ""
+        for line in lines:
+            self._add_line(line.rstrip("\r"))
+
+    def close(self):
+        """输出结束, 处理最后一个没有换行符的行"""
+        text = self._partial + self._decoder.decode(b"", final=True)
+        self._partial = ""
+        if text:
+            self._add_line(text.rstrip("\r"))
+
+    def _add_line(self, line: str):
+        with self._lock:
+            self._lines.append(line)
+            self._chars += len(line) + 1
+            while self._chars > self.max_chars and len(self._lines) > 1:
+                self._chars -= len(self._lines.popleft()) + 1
+                self.dropped_lines += 1
+        if self.callback:
+            self.callback(line)
+
+    @property
+    def truncated(self) -> bool:
+        return self.dropped_lines > 0
+
+    def text(self) -> str:
+        with self._lock:
+            body = "\n".join(self._lines)
+            if self._lines:
+                body += "\n"
+        if self.dropped_lines:
+            return f"... (已省略前 {self.dropped_lines} 行输出)\n" + body
+        return body
+
+
+class ProcessRunner:
+    """运行外部命令: 后台线程逐行读取stdout/stderr并实时回调, 输出内存有上限, 可以从其他线程取消
+
+    run() 返回与原有调用方一致的字典 {success, output, error}, 另外附带 returncode/cancelled/timed_out/truncated
+    """
+
+    def __init__(self, max_output: int = MAX_OUTPUT):
+        self.max_output = max_output
+        self.cancel_event = threading.Event()
+        self._process = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """取消正在运行的命令, 可以在任意线程调用"""
+        self.cancel_event.set()
+        with self._lock:
+            process = self._process
+        if process is not None and process.poll() is None:
+            try:
+                process.terminate()
+            except OSError:
+                pass
+
+    def streams(self, on_stdout=None, on_stderr=None) -> tuple[OutputStream, OutputStream]:
+        return OutputStream(on_stdout, self.max_output), OutputStream(on_stderr, self.max_output)
+
+    @staticmethod
+    def _pump(pipe, stream: OutputStream):
+        try:
+            while True:
+                data = pipe.read1(READ_SIZE)
+                if not data:
+                    break
+                stream.feed(data)
+        except (OSError, ValueError):
+            pass
+        finally:
+            stream.close()
+            pipe.close()
+
+    def run(self, args: list[str], timeout: float = 60, on_stdout=None, on_stderr=None, cwd: str = None) -> dict:
+        """运行命令直到结束/超时/取消; on_stdout/on_stderr(行) 在读取线程中调用"""
+        stdout, stderr = self.streams(on_stdout, on_stderr)
+        result = {'success': False, 'output': "", 'error': "", 'returncode': None,
+                  'cancelled': False, 'timed_out': False, 'truncated': False}
+        if self.cancelled:
+            result['cancelled'] = True
+            result['error'] = "已取消"
+            return result
+
+        process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   cwd=cwd)
+        with self._lock:
+            self._process = process
+        readers = [threading.Thread(target=self._pump, args=(process.stdout, stdout), daemon=True),
+                   threading.Thread(target=self._pump, args=(process.stderr, stderr), daemon=True)]
+        for reader in readers:
+            reader.start()
+        # 在等待期间取消时进程已被terminate, wait会随之返回
+        if self.cancelled:
+            self.cancel()
+
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            result['timed_out'] = True
+            process.terminate()
+        try:
+            process.wait(KILL_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        # 命令启动的后台进程(如adb server)可能继承了管道, 不无限等待读取线程
+        for reader in readers:
+            reader.join(KILL_TIMEOUT)
+        with self._lock:
+            self._process = None
+
+        result['returncode'] = process.returncode
+        result['cancelled'] = self.cancelled
+        result['truncated'] = stdout.truncated or stderr.truncated
+        result['output'] = stdout.text()
+        result['error'] = stderr.text()
+        if result['cancelled']:
+            result['error'] += "已取消"
+        elif result['timed_out']:
+            result['error'] += f"命令超时 ({timeout}秒)"
+        else:
+            result['success'] = process.returncode == 0
+        return result
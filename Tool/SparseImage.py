@@ -0,0 +1,301 @@
+import mmap
+import struct
+from itertools import compress
+from operator import eq
+
+SPARSE_MAGIC = 0xED26FF3A
+SPARSE_HEADER = struct.Struct("<I4H4I")  # magic, major, minor, file_hdr_sz, chunk_hdr_sz, blk_sz, total_blks, total_chunks, checksum
+CHUNK_HEADER = struct.Struct("<2H2I")  # chunk_type, reserved, chunk_sz(块数), total_sz(含头部字节数)
+
+CHUNK_TYPE_RAW = 0xCAC1
+CHUNK_TYPE_FILL = 0xCAC2
+CHUNK_TYPE_DONT_CARE = 0xCAC3
+CHUNK_TYPE_CRC32 = 0xCAC4
+
+# 一次比较的窗口大小, 整个窗口全零时一次memcmp即可跳过
+SCAN_WINDOW = 1024 * 1024
+
+
+class SparseChunk:
+    """sparse chunk描述, RAW数据不复制, 只记录其在源数据中的偏移"""
+    __slots__ = ("chunk_type", "start", "blocks", "offset", "fill")
+
+    def __init__(self, chunk_type: int, start: int, blocks: int, offset: int = 0, fill: bytes = None):
+        self.chunk_type = chunk_type
+        self.start = start  # 起始块号
+        self.blocks = blocks
+        self.offset = offset  # RAW数据在源中的字节偏移
+        self.fill = fill  # FILL的4字节图案
+
+    @property
+    def end(self) -> int:
+        return self.start + self.blocks
+
+    def data_size(self, block_size: int) -> int:
+        if self.chunk_type == CHUNK_TYPE_RAW:
+            return self.blocks * block_size
+        if self.chunk_type == CHUNK_TYPE_FILL:
+            return 4
+        return 0
+
+
+def is_sparse(path: str) -> bool:
+    """判断文件是否为Android sparse镜像"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(4)
+        return len(header) == 4 and struct.unpack("<I", header)[0] == SPARSE_MAGIC
+    except OSError:
+        return False
+
+
+class SparseImage:
+    """Android sparse镜像: 把raw镜像流式编码为sparse chunk, 或解析已有sparse镜像, 并按大小上限分割"""
+
+    def __init__(self, view, block_size: int = 4096, zero_as_dont_care: bool = False):
+        self.view = memoryview(view).cast("B")
+        self.block_size = block_size
+        self.chunks = []
+        self.total_blocks = 0
+        self.sparse_input = len(self.view) >= SPARSE_HEADER.size and \
+            struct.unpack_from("<I", self.view, 0)[0] == SPARSE_MAGIC
+        if self.sparse_input:
+            self._parse()
+        else:
+            self._scan(zero_as_dont_care)
+
+    @classmethod
+    def _from_chunks(cls, parent: "SparseImage", chunks: list[SparseChunk]) -> "SparseImage":
+        image = cls.__new__(cls)
+        image.view = parent.view
+        image.block_size = parent.block_size
+        image.total_blocks = parent.total_blocks
+        image.sparse_input = parent.sparse_input
+        image.chunks = chunks
+        return image
+
+    def release(self):
+        self.view.release()
+
+    # ---- 编码/解析 ----
+
+    def _append(self, chunk_type: int, start: int, blocks: int, offset: int = 0, fill: bytes = None):
+        last = self.chunks[-1] if self.chunks else None
+        if last is not None and last.chunk_type == chunk_type and last.end == start and (
+                (chunk_type == CHUNK_TYPE_RAW and last.offset + last.blocks * self.block_size == offset) or
+                (chunk_type == CHUNK_TYPE_FILL and last.fill == fill) or
+                chunk_type == CHUNK_TYPE_DONT_CARE):
+            last.blocks += blocks
+            return
+        self.chunks.append(SparseChunk(chunk_type, start, blocks, offset, fill))
+
+    def _scan(self, zero_as_dont_care: bool):
+        bs = self.block_size
+        size = len(self.view)
+        self.total_blocks = (size + bs - 1) // bs
+        window_size = max(bs, SCAN_WINDOW // bs * bs)
+        zero_window = bytes(window_size)
+        zero_type = CHUNK_TYPE_DONT_CARE if zero_as_dont_care else CHUNK_TYPE_FILL
+        zero_fill = None if zero_as_dont_care else b"\0\0\0\0"
+
+        for window_start in range(0, size, window_size):
+            first_block = window_start // bs
+            with self.view[window_start:window_start + window_size] as window:
+                # 整个窗口一次比较, 空分区绝大部分窗口在这里直接跳过
+                if len(window) == window_size and window.tobytes() == zero_window:
+                    self._append(zero_type, first_block, window_size // bs, fill=zero_fill)
+                    continue
+                full = len(window) // bs * bs
+                if full:
+                    with window[:full] as blocks:
+                        self._scan_blocks(blocks, first_block, window_start, zero_type, zero_fill)
+                if full < len(window):
+                    # 最后不足一块的数据按补零后的整块处理
+                    block = window[full:].tobytes() + bytes(bs - (len(window) - full))
+                    self._append_block(block, first_block + full // bs, window_start + full, zero_type, zero_fill)
+
+    def _scan_blocks(self, blocks, first_block: int, offset: int, zero_type: int, zero_fill: bytes):
+        """对整块组成的窗口分类: 首尾4字节相同的块才可能是填充块, 先在C层面批量筛选, 其余块按连续的RAW段一次记录"""
+        bs = self.block_size
+        words_per_block = bs // 4
+        with blocks.cast("I") as words:
+            candidates = compress(range(len(blocks) // bs),
+                                  map(eq, words[0::words_per_block], words[words_per_block - 1::words_per_block]))
+            raw_start = 0
+            for index in candidates:
+                block = blocks[index * bs:(index + 1) * bs].tobytes()
+                if block[:4] * words_per_block != block:
+                    continue
+                if index > raw_start:
+                    self._append(CHUNK_TYPE_RAW, first_block + raw_start, index - raw_start,
+                                 offset=offset + raw_start * bs)
+                self._append_block(block, first_block + index, offset + index * bs, zero_type, zero_fill)
+                raw_start = index + 1
+        total = len(blocks) // bs
+        if raw_start < total:
+            self._append(CHUNK_TYPE_RAW, first_block + raw_start, total - raw_start, offset=offset + raw_start * bs)
+
+    def _append_block(self, block: bytes, index: int, offset: int, zero_type: int, zero_fill: bytes):
+        pattern = block[:4]
+        if pattern * (len(block) // 4) != block:
+            self._append(CHUNK_TYPE_RAW, index, 1, offset=offset)
+        elif pattern == b"\0\0\0\0":
+            self._append(zero_type, index, 1, fill=zero_fill)
+        else:
+            self._append(CHUNK_TYPE_FILL, index, 1, fill=pattern)
+
+    def _parse(self):
+        (magic, major, minor, file_hdr_sz, chunk_hdr_sz, blk_sz,
+         total_blks, total_chunks, checksum) = SPARSE_HEADER.unpack_from(self.view, 0)
+        if major != 1:
+            raise ValueError(f"不支持的sparse版本: {major}.{minor}")
+        self.block_size = blk_sz
+        self.total_blocks = total_blks
+        pos = file_hdr_sz
+        block = 0
+        for _ in range(total_chunks):
+            chunk_type, _, chunk_sz, total_sz = CHUNK_HEADER.unpack_from(self.view, pos)
+            data = pos + chunk_hdr_sz
+            if chunk_type == CHUNK_TYPE_RAW:
+                self._append(CHUNK_TYPE_RAW, block, chunk_sz, offset=data)
+            elif chunk_type == CHUNK_TYPE_FILL:
+                self._append(CHUNK_TYPE_FILL, block, chunk_sz, fill=self.view[data:data + 4].tobytes())
+            elif chunk_type == CHUNK_TYPE_DONT_CARE:
+                self._append(CHUNK_TYPE_DONT_CARE, block, chunk_sz)
+            elif chunk_type != CHUNK_TYPE_CRC32:
+                raise ValueError(f"未知的sparse chunk类型: {chunk_type:#x}")
+            pos += total_sz
+            block += chunk_sz
+
+    # ---- 输出 ----
+
+    def _layout(self) -> list[SparseChunk]:
+        """补齐DONT_CARE后的完整chunk序列"""
+        layout = []
+        block = 0
+        for chunk in self.chunks:
+            if chunk.chunk_type == CHUNK_TYPE_DONT_CARE:
+                continue
+            if chunk.start > block:
+                layout.append(SparseChunk(CHUNK_TYPE_DONT_CARE, block, chunk.start - block))
+            layout.append(chunk)
+            block = chunk.end
+        if block < self.total_blocks:
+            layout.append(SparseChunk(CHUNK_TYPE_DONT_CARE, block, self.total_blocks - block))
+        return layout
+
+    def size(self) -> int:
+        """sparse输出的字节数"""
+        layout = self._layout()
+        return SPARSE_HEADER.size + sum(CHUNK_HEADER.size + c.data_size(self.block_size) for c in layout)
+
+    def raw_size(self) -> int:
+        return self.total_blocks * self.block_size
+
+    def iter_buffers(self):
+        """依次生成sparse文件内容, RAW数据为源数据的memoryview切片"""
+        bs = self.block_size
+        layout = self._layout()
+        yield SPARSE_HEADER.pack(SPARSE_MAGIC, 1, 0, SPARSE_HEADER.size, CHUNK_HEADER.size,
+                                 bs, self.total_blocks, len(layout), 0)
+        for chunk in layout:
+            data_size = chunk.data_size(bs)
+            yield CHUNK_HEADER.pack(chunk.chunk_type, 0, chunk.blocks, CHUNK_HEADER.size + data_size)
+            if chunk.chunk_type == CHUNK_TYPE_RAW:
+                data = self.view[chunk.offset:chunk.offset + data_size]
+                yield data
+                if len(data) < data_size:
+                    # raw镜像末尾不足一块时补零
+                    yield bytes(data_size - len(data))
+            elif chunk.chunk_type == CHUNK_TYPE_FILL:
+                yield chunk.fill
+
+    def write(self, fileobj):
+        for buffer in self.iter_buffers():
+            fileobj.write(buffer)
+
+    def only(self, ranges: list[tuple[int, int]]) -> "SparseImage":
+        """只保留ranges [(起始块, 块数)] 内的数据, 其余为DONT_CARE, 刷入时设备上的这些块保持不变"""
+        bs = self.block_size
+        chunks = []
+        first = 0
+        for chunk in self.chunks:
+            if chunk.chunk_type == CHUNK_TYPE_DONT_CARE:
+                continue
+            # ranges与chunks都按块号排序, 已经落在chunk之前的区间不再检查
+            while first < len(ranges) and ranges[first][0] + ranges[first][1] <= chunk.start:
+                first += 1
+            for start, blocks in ranges[first:]:
+                if start >= chunk.end:
+                    break
+                lo = max(start, chunk.start)
+                hi = min(start + blocks, chunk.end)
+                if lo < hi:
+                    offset = chunk.offset + (lo - chunk.start) * bs if chunk.chunk_type == CHUNK_TYPE_RAW else 0
+                    chunks.append(SparseChunk(chunk.chunk_type, lo, hi - lo, offset, chunk.fill))
+        return SparseImage._from_chunks(self, chunks)
+
+    def split(self, max_size: int) -> list["SparseImage"]:
+        """按大小上限分割, 每一片都覆盖完整分区, 其余区域为DONT_CARE"""
+        bs = self.block_size
+        # 文件头 + 结尾DONT_CARE
+        base = SPARSE_HEADER.size + CHUNK_HEADER.size
+        if max_size < base + 2 * CHUNK_HEADER.size + bs:
+            raise ValueError(f"分割上限过小: {max_size}")
+
+        pieces = []
+        current = []
+        current_size = base
+        next_block = 0
+
+        def gap_cost(start):
+            return CHUNK_HEADER.size if start > next_block else 0
+
+        for chunk in self.chunks:
+            if chunk.chunk_type == CHUNK_TYPE_DONT_CARE:
+                continue
+            chunk = SparseChunk(chunk.chunk_type, chunk.start, chunk.blocks, chunk.offset, chunk.fill)
+            while True:
+                cost = gap_cost(chunk.start) + CHUNK_HEADER.size + chunk.data_size(bs)
+                if current_size + cost <= max_size:
+                    current.append(chunk)
+                    current_size += cost
+                    next_block = chunk.end
+                    break
+
+                if chunk.chunk_type == CHUNK_TYPE_RAW:
+                    # RAW chunk按剩余空间切开, 剩余部分放到下一片
+                    room = max_size - current_size - gap_cost(chunk.start) - CHUNK_HEADER.size
+                    blocks = room // bs
+                    if blocks > 0:
+                        current.append(SparseChunk(CHUNK_TYPE_RAW, chunk.start, blocks, chunk.offset))
+                        chunk = SparseChunk(CHUNK_TYPE_RAW, chunk.start + blocks, chunk.blocks - blocks,
+                                            chunk.offset + blocks * bs)
+                if not current:
+                    raise ValueError(f"分割上限过小: {max_size}")
+                pieces.append(SparseImage._from_chunks(self, current))
+                current = []
+                current_size = base
+                next_block = 0
+
+        if current or not pieces:
+            pieces.append(SparseImage._from_chunks(self, current))
+        return pieces
+
+
+def open_image(path: str, block_size: int = 4096, zero_as_dont_care: bool = False) -> tuple[SparseImage, mmap.mmap]:
+    """mmap镜像文件并构建SparseImage, 用完后调用close_mapping(mapped, image.view)"""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return SparseImage(mapped, block_size, zero_as_dont_care), mapped
+
+
+def close_mapping(mapped: mmap.mmap, *views):
+    """释放视图并关闭mmap; 异常回溯中仍引用着切片时close()会抛出BufferError,
+    此时交给垃圾回收, 不掩盖原来的异常"""
+    try:
+        for view in views:
+            view.release()
+        mapped.close()
+    except BufferError:
+        pass
@@ -0,0 +1,118 @@
+import json
+import os
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .BaseTool import Tool
+
+INDEX_VERSION = 1
+
+
+class ToolRegistry:
+    """工具路径索引: 记录已确认可用的工具路径及其可执行文件的inode/修改时间/大小, 文件未变化时无需再启动进程探测"""
+
+    def __init__(self, index_path: str = None):
+        self.index_path = index_path or os.path.join("cache", "tools.json")
+        self.last_error = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    # ---- 索引 ----
+
+    def _load(self) -> dict:
+        if self._index is None:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                self._index = index if index.get("version") == INDEX_VERSION else {}
+            except FileNotFoundError:
+                self._index = {}
+            except (OSError, ValueError) as e:
+                self.last_error = str(e)
+                self._index = {}
+            self._index.setdefault("version", INDEX_VERSION)
+            self._index.setdefault("tools", {})
+        return self._index
+
+    def _save(self):
+        try:
+            directory = os.path.dirname(self.index_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.index_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(self._index, f, ensure_ascii=False)
+            os.replace(self.index_path + ".tmp", self.index_path)
+        except OSError as e:
+            self.last_error = str(e)
+
+    @staticmethod
+    def _key(tool: Tool, system: str) -> str:
+        return f"{tool.name}:{system}"
+
+    @staticmethod
+    def fingerprint(tool: Tool, system: str, path: str) -> dict | None:
+        """可执行文件的 {文件: [inode, 修改时间, 大小]}, 文件缺失时返回None"""
+        files = tool.fingerprint_files(system, path)
+        if not files:
+            return None
+        fingerprint = {}
+        for file in files:
+            try:
+                stat = os.stat(file)
+            except OSError:
+                return None
+            fingerprint[file] = [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+        return fingerprint
+
+    def invalidate(self, tool: Tool, system: str = None):
+        """删除工具的索引项, 下次解析时重新探测"""
+        if system is None:
+            system = platform.system().lower()
+        with self._lock:
+            if self._load()["tools"].pop(self._key(tool, system), None) is not None:
+                self._save()
+
+    # ---- 解析 ----
+
+    def resolve(self, tool: Tool, system: str = None) -> bool:
+        """把工具路径切换到可用位置; 索引命中且文件未变化时只需stat, 否则并行探测所有候选路径"""
+        if system is None:
+            system = platform.system().lower()
+        key = self._key(tool, system)
+        with self._lock:
+            entry = self._load()["tools"].get(key)
+        if entry is not None and self.fingerprint(tool, system, entry["path"]) == entry["files"]:
+            tool.set_path(entry["path"])
+            return True
+
+        path = self.probe(tool, system)
+        with self._lock:
+            tools = self._load()["tools"]
+            fingerprint = self.fingerprint(tool, system, path) if path is not None else None
+            if fingerprint is not None:
+                tools[key] = {"path": path, "files": fingerprint}
+                self._save()
+            elif tools.pop(key, None) is not None:
+                self._save()
+        return path is not None
+
+    def probe(self, tool: Tool, system: str = None) -> str | None:
+        """并行检查当前路径和常见路径, 按候选顺序返回第一个可用路径"""
+        if system is None:
+            system = platform.system().lower()
+        candidates = list(dict.fromkeys([tool.get_path()] + tool.get_common_paths(system)))
+        with ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix="probe") as executor:
+            results = list(executor.map(lambda path: tool.is_available(system, path), candidates))
+        for path, available in zip(candidates, results):
+            if available:
+                tool.set_path(path)
+                return path
+        return None
+
+    def resolve_all(self, tools: list[Tool], system: str = None) -> list[bool]:
+        """同时解析多个工具"""
+        if not tools:
+            return []
+        with ThreadPoolExecutor(max_workers=len(tools), thread_name_prefix="resolve") as executor:
+            return list(executor.map(lambda tool: self.resolve(tool, system), tools))
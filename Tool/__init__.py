@@ -1,3 +1,14 @@
+from .AdbClient import AdbClient, AdbError
 from .MTKClientTool import MTKClientTool
 from .BaseTool import Tool
-from .PlatformTools import PlatformTools
\ No newline at end of file
+from .PlatformTools import PlatformTools
+from .DeviceWatcher import DeviceWatcher
+from .FastbootDevice import FastbootDevice, FastbootError, UsbTransport
+from .SparseImage import SparseImage, is_sparse
+from .ToolRegistry import ToolRegistry
+from .PartitionBackup import PartitionBackup
+from .BackupContainer import BackupReader, BackupWriter, pack_images
+from .ChunkStore import ChunkStore
+from .DeltaFlash import changed_ranges, delta_supported, region_hashes
+from .ProcessRunner import ProcessRunner
+from .MTKWorker import MTKWorker
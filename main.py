@@ -1,15 +1,27 @@
+import multiprocessing
 import sys
 
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QFont, QPixmap, QColor
-from PySide6.QtWidgets import (QApplication, QSplashScreen)
+from StartupProfiler import StartupProfiler
+
+profiler = StartupProfiler()
 
-from FlashTool import FlashTool
 from utils import install_python_dependencies
 
 if __name__ == "__main__":
-    # 检测并安装Python依赖
+    # 打包后的程序中进程池(备份压缩)需要
+    multiprocessing.freeze_support()
+
+    # 检测并安装Python依赖, 必须在导入界面库之前, 缺少PySide6时先安装再导入
     install_python_dependencies()
+    profiler.mark("检查依赖")
+
+    from PySide6.QtCore import Qt, QTimer
+    from PySide6.QtGui import QFont, QPixmap, QColor
+    from PySide6.QtWidgets import (QApplication, QSplashScreen)
+
+    from FlashTool import FlashTool
+
+    profiler.mark("导入模块")
     
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
@@ -26,12 +38,16 @@ if __name__ == "__main__":
     splash.showMessage("正在初始化...", Qt.AlignBottom | Qt.AlignCenter, Qt.white)
     splash.show()
     app.processEvents()
+    profiler.mark("创建启动画面")
     
     # 初始化主窗口
-    tool = FlashTool(splash)
+    tool = FlashTool(splash, profiler)
     
     # 关闭启动画面
     tool.show()
     splash.finish(tool)
+    profiler.mark("显示主窗口")
+    # 事件循环开始处理事件即为可交互
+    QTimer.singleShot(0, profiler.finish)
     
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,240 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+from Tool.AdbClient import AdbClient, AdbError
+from Tool.PlatformTools import PlatformTools
+from Tool.ProcessRunner import ProcessRunner
+
+S_IFREG = 0o100644
+S_IFDIR = 0o040755
+S_IFLNK = 0o120777
+
+
+def _recv_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+def _prefixed(text):
+    data = text.encode("utf-8")
+    return b"%04x" % len(data) + data
+
+
+class FakeAdbServer:
+    """最小的ADB server: host服务、shell(v1/v2)以及sync的STAT/RECV/SEND, 设备文件系统保存在内存中"""
+
+    def __init__(self, shell_v2=True):
+        self.shell_v2 = shell_v2
+        self.devices = "SER1\tdevice\n"
+        self.files = {"/storage/emulated/0/a.txt": b"hello" * 1000}
+        self.dirs = {"/storage/emulated/0", "/data/local/tmp"}
+        self.links = {"/sdcard": "/storage/emulated/0"}
+        self._server = socket.socket()
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen()
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self._server.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _request(self, conn):
+        return _recv_exact(conn, int(_recv_exact(conn, 4), 16)).decode("utf-8")
+
+    def _resolve(self, path):
+        if path.endswith("/") and path.rstrip("/") in self.links:
+            return self.links[path.rstrip("/")]
+        for link, target in self.links.items():
+            if path.startswith(link + "/"):
+                return target + path[len(link):]
+        return path.rstrip("/") or "/"
+
+    def _mode(self, path):
+        if path.rstrip("/") in self.links and not path.endswith("/"):
+            return S_IFLNK
+        path = self._resolve(path)
+        if path in self.files:
+            return S_IFREG
+        if path in self.dirs:
+            return S_IFDIR
+        return 0
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                request = self._request(conn)
+                if request == "host:version":
+                    conn.sendall(b"OKAY" + _prefixed("0029"))
+                elif request == "host:devices":
+                    conn.sendall(b"OKAY" + _prefixed(self.devices))
+                elif request.endswith(":features"):
+                    conn.sendall(b"OKAY" + _prefixed("shell_v2,cmd" if self.shell_v2 else "cmd"))
+                elif request.startswith("host:transport"):
+                    if request.endswith(":BAD"):
+                        conn.sendall(b"FAIL" + _prefixed("device unauthorized."))
+                        return
+                    conn.sendall(b"OKAY")
+                    self._service(conn, self._request(conn))
+                else:
+                    conn.sendall(b"FAIL" + _prefixed(f"unknown request {request}"))
+            except (EOFError, OSError):
+                pass
+
+    def _service(self, conn, request):
+        if request.startswith("shell,v2,raw:"):
+            command = request[len("shell,v2,raw:"):]
+            conn.sendall(b"OKAY")
+            out = f"ran {command}".encode("utf-8")
+            conn.sendall(struct.pack("<BI", 1, len(out)) + out + struct.pack("<BI", 2, 3) + b"err" +
+                         struct.pack("<BI", 3, 1) + bytes([0 if "ok" in command else 1]))
+        elif request.startswith("shell:"):
+            conn.sendall(b"OKAY" + f"ran {request[len('shell:'):]}".encode("utf-8"))
+        elif request == "sync:":
+            conn.sendall(b"OKAY")
+            self._sync(conn)
+
+    def _sync(self, conn):
+        while True:
+            command, length = struct.unpack("<4sI", _recv_exact(conn, 8))
+            if command == b"QUIT":
+                return
+            path = _recv_exact(conn, length).decode("utf-8")
+            if command == b"STAT":
+                mode = self._mode(path)
+                size = len(self.files.get(self._resolve(path), b""))
+                conn.sendall(b"STAT" + struct.pack("<III", mode, size, 0))
+            elif command == b"RECV":
+                data = self.files.get(self._resolve(path))
+                if data is None:
+                    message = b"No such file or directory"
+                    conn.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                    continue
+                for pos in range(0, len(data), 1000):
+                    piece = data[pos:pos + 1000]
+                    conn.sendall(b"DATA" + struct.pack("<I", len(piece)) + piece)
+                conn.sendall(b"DONE" + struct.pack("<I", 0))
+            elif command == b"SEND":
+                target = self._resolve(path.rsplit(",", 1)[0])
+                data = b""
+                while True:
+                    command, length = struct.unpack("<4sI", _recv_exact(conn, 8))
+                    if command == b"DONE":
+                        break
+                    data += _recv_exact(conn, length)
+                if target in self.dirs:
+                    message = f"couldn't create file: {target}: Is a directory".encode("utf-8")
+                    conn.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                    continue
+                self.files[target] = data
+                conn.sendall(b"OKAY" + struct.pack("<I", 0))
+
+
+@pytest.fixture
+def server():
+    server = FakeAdbServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(server):
+    return AdbClient(port=server.port, timeout=5)
+
+
+def test_host_services(client):
+    assert client.version() == 0x29
+    assert client.devices() == [("SER1", "device")]
+
+
+def test_transport_failure_raises(client):
+    with pytest.raises(AdbError, match="unauthorized"):
+        client.shell("BAD", "id")
+
+
+def test_shell_v2_reports_exit_code_and_stderr(client):
+    assert client.shell("SER1", "echo ok") == (0, "ran echo ok", "err")
+    assert client.shell("SER1", "false")[0] == 1
+
+
+def test_shell_v1_fallback():
+    server = FakeAdbServer(shell_v2=False)
+    try:
+        client = AdbClient(port=server.port, timeout=5)
+        assert client.shell("SER1", "id") == (0, "ran id", "")
+    finally:
+        server.close()
+
+
+def test_push_into_directory_appends_basename(client, server, tmp_path):
+    local = tmp_path / "local.txt"
+    local.write_bytes(b"x" * 100000)
+    for remote in ("/data/local/tmp", "/sdcard/", "/sdcard"):
+        assert client.push("SER1", str(local), remote) == 100000
+    assert server.files["/data/local/tmp/local.txt"] == b"x" * 100000
+    assert server.files["/storage/emulated/0/local.txt"] == b"x" * 100000
+
+
+def test_push_to_file_path(client, server, tmp_path):
+    local = tmp_path / "local.txt"
+    local.write_bytes(b"data")
+    client.push("SER1", str(local), "/data/local/tmp/renamed.bin")
+    assert server.files["/data/local/tmp/renamed.bin"] == b"data"
+
+
+def test_pull_file(client, tmp_path):
+    local = tmp_path / "a.txt"
+    progress = []
+    assert client.pull("SER1", "/sdcard/a.txt", str(local), progress.append) == 5000
+    assert local.read_bytes() == b"hello" * 1000
+    assert progress[-1] == 5000
+
+
+def test_pull_failure_keeps_existing_local_file(client, tmp_path):
+    local = tmp_path / "keep.txt"
+    local.write_bytes(b"old")
+    with pytest.raises(AdbError, match="No such file"):
+        client.pull("SER1", "/sdcard/missing.txt", str(local))
+    assert local.read_bytes() == b"old"
+
+
+def test_pull_directory_raises(client, tmp_path):
+    with pytest.raises(IsADirectoryError):
+        client.pull("SER1", "/sdcard", str(tmp_path / "out"))
+    assert not (tmp_path / "out").exists()
+
+
+def test_platform_tools_push_and_pull_commands(server, tmp_path):
+    tools = PlatformTools()
+    tools.adb_client = AdbClient(port=server.port, timeout=5)
+    local = tmp_path / "local.txt"
+    local.write_bytes(b"abc")
+
+    result = tools._execute_adb_command_by_socket(f"push {local} /sdcard/", ProcessRunner())
+    assert result["success"]
+    assert server.files["/storage/emulated/0/local.txt"] == b"abc"
+
+    result = tools._execute_adb_command_by_socket(f"-s SER1 pull /sdcard/a.txt {tmp_path}", ProcessRunner())
+    assert result["success"]
+    assert (tmp_path / "a.txt").read_bytes() == b"hello" * 1000
+
+    # 本地目录的push交给adb程序
+    assert tools._execute_adb_command_by_socket(f"push {tmp_path} /sdcard/", ProcessRunner()) is None
+    # 设备目录的pull抛出IsADirectoryError, execute_adb_command据此回退到adb程序
+    with pytest.raises(IsADirectoryError):
+        tools._execute_adb_command_by_socket(f"pull /sdcard {tmp_path}", ProcessRunner())
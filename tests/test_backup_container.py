@@ -0,0 +1,106 @@
+import hashlib
+import sys
+
+import pytest
+
+from Tool.BackupContainer import BackupReader, BackupWriter, pack_images
+
+container_module = sys.modules["Tool.BackupContainer"]
+
+BS = 4096
+
+
+def sample_image() -> bytes:
+    """全零块, 填充块, 三个数据块, 全零块, 最后是不足一块的数据"""
+    data = bytes(range(256)) * 16
+    return (bytes(2 * BS) + b"\x5a\xa5\x00\xff" * (3 * BS // 4) +
+            data + data[::-1] + bytes(reversed(range(256))) * 16 + bytes(BS) + b"\x11" * 100)
+
+
+@pytest.fixture
+def small_extents(monkeypatch):
+    # 数据区段按块切分, 读取时会跨越多个区段
+    monkeypatch.setattr(container_module, "EXTENT_SIZE", BS)
+
+
+def write_container(path, images):
+    with BackupWriter(str(path), workers=1) as writer:
+        for name, data in images:
+            writer.add_view(name, data)
+
+
+def test_round_trip_of_zero_fill_and_data_extents(tmp_path, small_extents):
+    image = sample_image()
+    path = tmp_path / "backup.pfb"
+    write_container(path, [("boot", image), ("empty", b""), ("zeros", bytes(4 * BS))])
+
+    with BackupReader(str(path)) as reader:
+        assert reader.partitions() == ["boot", "empty", "zeros"]
+        info = reader.info("boot")
+        assert info["size"] == len(image)
+        assert info["sha256"] == hashlib.sha256(image).hexdigest()
+        kinds = [(extent[0], extent[1], extent[2]) for extent in info["extents"]]
+        # 全零部分不保存
+        assert kinds == [(2 * BS, 3 * BS, "fill"), (5 * BS, BS, "data"), (6 * BS, BS, "data"),
+                         (7 * BS, BS, "data"), (9 * BS, 100, "data")]
+        assert reader.info("zeros")["extents"] == []
+        assert reader.read("boot") == image
+        assert reader.read("empty") == b""
+        assert reader.read("zeros") == bytes(4 * BS)
+
+
+def test_read_across_extent_boundaries(tmp_path, small_extents):
+    image = sample_image()
+    path = tmp_path / "backup.pfb"
+    write_container(path, [("boot", image)])
+
+    with BackupReader(str(path)) as reader:
+        for offset, length in ((BS - 10, 20), (2 * BS - 1, 2), (5 * BS - 7, 2 * BS + 14), (8 * BS - 3, BS + 50),
+                               (len(image) - 50, 1000), (0, len(image))):
+            assert reader.read("boot", offset, length) == image[offset:offset + length]
+        assert reader.read("boot", len(image) + 10, 5) == b""
+
+
+def test_extract_and_verify_check_sha256(tmp_path, small_extents):
+    image = sample_image()
+    path = tmp_path / "backup.pfb"
+    write_container(path, [("boot", image)])
+    output = tmp_path / "boot.img"
+
+    progress = []
+    with BackupReader(str(path)) as reader:
+        assert reader.extract("boot", str(output), lambda done, total: progress.append((done, total)))
+        assert reader.verify("boot")
+        assert progress[-1] == (len(image), len(image))
+        # 数据与索引中的sha256不一致时校验失败
+        reader.info("boot")["sha256"] = hashlib.sha256(b"other").hexdigest()
+        assert not reader.verify("boot")
+    assert output.read_bytes() == image
+
+
+def test_pack_images_removes_originals_after_verification(tmp_path):
+    image_path = tmp_path / "boot.img"
+    image_path.write_bytes(sample_image())
+    container = tmp_path / "backup.pfb"
+    pack_images(str(container), [("boot", str(image_path))], remove=True)
+    assert not image_path.exists()
+    with BackupReader(str(container)) as reader:
+        assert reader.read("boot") == sample_image()
+
+
+def test_pack_images_keeps_originals_when_verification_fails(tmp_path):
+    boot, system = tmp_path / "boot.img", tmp_path / "system.img"
+    boot.write_bytes(sample_image())
+    system.write_bytes(sample_image()[::-1])
+
+    def change_system(name, done, total):
+        # 打包过程中原文件被改动, 容器中的数据与原文件不再一致
+        if name == "system":
+            with open(system, "r+b") as f:
+                f.write(b"changed")
+
+    with pytest.raises(ValueError, match="system"):
+        pack_images(str(tmp_path / "backup.pfb"), [("boot", str(boot)), ("system", str(system))], remove=True,
+                    progress_callback=change_system)
+    assert boot.read_bytes() == sample_image()
+    assert system.exists()
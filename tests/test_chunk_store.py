@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from Tool.ChunkStore import ChunkStore
+
+SIZE = 8 * 1024 * 1024
+
+
+@pytest.fixture
+def images(tmp_path):
+    """两个只有中间4KB不同的镜像和一个完全不同的镜像; 每个4KB块内容不同但容易压缩"""
+    def image(tag):
+        return bytearray(b"".join((tag + index.to_bytes(4, "little")).ljust(4096, b"\x5a")
+                                  for index in range(SIZE // 4096)))
+
+    base = image(b"base")
+    changed = bytearray(base)
+    changed[SIZE // 2:SIZE // 2 + 4] = b"edit"
+    paths = {}
+    for name, data in (("base", base), ("changed", changed), ("other", image(b"other"))):
+        paths[name] = tmp_path / f"{name}.img"
+        paths[name].write_bytes(data)
+    return paths
+
+
+def chunk_files(store):
+    return {file for root, dirs, files in os.walk(os.path.join(store.root, "chunks")) for file in files}
+
+
+def restored(store, backup_id, partition, tmp_path):
+    output = tmp_path / "restored.img"
+    assert store.restore(backup_id, partition, str(output))
+    return output.read_bytes()
+
+
+def test_dedup_across_backups_and_restore(tmp_path, images):
+    store = ChunkStore(str(tmp_path / "store"))
+    first = store.add_backup([("system", str(images["base"]))])
+    second = store.add_backup([("system", str(images["changed"]))])
+    # 第二次备份只写入变化附近的块
+    assert 0 < second["stats"]["new_chunks"] < first["stats"]["new_chunks"]
+    assert second["stats"]["written"] < SIZE // 2
+    assert restored(store, first["id"], "system", tmp_path) == images["base"].read_bytes()
+    assert restored(store, second["id"], "system", tmp_path) == images["changed"].read_bytes()
+
+
+def test_remove_backup_and_gc_keep_shared_chunks(tmp_path, images):
+    store = ChunkStore(str(tmp_path / "store"))
+    first = store.add_backup([("system", str(images["base"]))])
+    second = store.add_backup([("system", str(images["changed"]))])
+    only_first = {digest for digest, length in first["partitions"][0]["chunks"]} - \
+        {digest for digest, length in second["partitions"][0]["chunks"]}
+
+    assert store.remove_backup(first["id"])
+    removed, freed = store.gc()
+    assert removed == len(only_first) and freed > 0
+    assert not only_first & chunk_files(store)
+    assert store.verify(second["id"])
+    assert restored(store, second["id"], "system", tmp_path) == images["changed"].read_bytes()
+
+
+def test_verify_detects_corrupted_chunk(tmp_path, images):
+    store = ChunkStore(str(tmp_path / "store"))
+    manifest = store.add_backup([("system", str(images["base"]))])
+    assert store.verify(manifest["id"], [("system", str(images["base"]))])
+    digest = manifest["partitions"][0]["chunks"][0][0]
+    with open(store._chunk_path(digest), "r+b") as f:
+        f.seek(10)
+        f.write(b"\x00\x00\x00")
+    assert not store.verify(manifest["id"])
+
+
+def test_two_instances_share_reference_counts(tmp_path, images):
+    root = str(tmp_path / "store")
+    first, second = ChunkStore(root), ChunkStore(root)
+    base = second.add_backup([("system", str(images["base"]))])
+    other = first.add_backup([("system", str(images["other"]))])
+    # second没有看到first写入的引用计数时, 这里会覆盖掉other的计数, gc随后删除other的块
+    second.add_backup([("system", str(images["changed"]))])
+    assert second.remove_backup(base["id"])
+    second.gc()
+    assert first.verify(other["id"])
+    assert restored(first, other["id"], "system", tmp_path) == images["other"].read_bytes()
+
+
+def test_gc_during_backup_keeps_reused_chunks(tmp_path, images):
+    root = str(tmp_path / "store")
+    writer, cleaner = ChunkStore(root), ChunkStore(root)
+    old = cleaner.add_backup([("system", str(images["base"]))])
+    collected = []
+
+    def on_progress(partition, done, total):
+        # 新备份复用了旧备份的块但还没有写入清单时, 另一个实例删除旧备份并回收
+        if not collected and done > total // 2:
+            assert cleaner.remove_backup(old["id"])
+            collected.append(cleaner.gc())
+
+    manifest = writer.add_backup([("system", str(images["changed"]))], progress_callback=on_progress)
+    assert collected and not os.listdir(os.path.join(root, "pending"))
+    assert writer.verify(manifest["id"])
+    assert restored(writer, manifest["id"], "system", tmp_path) == images["changed"].read_bytes()
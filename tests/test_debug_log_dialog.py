@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+from PySide6.QtCore import QCoreApplication
+from PySide6.QtWidgets import QApplication, QFileDialog, QMessageBox
+
+from Dialogs.DebugLogDialog import DebugLogDialog, LogModel
+from LogBuffer import LogBuffer
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def fill(buffer, start, end):
+    for i in range(start, end):
+        buffer.append(f"line {i}")
+
+
+def test_fetch_new_inserts_batches_and_trims_oldest_rows(app):
+    buffer = LogBuffer(8)
+    model = LogModel(buffer)
+    fill(buffer, 0, 5)
+    assert model.fetch_new() == 5
+    assert model.fetch_new() == 0
+
+    # 超出容量但不到1/4时暂不删除
+    fill(buffer, 5, 10)
+    assert model.fetch_new() == 5
+    assert model.rowCount() == 10
+    # 超出容量1/4后一次删除最早的行, 只保留capacity行
+    fill(buffer, 10, 12)
+    assert model.fetch_new() == 2
+    assert model.rowCount() == 8
+    assert [model.record(row).message for row in range(8)] == [f"line {i}" for i in range(4, 12)]
+
+
+def test_fetch_new_after_falling_behind_keeps_latest(app):
+    buffer = LogBuffer(4)
+    model = LogModel(buffer)
+    fill(buffer, 0, 10)
+    assert model.fetch_new() == 4
+    assert [model.record(row).message for row in range(4)] == ["line 6", "line 7", "line 8", "line 9"]
+
+
+def test_save_excludes_cleared_lines(app, tmp_path, monkeypatch):
+    path = tmp_path / "log.txt"
+    monkeypatch.setattr(QFileDialog, "getSaveFileName", lambda *args: (str(path), ""))
+    monkeypatch.setattr(QMessageBox, "information", lambda *args: None)
+    buffer = LogBuffer(100)
+    dialog = DebugLogDialog(buffer=buffer)
+    fill(buffer, 0, 3)
+    dialog.flush()
+    dialog.clear_log()
+    fill(buffer, 3, 5)
+
+    dialog.save_log()
+    deadline = time.monotonic() + 5
+    while not dialog.save_btn.isEnabled() and time.monotonic() < deadline:
+        QCoreApplication.processEvents()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [line.split(" ", 1)[1] for line in lines] == ["line 3", "line 4"]
@@ -0,0 +1,81 @@
+import hashlib
+import io
+import os
+
+from Tool.DeltaFlash import changed_ranges, delta_supported, region_hashes
+from Tool.SparseImage import CHUNK_TYPE_DONT_CARE, CHUNK_TYPE_FILL, CHUNK_TYPE_RAW, SparseImage
+
+BLOCK = 4096
+REGION = 4 * BLOCK
+
+
+def apply_sparse(base: bytes, data: bytes) -> bytes:
+    """模拟设备刷入sparse镜像: DONT_CARE的块保持原样"""
+    image = SparseImage(data)
+    result = bytearray(base)
+    for chunk in image.chunks:
+        start = chunk.start * image.block_size
+        length = chunk.blocks * image.block_size
+        if chunk.chunk_type == CHUNK_TYPE_RAW:
+            result[start:start + length] = image.view[chunk.offset:chunk.offset + length]
+        elif chunk.chunk_type == CHUNK_TYPE_FILL:
+            result[start:start + length] = chunk.fill * (length // 4)
+    return bytes(result)
+
+
+def test_region_hashes_skip_partial_tail():
+    data = os.urandom(2 * REGION + 100)
+    hashes = region_hashes(data, REGION)
+    assert hashes == [hashlib.sha256(data[:REGION]).hexdigest(),
+                      hashlib.sha256(data[REGION:2 * REGION]).hexdigest()]
+
+
+def test_changed_ranges_merges_adjacent_regions_and_adds_tail():
+    new = ["a", "b", "c", "d", "e"]
+    device = ["a", "x", "x", "d", "x"]
+    size = 5 * REGION + 100
+    assert changed_ranges(new, device, size, REGION, BLOCK) == [(4, 8), (16, 5)]
+
+
+def test_changed_ranges_identical_without_tail():
+    hashes = ["a", "b"]
+    assert changed_ranges(hashes, hashes, 2 * REGION, REGION, BLOCK) == []
+
+
+def test_changed_ranges_short_device_hashes_write_the_rest():
+    assert changed_ranges(["a", "b", "c"], ["a"], 3 * REGION, REGION, BLOCK) == [(4, 8)]
+
+
+def test_only_writes_selected_blocks():
+    old = os.urandom(16 * BLOCK)
+    new = bytearray(os.urandom(16 * BLOCK))
+    new[4 * BLOCK:5 * BLOCK] = bytes(BLOCK)  # FILL块
+    new = bytes(new)
+    ranges = [(2, 3), (10, 2)]
+
+    out = io.BytesIO()
+    SparseImage(new).only(ranges).write(out)
+    flashed = apply_sparse(old, out.getvalue())
+
+    for block in range(16):
+        expected = new if any(start <= block < start + count for start, count in ranges) else old
+        assert flashed[block * BLOCK:(block + 1) * BLOCK] == expected[block * BLOCK:(block + 1) * BLOCK], block
+
+
+def test_only_keeps_total_size_and_drops_everything_else():
+    data = os.urandom(8 * BLOCK)
+    image = SparseImage(data).only([])
+    assert image.total_blocks == 8
+    out = io.BytesIO()
+    image.write(out)
+    parsed = SparseImage(out.getvalue())
+    assert [chunk.chunk_type for chunk in parsed.chunks] == [CHUNK_TYPE_DONT_CARE]
+    assert apply_sparse(bytes(8 * BLOCK), out.getvalue()) == bytes(8 * BLOCK)
+
+
+def test_delta_only_for_read_only_partitions():
+    assert delta_supported("boot")
+    assert delta_supported("vendor_boot_a")
+    assert delta_supported("system_b")
+    for partition in ("userdata", "cache", "metadata", "misc", "super", "persist"):
+        assert not delta_supported(partition)
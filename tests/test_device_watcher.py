@@ -0,0 +1,64 @@
+import sys
+import threading
+
+import Tool  # noqa: F401  (导入包后才能从sys.modules取到子模块)
+
+watcher_module = sys.modules["Tool.DeviceWatcher"]
+
+
+class FakeAdbClient:
+    def start_tracking(self, callback):
+        return True
+
+    def is_tracking(self):
+        return True
+
+    def remove_track_callback(self, callback):
+        pass
+
+
+class FakeTools:
+    def __init__(self, fastboot_results):
+        self.adb_client = FakeAdbClient()
+        self._results = list(fastboot_results)
+
+    def get_fastboot_devices(self):
+        result = self._results.pop(0) if len(self._results) > 1 else self._results[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_fastboot_loop_reports_error_and_keeps_watching(monkeypatch):
+    monkeypatch.setattr(watcher_module, "usb", None)
+    monkeypatch.setattr(watcher_module, "usb1", None)
+    tools = FakeTools([OSError("fastboot missing"), [("SER1", "fastboot")]])
+    errors = []
+    seen = threading.Event()
+
+    def on_devices(adb_devices, fastboot_devices):
+        if fastboot_devices:
+            seen.set()
+
+    watcher = watcher_module.DeviceWatcher(tools, on_devices, fallback_interval=0.01, error_callback=errors.append)
+    watcher.start()
+    try:
+        assert seen.wait(5)
+    finally:
+        watcher.stop()
+    assert errors == ["Fastboot设备监视异常: fastboot missing"]
+
+
+def test_last_callback_is_latest_state(monkeypatch):
+    states = []
+    watcher = watcher_module.DeviceWatcher(FakeTools([[]]), lambda adb, fastboot: states.append((adb, fastboot)))
+
+    def update(i):
+        watcher._on_adb_devices([(f"SER{i}", "device")])
+
+    threads = [threading.Thread(target=update, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert states[-1] == (list(watcher._adb_devices), [])
@@ -0,0 +1,205 @@
+import sys
+
+import pytest
+
+from Tool.FastbootDevice import FastbootDevice, FastbootError, FastbootTransport
+from Tool.SparseImage import CHUNK_TYPE_FILL, CHUNK_TYPE_RAW, SparseImage
+
+
+class FakeTransport(FastbootTransport):
+    """模拟fastboot设备: 解析命令并排队响应, 保存download的数据与每次写入的长度"""
+
+    def __init__(self, max_download_size=0x100000, partitions=None, fail_write=False):
+        self.max_download_size = max_download_size
+        self.partitions = partitions or {}  # {分区: bytes}
+        self.fail_write = fail_write
+        self.responses = []
+        self.commands = []
+        self.writes = []  # download阶段每次写入的长度
+        self.downloads = []
+        self.flashed = {}  # {分区: [每次flash时的download数据]}
+        self._expected = 0
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        if self._expected:
+            if self.fail_write:
+                raise OSError("usb write failed")
+            self.writes.append(len(data))
+            self._buffer += data
+            self._expected -= len(data)
+            if self._expected <= 0:
+                self._expected = 0
+                self.downloads.append(bytes(self._buffer))
+                self.responses.append(b"OKAY")
+            return len(data)
+
+        command = bytes(data).decode("utf-8")
+        self.commands.append(command)
+        name, _, arg = command.partition(":")
+        if name == "getvar":
+            if arg == "max-download-size":
+                self.responses.append(b"OKAY0x%08x" % self.max_download_size)
+            else:
+                self.responses.append(b"FAILunknown variable")
+        elif name == "download":
+            size = int(arg, 16)
+            if size > self.max_download_size:
+                self.responses.append(b"FAILdata too large")
+            else:
+                self._expected = size
+                self._buffer = bytearray()
+                self.responses.append(b"DATA%08x" % size)
+        elif name == "flash":
+            self.flashed.setdefault(arg, []).append(self.downloads[-1])
+            self.responses += [b"INFOwriting '%s'" % arg.encode(), b"OKAY"]
+        elif name == "fetch":
+            partition, offset, size = arg.split(":")
+            data = self.partitions[partition][int(offset, 16):int(offset, 16) + int(size, 16)]
+            self.responses += [b"DATA%08x" % len(data), data, b"OKAY"]
+        else:
+            self.responses.append(b"FAILunknown command")
+        return len(data)
+
+    def read(self, size: int, timeout: float = None) -> bytes:
+        response = self.responses.pop(0)
+        if len(response) > size:
+            self.responses.insert(0, response[size:])
+            response = response[:size]
+        return response
+
+
+def apply_sparse(pieces, size):
+    """把依次刷入的sparse片段还原为分区内容"""
+    result = bytearray(size)
+    for piece in pieces:
+        image = SparseImage(piece)
+        bs = image.block_size
+        for chunk in image.chunks:
+            start = chunk.start * bs
+            if chunk.chunk_type == CHUNK_TYPE_RAW:
+                result[start:start + chunk.blocks * bs] = image.view[chunk.offset:chunk.offset + chunk.blocks * bs]
+            elif chunk.chunk_type == CHUNK_TYPE_FILL:
+                result[start:start + chunk.blocks * bs] = chunk.fill * (chunk.blocks * bs // 4)
+        image.release()
+    return bytes(result[:size])
+
+
+def test_command_okay_and_fail():
+    device = FastbootDevice(FakeTransport(max_download_size=0x2000))
+    assert device.getvar("max-download-size") == "0x00002000"
+    with pytest.raises(FastbootError, match="unknown variable"):
+        device.getvar("product")
+    with pytest.raises(FastbootError, match="unknown command"):
+        device.command("oem unlock")
+
+
+def test_info_messages_are_reported():
+    messages = []
+    transport = FakeTransport()
+    device = FastbootDevice(transport, info_callback=messages.append)
+    device.download(b"\x01" * 100)
+    device.flash("boot")
+    assert messages == ["writing 'boot'"]
+    assert transport.flashed["boot"] == [b"\x01" * 100]
+
+
+def test_download_is_sent_in_aligned_chunks():
+    transport = FakeTransport(max_download_size=8 * 1024 * 1024)
+    device = FastbootDevice(transport)
+    data = bytes(range(256)) * (3 * 4096 + 3)  # 3 MiB + 768 字节
+    progress = []
+    device.download(data, lambda sent, total, speed: progress.append((sent, total)))
+    assert transport.downloads == [data]
+    assert max(transport.writes) <= FastbootDevice.TRANSFER_SIZE
+    # 除最后一次外都是USB包大小的整数倍
+    assert all(size % FastbootDevice.PACKET_ALIGN == 0 for size in transport.writes[:-1])
+    assert progress[-1] == (len(data), len(data))
+
+
+def test_download_rejected_by_device():
+    device = FastbootDevice(FakeTransport(max_download_size=0x1000))
+    with pytest.raises(FastbootError, match="data too large"):
+        device.download(b"\x00" * 0x2000)
+
+
+def test_flash_image_raw(tmp_path):
+    image = tmp_path / "boot.img"
+    data = bytes(range(256)) * 4096
+    image.write_bytes(data)
+    transport = FakeTransport(max_download_size=0x200000)
+    FastbootDevice(transport).flash_image("boot", str(image))
+    assert transport.flashed["boot"] == [data]
+
+
+def test_flash_image_larger_than_download_size_is_split(tmp_path):
+    image = tmp_path / "system.img"
+    data = bytes(range(256)) * 4096 * 3 + bytes(1024 * 1024) + b"\xab\xcd" * 4096
+    image.write_bytes(data)
+    transport = FakeTransport(max_download_size=0x100000)
+    FastbootDevice(transport).flash_image("system", str(image))
+    pieces = transport.flashed["system"]
+    assert len(pieces) > 1
+    assert all(len(piece) <= 0x100000 for piece in pieces)
+    assert apply_sparse(pieces, len(data)) == data
+
+
+def test_fetch_reads_partition():
+    transport = FakeTransport(partitions={"boot": bytes(range(256)) * 64})
+    received = bytearray()
+    assert FastbootDevice(transport).fetch("boot", 256, 1024, received.extend) == 1024
+    assert bytes(received) == (bytes(range(256)) * 64)[256:1280]
+
+
+def test_flash_image_write_error_is_not_masked(tmp_path):
+    image = tmp_path / "boot.img"
+    image.write_bytes(b"\x01" * (2 * 1024 * 1024))
+    device = FastbootDevice(FakeTransport(max_download_size=0x1000000, fail_write=True))
+    # 异常回溯仍引用着mmap的切片, 关闭mmap不能用BufferError替换原来的异常
+    with pytest.raises(OSError, match="usb write failed"):
+        device.flash_image("boot", str(image))
+
+
+class NoBackendUsb:
+    """pyusb已安装但找不到libusb: find()抛出NoBackendError(ValueError的子类)"""
+
+    class core:
+        class USBError(IOError):
+            pass
+
+        @staticmethod
+        def find(**kwargs):
+            raise ValueError("No backend available")
+
+
+@pytest.fixture
+def broken_usb(monkeypatch):
+    # Tool包中的FastbootDevice是重新导出的类, 模块需要从sys.modules取得
+    module = sys.modules["Tool.FastbootDevice"]
+    monkeypatch.setattr(module, "usb", NoBackendUsb)
+    monkeypatch.setattr(module, "usb_backend", lambda: object())
+
+
+def test_usb_errors_become_fastboot_errors(broken_usb):
+    from Tool.FastbootDevice import UsbTransport
+    with pytest.raises(FastbootError, match="No backend available"):
+        UsbTransport.open("SER1")
+    assert UsbTransport.list_serials() == []
+
+
+def test_flash_partition_falls_back_to_fastboot_binary(broken_usb, monkeypatch, tmp_path):
+    import subprocess
+
+    from Tool.PlatformTools import PlatformTools
+
+    image = tmp_path / "boot.img"
+    image.write_bytes(bytes(range(256)) * 4096)
+    calls = []
+    monkeypatch.setattr(subprocess, "run", lambda cmd, **kwargs: calls.append(cmd) or
+                        subprocess.CompletedProcess(cmd, 0, "", ""))
+    tools = PlatformTools()
+    monkeypatch.setattr(tools, "get_fastboot_devices", lambda: [("SER1", "fastboot")])
+    monkeypatch.setattr(tools, "get_fastboot_path", lambda *args, **kwargs: "fastboot")
+    assert tools.flash_partition("boot", str(image), serial="SER1")
+    assert calls == [["fastboot", "-s", "SER1", "flash", "boot", str(image)]]
+    assert tools.max_download_size("SER1") is None
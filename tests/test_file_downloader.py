@@ -0,0 +1,166 @@
+import io
+import os
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+from PySide6.QtCore import QCoreApplication, QEvent, QEventLoop, QSettings, QTimer
+
+from FileDownloader import MirrorSelector, SegmentedDownloader
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """按路径返回server.files中的数据, ranged为False时忽略Range"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        header = self.headers.get("Range")
+        if header and self.server.ranged:
+            start, _, end = header[len("bytes="):].partition("-")
+            start, end = int(start), min(int(end) if end else len(data) - 1, len(data) - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            body = data[start:end + 1]
+        else:
+            self.send_response(200)
+            body = data
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.files = {}
+    server.ranged = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def selector(tmp_path):
+    return MirrorSelector(QSettings(str(tmp_path / "settings.ini"), QSettings.Format.IniFormat))
+
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def run(downloader, timeout=20000):
+    """运行事件循环直到下载结束, 返回 (是否成功, 错误信息)"""
+    loop = QEventLoop()
+    result = {}
+    downloader.finished.connect(lambda path: (result.update(ok=True), loop.quit()))
+    downloader.error.connect(lambda message: (result.update(ok=False, error=message), loop.quit()))
+    QTimer.singleShot(timeout, loop.quit)
+    downloader.start()
+    loop.exec()
+    # 处理完已结束连接的deleteLater后再释放下载器
+    QCoreApplication.sendPostedEvents(None, QEvent.Type.DeferredDelete)
+    return result.get("ok"), result.get("error")
+
+
+def test_segmented_download_from_two_mirrors(app, server, selector, tmp_path):
+    data = os.urandom(4 * 1024 * 1024 + 123)
+    server.files = {"/a.bin": data, "/b.bin": data}
+    save_path = str(tmp_path / "file.bin")
+    downloader = SegmentedDownloader([url(server, "/a.bin"), url(server, "/b.bin")], save_path,
+                                     connections=4, selector=selector)
+    assert run(downloader) == (True, None)
+    assert downloader.ranged and len(downloader.segments) == 4
+    with open(save_path, "rb") as f:
+        assert f.read() == data
+    assert not os.path.exists(save_path + SegmentedDownloader.JOURNAL_SUFFIX)
+
+
+def test_missing_mirror_is_skipped(app, server, selector, tmp_path):
+    data = os.urandom(2 * 1024 * 1024)
+    server.files = {"/ok.bin": data}
+    save_path = str(tmp_path / "file.bin")
+    downloader = SegmentedDownloader([url(server, "/missing.bin"), url(server, "/ok.bin")], save_path,
+                                     selector=selector)
+    assert run(downloader) == (True, None)
+    assert downloader.sources == [url(server, "/ok.bin")]
+    with open(save_path, "rb") as f:
+        assert f.read() == data
+
+
+def test_server_without_range_support(app, server, selector, tmp_path):
+    data = os.urandom(1024 * 1024 + 7)
+    server.files = {"/a.bin": data}
+    server.ranged = False
+    save_path = str(tmp_path / "file.bin")
+    downloader = SegmentedDownloader([url(server, "/a.bin")], save_path, selector=selector)
+    assert run(downloader) == (True, None)
+    assert not downloader.ranged
+    with open(save_path, "rb") as f:
+        assert f.read() == data
+
+
+def test_zip_is_extracted_while_downloading(app, server, selector, tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("tool/adb", os.urandom(3 * 1024 * 1024))
+        archive.writestr("tool/README", b"readme")
+    server.files = {"/tool.zip": buffer.getvalue()}
+    extract_dir = tmp_path / "tool"
+    downloader = SegmentedDownloader([url(server, "/tool.zip")], str(tmp_path / "tool.zip"), connections=3,
+                                     selector=selector, extract_dir=str(extract_dir))
+    assert run(downloader) == (True, None)
+    assert downloader.extracted
+    assert (extract_dir / "tool/README").read_bytes() == b"readme"
+
+
+def test_all_mirrors_unreachable(app, server, selector, tmp_path):
+    downloader = SegmentedDownloader([url(server, "/missing.bin")], str(tmp_path / "file.bin"), selector=selector)
+    ok, error = run(downloader)
+    assert ok is False and "无法连接" in error
+
+
+class FakeReply:
+    def __init__(self):
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+
+def test_stalled_connection_recorded_once(app, selector, tmp_path):
+    slow, fast = "http://slow.example/a.bin", "http://fast.example/a.bin"
+    downloader = SegmentedDownloader([slow, fast], str(tmp_path / "file.bin"), selector=selector,
+                                     min_speed=1024)
+    downloader.sources = [slow, fast]
+    downloader._speeds = {slow: 100.0, fast: 10 * 1024 * 1024}
+    reply = FakeReply()
+    downloader._replies[reply] = {"start": 0, "end": 100, "done": 0, "url": slow}
+    downloader._stats[reply] = {"start": 0.0, "bytes": 10 * 1024 * 1024, "last": 10 * 1024 * 1024, "slow": 0,
+                                "recorded": False}
+    samples = []
+    selector.record = lambda url, speed: samples.append((url, speed))
+    for _ in range(SegmentedDownloader.STALL_CHECKS):
+        downloader._check_stalls()
+    assert reply.aborted
+    # 中止后_on_segment_finished再次记录速度时不会产生第二个样本
+    downloader._record_speed(reply, slow)
+    assert samples == [(slow, 0)]
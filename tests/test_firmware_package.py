@@ -0,0 +1,42 @@
+import io
+import tarfile
+
+import pytest
+
+from FirmwarePackage import FirmwarePackage
+
+IMAGES = {f"rom/images/part{i}.img": bytes([i]) * (1000 + i * 700) for i in range(20)}
+
+
+@pytest.fixture
+def tgz(tmp_path):
+    path = tmp_path / "rom.tgz"
+    with tarfile.open(path, "w:gz") as archive:
+        for name, data in IMAGES.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        info = tarfile.TarInfo("rom/flash_all.sh")
+        script = b"fastboot flash boot images/part0.img\n"
+        info.size = len(script)
+        archive.addfile(info, io.BytesIO(script))
+    return path
+
+
+def test_tgz_index_in_one_pass(tgz):
+    with FirmwarePackage(str(tgz)) as package:
+        members = package.images()
+        assert [member.name for member in members] == list(IMAGES)
+        assert all(member.compressed for member in members)
+        # 索引通过流模式建立, 包对象中不保留所有TarInfo
+        assert not package._archive._loaded
+        for member in FirmwarePackage.archive_order(reversed(members)):
+            with member.open() as f:
+                assert f.read() == IMAGES[member.name]
+
+
+def test_tgz_extract_all(tgz, tmp_path):
+    with FirmwarePackage(str(tgz)) as package:
+        assert package.find(lambda name: name.startswith("flash_all")) is not None
+        package.extract_all(str(tmp_path / "out"))
+    assert (tmp_path / "out/rom/images/part7.img").read_bytes() == IMAGES["rom/images/part7.img"]
@@ -0,0 +1,74 @@
+import os
+import zipfile
+
+import pytest
+
+from FirmwareCache import FirmwareCache
+from FirmwarePackage import FirmwarePackage
+from FlashPipeline import PrefetchPipeline
+
+
+@pytest.fixture
+def package(tmp_path):
+    path = tmp_path / "rom.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("boot.img", b"\x01" * 4096)
+        archive.writestr("system.img", b"\x02" * 65536)
+    with FirmwarePackage(str(path)) as package:
+        yield package
+
+
+def test_paths_and_small_members_pass_through(package, tmp_path):
+    image = tmp_path / "vbmeta.img"
+    image.write_bytes(b"\x03" * 4096)
+    boot = package.find_image("boot")
+    with PrefetchPipeline([("vbmeta", str(image)), ("boot", boot)], stream_size=8192) as pipeline:
+        assert pipeline.get(0) == ("vbmeta", str(image))
+        # 不超过max-download-size的压缩成员刷写时边解压边发送, 不解压到临时文件
+        assert pipeline.get(1) == ("boot", boot)
+        pipeline.release(0)
+        pipeline.release(1)
+    assert boot.sha256 is None
+
+
+def test_large_member_extracted_and_removed(package):
+    with PrefetchPipeline([("system", package.find_image("system"))], stream_size=8192) as pipeline:
+        partition, path = pipeline.get(0)
+        with open(path, "rb") as f:
+            assert f.read() == b"\x02" * 65536
+        pipeline.release(0)
+        assert not os.path.exists(path)
+
+
+def test_get_times_out_when_consumer_never_releases(package):
+    images = [("boot", package.find_image("boot")), ("system", package.find_image("system"))]
+    with PrefetchPipeline(images, consumers=2, depth=1, timeout=0.2) as pipeline:
+        pipeline.get(0)
+        pipeline.release(0)  # 另一台设备没有release, 第1个镜像不会开始准备
+        with pytest.raises(TimeoutError):
+            pipeline.get(1)
+
+
+def test_cached_image_is_verified_before_use(tmp_path):
+    path = tmp_path / "rom.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("system.img", b"\x02" * 65536)
+    cache = FirmwareCache(str(tmp_path / "cache"))
+
+    def prepare():
+        with FirmwarePackage(str(path), cache=cache) as package:
+            with PrefetchPipeline([("system", package.find_image("system"))]) as pipeline:
+                partition, image = pipeline.get(0)
+                with open(image, "rb") as f:
+                    data = f.read()
+                pipeline.release(0)
+        return image, data
+
+    cached, data = prepare()
+    assert data == b"\x02" * 65536
+    assert prepare() == (cached, data)
+
+    # 缓存中的镜像被改动(大小不变)时不使用, 重新解压
+    with open(cached, "r+b") as f:
+        f.write(b"\xff" * 16)
+    assert prepare() == (cached, b"\x02" * 65536)
@@ -0,0 +1,200 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import FlashScheduler as scheduler_module
+from FlashScheduler import FlashScheduler
+
+
+class FakeTools:
+    """代替PlatformTools: 记录每台设备刷写的分区, 不运行fastboot"""
+
+    flashed = []
+    fail = set()  # (serial, partition)
+    on_flash = None
+    lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.last_error = ""
+
+    def get_path(self):
+        return "/fake"
+
+    def get_fastboot_devices(self):
+        return [("SER1", "fastboot"), ("SER2", "fastboot")]
+
+    def max_download_size(self, serial=None):
+        return None
+
+    def flash_partition(self, partition, image_path, serial=None, progress_callback=None):
+        with self.lock:
+            FakeTools.flashed.append((serial, partition))
+        if FakeTools.on_flash:
+            FakeTools.on_flash(serial, partition)
+        if progress_callback:
+            progress_callback(1, 1, 0)
+        if (serial, partition) in self.fail:
+            self.last_error = f"{partition} FAILED"
+            return False
+        return True
+
+
+class Token:
+    def __init__(self):
+        self.cancelled = False
+
+
+@pytest.fixture
+def tools(monkeypatch):
+    FakeTools.flashed = []
+    FakeTools.fail = set()
+    FakeTools.on_flash = None
+    monkeypatch.setattr(scheduler_module, "PlatformTools", FakeTools)
+    return FakeTools()
+
+
+def test_cancel_stops_between_partitions(tools):
+    token = Token()
+
+    def cancel_after_boot(serial, partition):
+        if partition == "boot":
+            token.cancelled = True
+
+    FakeTools.on_flash = cancel_after_boot
+    scheduler = FlashScheduler(tools)
+    images = [("boot", "boot.img"), ("system", "system.img"), ("vendor", "vendor.img")]
+    results = scheduler.flash_all(images, ["SER1"], token=token)
+    # 正在写入的分区写完, 之后的分区不再开始
+    assert FakeTools.flashed == [("SER1", "boot")]
+    assert results == {"SER1": False}
+    assert scheduler.errors["SER1"] == ["已取消"]
+
+
+class FakePipeline:
+    """代替PrefetchPipeline: 直接返回镜像, 记录每个镜像被释放的次数"""
+
+    fail_get = set()  # 准备失败的镜像序号
+    instances = []
+
+    def __init__(self, images, consumers=1, depth=2, timeline=None, stream_size=None):
+        self.images = images
+        self.consumers = consumers
+        self.released = [0] * len(images)
+        self.lock = threading.Lock()
+        FakePipeline.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def get(self, index):
+        if index in self.fail_get:
+            raise OSError("解压失败")
+        return self.images[index]
+
+    def release(self, index):
+        with self.lock:
+            self.released[index] += 1
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    FakePipeline.fail_get = set()
+    FakePipeline.instances = []
+    monkeypatch.setattr(scheduler_module, "PrefetchPipeline", FakePipeline)
+    return FakePipeline
+
+
+IMAGES = [("boot", "boot.img"), ("system", "system.img"), ("vendor", "vendor.img")]
+
+
+def test_each_device_flashed_with_its_serial(monkeypatch):
+    tools_module = sys.modules["Tool.PlatformTools"]
+    commands = []
+    lock = threading.Lock()
+
+    def run(cmd, **kwargs):
+        if cmd[-1] == "devices":
+            return subprocess.CompletedProcess(cmd, 0, "SER1\tfastboot\nSER2\tfastboot\n", "")
+        with lock:
+            commands.append(cmd[1:])
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(tools_module.subprocess, "run", run)
+    monkeypatch.setattr(tools_module.PlatformTools, "_flash_partition_native", lambda self, *args: None)
+    monkeypatch.setattr(tools_module.PlatformTools, "_make_sparse_image", staticmethod(lambda path: None))
+
+    scheduler = FlashScheduler(tools_module.PlatformTools("/fake"))
+    assert scheduler.flash_all(IMAGES[:2]) == {"SER1": True, "SER2": True}
+    # 每条fastboot命令都用-s指定设备, 不会把分区刷到另一台设备上
+    assert sorted(commands) == sorted(["-s", serial, "flash", partition, path]
+                                      for serial in ("SER1", "SER2") for partition, path in IMAGES[:2])
+
+
+def test_parallelism_bounded_by_max_workers(tools):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def track(serial, partition):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+
+    FakeTools.on_flash = track
+    serials = [f"SER{index}" for index in range(6)]
+    results = FlashScheduler(tools, max_workers=2).flash_all(IMAGES, serials)
+    assert results == dict.fromkeys(serials, True)
+    assert peak[0] == 2
+    assert sorted(FakeTools.flashed) == sorted((serial, partition) for serial in serials for partition, path in IMAGES)
+
+
+def test_failures_aggregated_per_device(tools):
+    def crash(serial, partition):
+        if (serial, partition) == ("SER3", "system"):
+            raise RuntimeError("USB断开")
+
+    FakeTools.fail = {("SER2", "boot"), ("SER2", "vendor")}
+    FakeTools.on_flash = crash
+    scheduler = FlashScheduler(tools)
+    results = scheduler.flash_all(IMAGES, ["SER1", "SER2", "SER3"])
+    assert results == {"SER1": True, "SER2": False, "SER3": False}
+    # 一个分区失败后继续刷写其余分区, 所有错误都保留
+    assert scheduler.errors == {"SER2": ["boot: boot FAILED", "vendor: vendor FAILED"], "SER3": ["USB断开"]}
+    assert ("SER2", "system") in FakeTools.flashed
+
+
+def test_prefetch_releases_each_image_once_per_device(tools, pipeline):
+    def crash(serial, partition):
+        if (serial, partition) == ("SER2", "boot"):
+            raise RuntimeError("USB断开")
+
+    FakeTools.on_flash = crash
+    FakePipeline.fail_get = {1}
+    scheduler = FlashScheduler(tools)
+    results = scheduler.flash_all(IMAGES, ["SER1", "SER2"], prefetch=2)
+    assert results == {"SER1": False, "SER2": False}
+    assert scheduler.errors["SER1"] == ["system: 解压失败"]
+    # 准备失败, 刷写异常后剩余的镜像也要释放, 否则其他设备会一直等待
+    (instance,) = FakePipeline.instances
+    assert instance.consumers == 2
+    assert instance.released == [2, 2, 2]
+
+
+def test_prefetch_releases_remaining_images_after_cancel(tools, pipeline):
+    token = Token()
+
+    def cancel_after_boot(serial, partition):
+        token.cancelled = True
+
+    FakeTools.on_flash = cancel_after_boot
+    scheduler = FlashScheduler(tools)
+    assert scheduler.flash_all(IMAGES, ["SER1"], prefetch=2, token=token) == {"SER1": False}
+    assert FakePipeline.instances[0].released == [1, 1, 1]
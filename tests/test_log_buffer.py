@@ -0,0 +1,41 @@
+from LogBuffer import LogBuffer
+
+
+def messages(records):
+    return [record.message for record in records]
+
+
+def test_read_in_order_and_incrementally():
+    buffer = LogBuffer(8)
+    for i in range(5):
+        buffer.append(f"line {i}")
+    assert messages(buffer.read(0)) == [f"line {i}" for i in range(5)]
+    assert messages(buffer.read(3)) == ["line 3", "line 4"]
+    assert messages(buffer.read(1, limit=2)) == ["line 1", "line 2"]
+    assert buffer.read(5) == []
+    assert len(buffer) == 5
+
+
+def test_wraparound_overwrites_oldest():
+    buffer = LogBuffer(4)
+    for i in range(10):
+        buffer.append(f"line {i}")
+    assert buffer.oldest() == 6
+    assert len(buffer) == 4
+    # 读取方落后超过容量时从最早仍在缓冲中的记录开始
+    assert messages(buffer.read(0)) == ["line 6", "line 7", "line 8", "line 9"]
+    assert [record.seq for record in buffer.read(7)] == [7, 8, 9]
+    assert buffer.last().message == "line 9"
+
+
+def test_slot_overwritten_during_read_skips_forward():
+    buffer = LogBuffer(4)
+    for i in range(4):
+        buffer.append(f"line {i}")
+    records = buffer.read(0, limit=1)
+    # 两次读取之间写入了超过容量的记录, 下一次读取不会返回被覆盖的旧序号
+    for i in range(4, 11):
+        buffer.append(f"line {i}")
+    following = buffer.read(records[-1].seq + 1)
+    assert [record.seq for record in following] == [7, 8, 9, 10]
+    assert all(record.message == f"line {record.seq}" for record in following)
@@ -0,0 +1,163 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from Tool.MTKWorker import MTKWorker, _LineWriter
+
+worker_module = sys.modules["Tool.MTKWorker"]
+
+# mtk.py本身每条命令都重新执行, 预先导入的是它依赖的包(mtkclient), 用stublib代替
+STUBLIB = '''
+import os
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "imports.log"), "a") as f:
+    f.write("imported\\n")
+'''
+
+STUB = '''
+import os
+import sys
+import time
+
+import stublib
+
+def main(args):
+    if args[0] == "echo":
+        print(" ".join(args[1:]))
+        sys.stdout.write("50%\\r100%\\r")
+        sys.stdout.flush()
+        print()
+    elif args[0] == "exit":
+        sys.exit(int(args[1]))
+    elif args[0] == "raise":
+        raise RuntimeError("boom")
+    elif args[0] == "pid":
+        print(os.getpid())
+    elif args[0] == "sleep":
+        time.sleep(30)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+'''
+
+
+def written(*chunks, flush=False):
+    messages = []
+    writer = _LineWriter(messages.append, 7)
+    for chunk in chunks:
+        writer.write(chunk)
+    if flush:
+        writer.flush()
+    assert all(message["id"] == 7 and message["type"] == "out" for message in messages)
+    return [message["line"] for message in messages]
+
+
+def test_line_writer_splits_lines():
+    assert written("a\nb", "c\n\n") == ["a", "bc", ""]
+    assert written("a\r\nb\r\n") == ["a", "b"]
+    assert written("tail") == []
+    assert written("tail", flush=True) == ["tail"]
+
+
+def test_line_writer_progress_carriage_returns():
+    # 进度条用\r覆盖同一行, 每次更新都作为一行发送, 结尾的换行不再产生空行
+    assert written("10%\r20%\r", "30%\r", "\n", "done\n") == ["10%", "20%", "30%", "done"]
+    assert written("10%\r20%\r30%\ndone\n") == ["10%", "20%", "30%", "done"]
+    # flush后已发出的部分行不会因为随后的换行重复或多出空行
+    messages = []
+    writer = _LineWriter(messages.append, 1)
+    writer.write("Progress: 5")
+    writer.flush()
+    writer.write("\n")
+    writer.write("\n")
+    assert [message["line"] for message in messages] == ["Progress: 5", ""]
+
+
+@pytest.fixture
+def stub(tmp_path):
+    path = tmp_path / "mtk.py"
+    path.write_text(STUB, encoding="utf-8")
+    (tmp_path / "stublib.py").write_text(STUBLIB, encoding="utf-8")
+    return path
+
+
+def imports(stub):
+    return (stub.parent / "imports.log").read_text().count("imported")
+
+
+def run(worker, *args, timeout=None):
+    lines = []
+    return worker.run(list(args), on_output=lines.append, timeout=timeout), lines
+
+
+def test_protocol_run_done_exit(stub):
+    process = subprocess.Popen([sys.executable, "-u", worker_module.__file__, str(stub)],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        assert json.loads(process.stdout.readline()) == {"type": "ready", "error": None}
+        process.stdin.write(b'{"id": 5, "cmd": "run", "args": ["echo", "hi"]}\n')
+        process.stdin.flush()
+        messages = []
+        while not messages or messages[-1]["type"] != "done":
+            messages.append(json.loads(process.stdout.readline()))
+        assert messages == [{"id": 5, "type": "out", "line": line} for line in ("hi", "50%", "100%")] + \
+            [{"id": 5, "type": "done", "code": 0}]
+        process.stdin.write(b'{"cmd": "exit"}\n')
+        process.stdin.flush()
+        assert process.wait(10) == 0
+        assert process.stdout.read() == b""
+    finally:
+        process.kill()
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        process.stdin.close()
+
+
+def test_persistent_worker_imports_once(stub):
+    worker = MTKWorker(str(stub))
+    try:
+        assert run(worker, "echo", "a", "b") == (0, ["a b", "50%", "100%"])
+        assert run(worker, "exit", "3") == (3, [])
+        code, lines = run(worker, "raise")
+        assert code == 1 and lines[-1] == "RuntimeError: boom"
+        first, second = run(worker, "pid"), run(worker, "pid")
+        assert first == second and worker.running
+        assert imports(stub) == 1
+    finally:
+        worker.close()
+    assert not worker.running
+
+
+def test_timeout_restarts_worker(stub):
+    worker = MTKWorker(str(stub))
+    try:
+        code, pid = run(worker, "pid")
+        assert run(worker, "sleep", timeout=0.5) == (None, [])
+        assert worker.last_error == "命令超时 (0.5秒)" and not worker.running
+        # 下一条命令重新启动进程
+        code, new_pid = run(worker, "pid")
+        assert code == 0 and new_pid != pid
+        assert worker.last_error is None
+    finally:
+        worker.close()
+
+
+def test_non_persistent_worker_exits_after_command(stub):
+    worker = MTKWorker(str(stub), persistent=False)
+    assert run(worker, "exit", "2") == (2, [])
+    assert not worker.running
+    assert run(worker, "echo", "x")[0] == 0
+    assert imports(stub) == 2
+
+
+def test_import_failure_reported(tmp_path):
+    broken = tmp_path / "mtk.py"
+    broken.write_text("raise ImportError('no usb backend')\n", encoding="utf-8")
+    worker = MTKWorker(str(broken))
+    assert worker.run(["detect"]) is None
+    assert worker.last_error == "导入MTKClient失败: ImportError: no usb backend"
+    assert not worker.running
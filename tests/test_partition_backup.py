@@ -0,0 +1,95 @@
+import hashlib
+import os
+
+import pytest
+
+from Tool.FastbootDevice import FastbootDevice, FastbootError
+from Tool.PartitionBackup import PartitionBackup
+
+from test_fastboot_device import FakeTransport
+
+CHUNK = 4096
+DATA = bytes(range(256)) * 40  # 10240 字节: 两个完整块和一个不完整块
+
+
+class BackupTransport(FakeTransport):
+    """在FakeTransport上增加partition-size, 并可以让第fail_fetch次fetch只返回一半数据后断开"""
+
+    def __init__(self, data=DATA, fail_fetch=None):
+        super().__init__(max_download_size=CHUNK, partitions={"boot": data})
+        self.fail_fetch = fail_fetch
+        self.fetches = []
+
+    def write(self, data) -> int:
+        command = bytes(data).decode("utf-8", errors="ignore")
+        if command.startswith("getvar:partition-size:"):
+            self.commands.append(command)
+            self.responses.append(b"OKAY0x%x" % len(self.partitions[command.rsplit(":", 1)[1]]))
+            return len(data)
+        if command.startswith("fetch:"):
+            self.fetches.append(int(command.split(":")[2], 16))
+            if len(self.fetches) == self.fail_fetch:
+                partition, offset, size = command[len("fetch:"):].split(":")
+                chunk = self.partitions[partition][int(offset, 16):int(offset, 16) + int(size, 16)]
+                self.responses += [b"DATA%08x" % len(chunk), chunk[:len(chunk) // 2]]
+                return len(data)
+        return super().write(data)
+
+    def read(self, size: int, timeout: float = None) -> bytes:
+        return super().read(size, timeout) if self.responses else b""
+
+
+def backup(path, transport):
+    return PartitionBackup(FastbootDevice(transport)).backup("boot", str(path))
+
+
+def test_fetches_in_chunks_and_writes_checksum(tmp_path):
+    path = tmp_path / "boot.img"
+    transport = BackupTransport()
+    checksum = backup(path, transport)
+    assert transport.fetches == [0, CHUNK, 2 * CHUNK]
+    assert path.read_bytes() == DATA
+    assert checksum == hashlib.sha256(DATA).hexdigest()
+    assert (tmp_path / "boot.img.sha256").read_text() == f"{checksum}  boot.img\n"
+
+
+def test_resumes_after_failure_in_the_middle_of_a_chunk(tmp_path):
+    path = tmp_path / "boot.img"
+    with pytest.raises(FastbootError):
+        backup(path, BackupTransport(fail_fetch=2))
+
+    transport = BackupTransport()
+    backup_job = PartitionBackup(FastbootDevice(transport))
+    checksum = backup_job.backup("boot", str(path))
+    # 只重新读取中断的块及之后的部分
+    assert backup_job.resumed_from == CHUNK
+    assert transport.fetches == [CHUNK, 2 * CHUNK]
+    assert path.read_bytes() == DATA
+    assert checksum == hashlib.sha256(DATA).hexdigest()
+
+
+def test_resume_reverifies_prefix(tmp_path):
+    path = tmp_path / "boot.img"
+    with pytest.raises(FastbootError):
+        backup(path, BackupTransport(fail_fetch=3))
+    with open(path, "r+b") as f:
+        f.seek(CHUNK + 10)
+        f.write(b"\xff")
+
+    transport = BackupTransport()
+    checksum = backup(path, transport)
+    # 第二块与日志不符, 从第二块重新读取
+    assert transport.fetches == [CHUNK, 2 * CHUNK]
+    assert path.read_bytes() == DATA
+    assert checksum == hashlib.sha256(DATA).hexdigest()
+
+
+def test_completed_backup_is_not_read_again(tmp_path):
+    path = tmp_path / "boot.img"
+    first = backup(path, BackupTransport())
+
+    transport = BackupTransport()
+    assert backup(path, transport) == first
+    assert transport.fetches == []
+    assert path.read_bytes() == DATA
+    assert os.path.exists(PartitionBackup.journal_path(str(path)))
@@ -0,0 +1,104 @@
+import sys
+import threading
+import time
+
+from Tool.ProcessRunner import OutputStream, ProcessRunner
+
+runner_module = sys.modules["Tool.ProcessRunner"]
+
+
+def python(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
+
+
+def test_partial_lines_joined_across_reads():
+    lines = []
+    stream = OutputStream(lines.append)
+    text = "第一行\r\n第二行\nlast".encode("utf-8")
+    # 逐字节输入, 多字节字符和换行符都被拆开
+    for index in range(len(text)):
+        stream.feed(text[index:index + 1])
+    assert lines == ["第一行", "第二行"]
+    stream.close()
+    assert lines == ["第一行", "第二行", "last"]
+    assert stream.text() == "第一行\n第二行\nlast\n"
+
+
+def test_overlong_line_split(monkeypatch):
+    monkeypatch.setattr(runner_module, "MAX_LINE", 10)
+    lines = []
+    stream = OutputStream(lines.append)
+    stream.feed(b"x" * 25)
+    stream.feed(b"yy\nz")
+    stream.close()
+    # 没有换行符的输出超过MAX_LINE后强制成行, 不会无限增长
+    assert lines == ["x" * 25, "yy", "z"]
+    stream = OutputStream(lines.append)
+    lines.clear()
+    for _ in range(5):
+        stream.feed(b"abcd")
+    assert lines == ["abcd" * 3]
+
+
+def test_ring_buffer_keeps_latest_lines():
+    stream = OutputStream(max_chars=20)
+    for index in range(10):
+        stream.feed(f"line{index}\n".encode())
+    assert stream.truncated
+    assert stream.dropped_lines == 7
+    assert stream.text() == "... (已省略前 7 行输出)\nline7\nline8\nline9\n"
+
+    # 单独一行超过上限时仍然保留这一行
+    stream = OutputStream(max_chars=5)
+    stream.feed(b"short\n" + b"a" * 50 + b"\n")
+    assert stream.text() == "... (已省略前 1 行输出)\n" + "a" * 50 + "\n"
+
+
+def test_run_streams_both_pipes():
+    stdout, stderr = [], []
+    result = ProcessRunner().run(
+        python("import sys\nprint('out1'); print('err1', file=sys.stderr)\nsys.stdout.write('tail'); sys.exit(3)"),
+        on_stdout=stdout.append, on_stderr=stderr.append)
+    assert stdout == ["out1", "tail"] and stderr == ["err1"]
+    assert result["output"] == "out1\ntail\n" and result["error"] == "err1\n"
+    assert result["returncode"] == 3
+    assert not result["success"] and not result["cancelled"] and not result["timed_out"]
+
+
+def test_run_truncates_large_output():
+    result = ProcessRunner(max_output=1000).run(python("for i in range(10000): print(i)"))
+    assert result["success"] and result["truncated"]
+    assert result["output"].endswith("9998\n9999\n")
+    assert len(result["output"]) < 1100
+
+
+def test_run_timeout():
+    start = time.monotonic()
+    result = ProcessRunner().run(python("import time; print('started', flush=True); time.sleep(30)"), timeout=0.5)
+    assert time.monotonic() - start < 10
+    assert result["timed_out"] and not result["success"] and not result["cancelled"]
+    assert result["output"] == "started\n"
+    assert result["error"].endswith("命令超时 (0.5秒)")
+
+
+def test_cancel_from_other_thread():
+    runner = ProcessRunner()
+
+    def cancel_when_started(line):
+        threading.Thread(target=runner.cancel).start()
+
+    start = time.monotonic()
+    result = runner.run(python("import time; print('started', flush=True); time.sleep(30)"),
+                        on_stdout=cancel_when_started)
+    assert time.monotonic() - start < 10
+    assert result["cancelled"] and not result["success"] and not result["timed_out"]
+    assert result["error"] == "已取消"
+
+
+def test_cancel_before_run_does_not_start(tmp_path):
+    runner = ProcessRunner()
+    runner.cancel()
+    marker = tmp_path / "started"
+    result = runner.run(python(f"open({str(marker)!r}, 'w').close()"))
+    assert result["cancelled"] and result["returncode"] is None
+    assert not marker.exists()
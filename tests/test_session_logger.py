@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+from SessionLogger import SessionLogger
+
+
+def test_only_files_of_exited_sessions_are_compressed(tmp_path):
+    running = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    try:
+        live = tmp_path / f"session-20260101-000000-{running.pid}-001.jsonl"
+        stale = tmp_path / f"session-20260101-000000-{exited.pid}-001.jsonl"
+        live.write_text('{"msg": "live"}\n')
+        stale.write_text('{"msg": "stale"}\n')
+
+        logger = SessionLogger(str(tmp_path))
+        logger.start()
+        logger.log("hello")
+        logger.close()
+
+        assert live.exists()
+        assert not stale.exists() and os.path.exists(str(stale) + ".gz")
+        assert os.path.exists(logger.current_path + ".gz")
+    finally:
+        running.kill()
+        running.wait()
@@ -0,0 +1,75 @@
+import os
+import random
+import sys
+
+import pytest
+
+from Tool.SparseImage import CHUNK_TYPE_DONT_CARE, CHUNK_TYPE_FILL, CHUNK_TYPE_RAW, SparseImage
+
+sparse_module = sys.modules["Tool.SparseImage"]
+
+BS = 4096
+
+
+def reference_chunks(data: bytes, zero_as_dont_care: bool = False) -> list[tuple]:
+    """逐块分类并合并相邻的同类块, 作为批量分类结果的对照"""
+    chunks = []
+    for index in range(0, (len(data) + BS - 1) // BS):
+        block = data[index * BS:(index + 1) * BS]
+        block += bytes(BS - len(block))
+        if block == bytes(BS):
+            kind = (CHUNK_TYPE_DONT_CARE, None) if zero_as_dont_care else (CHUNK_TYPE_FILL, b"\0\0\0\0")
+        elif block[:4] * (BS // 4) == block:
+            kind = (CHUNK_TYPE_FILL, block[:4])
+        else:
+            kind = (CHUNK_TYPE_RAW, None)
+        if chunks and chunks[-1][0] == kind:
+            chunks[-1][2] += 1
+        else:
+            chunks.append([kind, index, 1])
+    return [(kind[0], start, blocks, kind[1]) for kind, start, blocks in chunks]
+
+
+def scanned_chunks(data: bytes, zero_as_dont_care: bool = False) -> list[tuple]:
+    image = SparseImage(data, zero_as_dont_care=zero_as_dont_care)
+    for chunk in image.chunks:
+        if chunk.chunk_type == CHUNK_TYPE_RAW:
+            # RAW数据不复制, 偏移必须指向源数据中对应的块
+            assert chunk.offset == chunk.start * BS
+    result = [(chunk.chunk_type, chunk.start, chunk.blocks, chunk.fill if chunk.chunk_type == CHUNK_TYPE_FILL else None)
+              for chunk in image.chunks]
+    image.release()
+    return result
+
+
+def mixed_image(seed: int, blocks: int, tail: bytes = b"") -> bytes:
+    rng = random.Random(seed)
+    kinds = [
+        lambda: bytes(BS),
+        lambda: b"\x5a\xa5\x00\xff" * (BS // 4),
+        lambda: b"\x01\x02\x03\x04" * (BS // 4),
+        lambda: rng.randbytes(BS),
+        # 首尾4字节相同但中间不同, 不是填充块
+        lambda: b"\x07\x07\x07\x07" * 100 + b"\x08" + b"\x07" * (BS - 401),
+    ]
+    return b"".join(rng.choice(kinds)() for _ in range(blocks)) + tail
+
+
+@pytest.fixture
+def small_window(monkeypatch):
+    monkeypatch.setattr(sparse_module, "SCAN_WINDOW", 4 * BS)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("tail", [b"", b"\x11" * 100, bytes(100)])
+def test_scan_matches_per_block_classification(small_window, seed, tail):
+    data = mixed_image(seed, 64, tail)
+    assert scanned_chunks(data) == reference_chunks(data)
+    assert scanned_chunks(data, True) == reference_chunks(data, True)
+
+
+def test_scan_whole_windows(small_window):
+    data = bytes(8 * BS) + os.urandom(8 * BS) + b"\xee" * (8 * BS) + bytes(3 * BS)
+    assert scanned_chunks(data) == reference_chunks(data) == [
+        (CHUNK_TYPE_FILL, 0, 8, b"\0\0\0\0"), (CHUNK_TYPE_RAW, 8, 8, None),
+        (CHUNK_TYPE_FILL, 16, 8, b"\xee" * 4), (CHUNK_TYPE_FILL, 24, 3, b"\0\0\0\0")]
@@ -0,0 +1,11 @@
+from StartupProfiler import StartupProfiler
+
+
+def test_format_report_before_and_after_finish(tmp_path):
+    profiler = StartupProfiler(str(tmp_path / "profile.json"))
+    profiler.mark("构建界面")
+    assert "可交互" not in profiler.format_report()
+    assert "None" not in profiler.format_report()
+    profiler.finish()
+    assert profiler.format_report().startswith("启动耗时: 可交互 ")
+    assert profiler.report()["interactive_ms"] is not None
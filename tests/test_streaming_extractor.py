@@ -0,0 +1,50 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from StreamingExtractor import (StreamingExtractor, ZipStreamExtractor, locate_central_directory,
+                                parse_central_directory)
+
+
+def make_zip(tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("images/boot.img", os.urandom(200000))
+        archive.writestr("images/system.img", os.urandom(300000))
+    data = buffer.getvalue()
+    path = tmp_path / "rom.zip"
+    path.write_bytes(data)
+    cd_offset, cd_size = locate_central_directory(data, 0)
+    return data, parse_central_directory(data[cd_offset:cd_offset + cd_size]), cd_offset
+
+
+def feed(extractor, data, segments):
+    extractor.start()
+    for start in segments:
+        extractor.feed(start, data[start:start + 65536])
+    return extractor.finish()
+
+
+def test_base_class_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        StreamingExtractor(str(tmp_path), str(tmp_path / "a.zip"))
+
+
+def test_zip_out_of_order_segments(tmp_path):
+    data, entries, cd_offset = make_zip(tmp_path)
+    extractor = ZipStreamExtractor(str(tmp_path / "out"), str(tmp_path / "rom.zip"), entries, cd_offset)
+    assert feed(extractor, data, reversed(range(0, len(data), 65536)))
+    with zipfile.ZipFile(tmp_path / "rom.zip") as archive:
+        assert (tmp_path / "out/images/system.img").read_bytes() == archive.read("images/system.img")
+
+
+def test_zip_pending_data_is_capped(tmp_path):
+    data, entries, cd_offset = make_zip(tmp_path)
+    extractor = ZipStreamExtractor(str(tmp_path / "out"), str(tmp_path / "rom.zip"), entries, cd_offset)
+    extractor.MEMORY_LIMIT = 128 * 1024
+    # 超出上限时放弃流式解压, 由调用方在下载完成后再解压
+    assert not feed(extractor, data, reversed(range(0, len(data), 65536)))
+    assert "乱序数据过多" in extractor.error
+    assert not os.path.exists(tmp_path / "out/images/system.img.part")
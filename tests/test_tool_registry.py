@@ -0,0 +1,95 @@
+import json
+import os
+
+import pytest
+
+from Tool import ToolRegistry
+from Tool.BaseTool import Tool
+
+
+class FakeTool(Tool):
+    """只有一个可执行文件的工具, 记录is_available探测过的路径"""
+
+    name = "fake"
+    runnable_files = {"linux": ["fake-tool"]}
+    mirrors = []
+
+    def __init__(self, path=None, common=()):
+        super().__init__(path)
+        self.common = list(common)
+        self.probed = []
+
+    @property
+    def common_paths(self):
+        return {"linux": self.common}
+
+    def is_available(self, system=None, path=None):
+        self.probed.append(path)
+        return os.path.isfile(os.path.join(path, "fake-tool"))
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    paths = []
+    for name in ("bundled", "system"):
+        (tmp_path / name).mkdir()
+        paths.append(str(tmp_path / name))
+    (tmp_path / "system" / "fake-tool").write_bytes(b"v1")
+    return paths
+
+
+def test_warm_start_does_not_probe(tmp_path, dirs):
+    index = str(tmp_path / "cache" / "tools.json")
+    bundled, system = dirs
+    tool = FakeTool(bundled, [system])
+    assert ToolRegistry(index).resolve(tool, "linux")
+    assert tool.get_path() == system and tool.probed
+
+    # 重新启动: 新的索引实例和工具对象, 文件未变化时只比较stat结果
+    tool = FakeTool(bundled, [system])
+    assert ToolRegistry(index).resolve(tool, "linux")
+    assert tool.get_path() == system
+    assert tool.probed == []
+
+
+def test_changed_fingerprint_probes_again(tmp_path, dirs):
+    index = str(tmp_path / "tools.json")
+    bundled, system = dirs
+    assert ToolRegistry(index).resolve(FakeTool(bundled, [system]), "linux")
+
+    # 工具被更新后索引项失效, 重新探测并记录新的文件信息
+    with open(os.path.join(system, "fake-tool"), "wb") as f:
+        f.write(b"version 2")
+    tool = FakeTool(bundled, [system])
+    assert ToolRegistry(index).resolve(tool, "linux")
+    assert tool.probed
+    with open(index, encoding="utf-8") as f:
+        (entry,) = json.load(f)["tools"].values()
+    assert list(entry["files"].values())[0][2] == len(b"version 2")
+
+
+def test_moved_tool_switches_path(tmp_path, dirs):
+    index = str(tmp_path / "tools.json")
+    bundled, system = dirs
+    assert ToolRegistry(index).resolve(FakeTool(bundled, [system]), "linux")
+
+    os.replace(os.path.join(system, "fake-tool"), os.path.join(bundled, "fake-tool"))
+    tool = FakeTool(system, [bundled])
+    assert ToolRegistry(index).resolve(tool, "linux")
+    assert tool.get_path() == bundled
+
+    # 工具被删除后解析失败并删除索引项
+    os.remove(os.path.join(bundled, "fake-tool"))
+    registry = ToolRegistry(index)
+    assert not registry.resolve(FakeTool(bundled, [system]), "linux")
+    assert registry._load()["tools"] == {}
+
+
+def test_invalidate_forces_probe(tmp_path, dirs):
+    registry = ToolRegistry(str(tmp_path / "tools.json"))
+    bundled, system = dirs
+    assert registry.resolve(FakeTool(bundled, [system]), "linux")
+    registry.invalidate(FakeTool(), "linux")
+    tool = FakeTool(bundled, [system])
+    assert ToolRegistry(registry.index_path).resolve(tool, "linux")
+    assert tool.probed
@@ -1,97 +1,92 @@
+import json
 import os
-import re
+import site
 import subprocess
 import sys
+import threading
+from importlib import metadata
 
-import pkg_resources
+REQUIRED_PACKAGES = ['PySide6', 'pyserial', 'requests', 'pyusb', 'libusb1', 'protobuf', 'colorama', 'pycryptodomex',
+                     'fusepy']
+STARTUP_PACKAGES = ['PySide6']  # 界面启动前必须安装的依赖, 其余依赖在后台安装
+DEPENDENCY_STAMP = os.path.join("cache", "dependencies.json")
 
 
-def backup_partition_fastboot(self, partition, output_path):
-    """使用Fastboot备份分区 - 修复分区大小解析问题"""
-    if not self.fastboot_path:
-        self.last_error = "Fastboot工具未找到"
-        return False
+def _dependency_stamp_key() -> dict:
+    """依赖检查的缓存键: 解释器路径/版本和各site-packages目录的修改时间, 安装或卸载包都会改变目录修改时间"""
+    site_dirs = list(site.getsitepackages()) if hasattr(site, "getsitepackages") else []
+    if site.ENABLE_USER_SITE:
+        site_dirs.append(site.getusersitepackages())
+    mtimes = {}
+    for directory in site_dirs:
+        try:
+            mtimes[directory] = os.stat(directory).st_mtime_ns
+        except OSError:
+            pass
+    return {"executable": sys.executable, "version": sys.version, "packages": REQUIRED_PACKAGES,
+            "site_packages": mtimes}
+
 
+def _dependencies_verified(key: dict) -> bool:
     try:
-        # 获取分区大小 - 使用更健壮的方法
-        result = subprocess.run([self.fastboot_path, "getvar", "all"],
-                                capture_output=True, text=True, encoding='utf-8', errors='ignore',
-                                timeout=60)
-
-        if result.returncode != 0:
-            # 如果获取全部信息失败，尝试直接获取分区大小
-            result = subprocess.run([self.fastboot_path, "getvar", f"partition-size:{partition}"],
-                                    capture_output=True, text=True, encoding='utf-8', errors='ignore',
-                                    timeout=60)
-            if result.returncode != 0:
-                self.last_error = f"无法获取分区大小: {result.stderr or '未知错误'}"
-                return False
-
-            # 解析分区大小
-            size_line = [line for line in result.stdout.splitlines() if "partition-size" in line]
-            if not size_line:
-                self.last_error = "无法解析分区大小"
-                return False
-
-            size_str = size_line[0].split(":")[1].strip()
-        else:
-            # 从全部信息中解析分区大小
-            pattern = re.compile(rf"partition-size:{partition}:\s*(\d+)")
-            match = pattern.search(result.stdout)
-            if not match:
-                self.last_error = f"在输出中找不到分区大小: {partition}"
-                return False
-
-            size_str = match.group(1)
-
-        # 检查大小是否有效
-        if not size_str.isdigit():
-            # 尝试十六进制转换
-            try:
-                partition_size = int(size_str, 16)
-            except:
-                self.last_error = f"无效的分区大小: {size_str}"
-                return False
-        else:
-            partition_size = int(size_str)
-
-        # 备份分区
-        self.last_error = f"开始备份 {partition} 分区 (大小: {partition_size} 字节)..."
-        with open(output_path, 'wb') as f:
-            result = subprocess.run([self.fastboot_path, "fetch", f"{partition}"],
-                                    stdout=f, stderr=subprocess.PIPE,
-                                    timeout=300)
-
-        if result.returncode == 0:
-            actual_size = os.path.getsize(output_path)
-            if actual_size == partition_size:
-                return True
-            else:
-                self.last_error = f"备份文件大小不匹配: 预期 {partition_size} 字节, 实际 {actual_size} 字节"
-                return False
-        else:
-            self.last_error = result.stderr.decode('utf-8', 'ignore') if result.stderr else "未知错误"
-            return False
-    except Exception as e:
-        self.last_error = str(e)
+        with open(DEPENDENCY_STAMP, 'r', encoding='utf-8') as f:
+            return json.load(f) == key
+    except (OSError, ValueError):
         return False
 
 
-def install_python_dependencies():
-    """检测并安装必要的Python依赖"""
-    required = ['PySide6', 'pyserial', 'requests', 'pyusb', 'libusb1', 'protobuf', 'colorama', 'pycryptodomex', 'fusepy']
-    missing = []
+def _write_dependency_stamp():
+    try:
+        os.makedirs(os.path.dirname(DEPENDENCY_STAMP), exist_ok=True)
+        with open(DEPENDENCY_STAMP, 'w', encoding='utf-8') as f:
+            json.dump(_dependency_stamp_key(), f)
+    except OSError:
+        pass
+
 
-    for package in required:
+def find_missing_dependencies(packages: list[str] = None) -> list[str]:
+    """通过importlib.metadata查找未安装的依赖, 不导入包本身"""
+    missing = []
+    for package in packages or REQUIRED_PACKAGES:
         try:
-            pkg_resources.require(package)
-        except:
+            metadata.version(package)
+        except metadata.PackageNotFoundError:
             missing.append(package)
+    return missing
+
+
+def _pip_install(packages: list[str]):
+    for package in packages:
+        try:
+            subprocess.check_call([sys.executable, '-m', 'pip', 'install', package])
+        except Exception:
+            pass
+
+
+def install_python_dependencies():
+    """检测并安装必要的Python依赖; 上次检查通过且环境未变化时直接跳过, 返回后台安装线程或None"""
+    if _dependencies_verified(_dependency_stamp_key()):
+        return None
+
+    missing = find_missing_dependencies()
+    if not missing:
+        _write_dependency_stamp()
+        return None
+
+    # 缺少界面库时无法启动, 只能先安装
+    _pip_install([package for package in missing if package in STARTUP_PACKAGES])
+    background = [package for package in missing if package not in STARTUP_PACKAGES]
+    if not background:
+        if not find_missing_dependencies():
+            _write_dependency_stamp()
+        return None
+
+    def install():
+        _pip_install(background)
+        if not find_missing_dependencies():
+            _write_dependency_stamp()
 
-    if missing:
-        import subprocess
-        for package in missing:
-            try:
-                subprocess.check_call([sys.executable, '-m', 'pip', 'install', package])
-            except:
-                pass
\ No newline at end of file
+    # 非守护线程, 关闭窗口后也等待pip安装完成, 避免留下安装一半的包
+    thread = threading.Thread(target=install, daemon=False)
+    thread.start()
+    return thread